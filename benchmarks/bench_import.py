@@ -0,0 +1,65 @@
+# Copyright (C) 2017 O.S. Systems Software LTDA.
+# SPDX-License-Identifier: GPL-2.0
+
+"""Measures how long uhu modules take to be imported.
+
+Build scripts may call uhu command line utility hundreds of times, so
+its startup must only load what each command uses. Each module is
+imported in a new interpreter, which also reports the heavy
+dependencies loaded by it. uhu.cli is expected to be imported within
+CLI_IMPORT_BUDGET.
+
+Usage: PYTHONPATH=. python benchmarks/bench_import.py [repeat]
+"""
+
+import json
+import statistics
+import subprocess
+import sys
+
+
+MODULES = ['uhu.cli', 'uhu.core', 'uhu.repl', 'uhu.updatehub.engine']
+
+# Maximum time, in seconds, to import command line utility. Without
+# deferred imports it takes many times more than this.
+CLI_IMPORT_BUDGET = 0.25
+
+HEAVY_DEPENDENCIES = [
+    'Cryptodome', 'humanize', 'libarchive', 'pkgschema', 'prompt_toolkit',
+    'requests',
+]
+
+SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import {}
+elapsed = time.perf_counter() - start
+print(json.dumps([elapsed, sorted(sys.modules)]))
+'''
+
+
+def measure(module):
+    """Returns the import time and the loaded modules of module."""
+    output = subprocess.check_output(
+        [sys.executable, '-c', SCRIPT.format(module)])
+    elapsed, modules = json.loads(output.decode())
+    return elapsed, modules
+
+
+def main(repeat=10):
+    for module in MODULES:
+        times = []
+        for _ in range(repeat):
+            elapsed, modules = measure(module)
+            times.append(elapsed)
+        loaded = [dep for dep in HEAVY_DEPENDENCIES if dep in modules]
+        median = statistics.median(times)
+        print('{:<22} {:7.1f} ms  {}'.format(
+            module, median * 1000, ', '.join(loaded)))
+        if module == 'uhu.cli' and median > CLI_IMPORT_BUDGET:
+            print('uhu.cli exceeds its {:.0f} ms budget'.format(
+                CLI_IMPORT_BUDGET * 1000))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
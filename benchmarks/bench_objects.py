@@ -0,0 +1,73 @@
+# Copyright (C) 2017 O.S. Systems Software LTDA.
+# SPDX-License-Identifier: GPL-2.0
+
+"""Measures memory and iteration cost of packages with many objects.
+
+A package with many small copy objects (like the ones of generated
+packages) is loaded from a dump, created object by object, and then
+iterated as done by push and show commands.
+
+Usage: PYTHONPATH=. python benchmarks/bench_objects.py [objects] [sets]
+"""
+
+import gc
+import sys
+import time
+import tracemalloc
+
+from uhu.core.objects import ObjectsManager
+
+
+def create_dump(n_objects, n_sets):
+    return {ObjectsManager.metadata: [[{
+        'mode': 'copy',
+        'filename': 'rootfs/usr/share/file-{:06d}'.format(index),
+        'target-type': 'device',
+        'target': '/dev/sda{}'.format(set_index + 1),
+        'target-path': '/usr/share/file-{:06d}'.format(index),
+        'filesystem': 'ext4',
+        'mount-options': 'rw',
+    } for index in range(n_objects)] for set_index in range(n_sets)]}
+
+
+def timed(func, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def main(n_objects=5000, n_sets=2):
+    dump = create_dump(n_objects, n_sets)
+    gc.collect()
+    tracemalloc.start()
+    manager = ObjectsManager(dump=dump)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # Tracing memory slows loading down, so it is timed apart
+    load = timed(lambda: ObjectsManager(dump=dump))
+
+    def iterate_sets():
+        for set_index in range(n_sets):
+            for _ in manager[set_index]:
+                pass
+
+    def create():
+        created = ObjectsManager(n_sets)
+        for obj in reversed(dump[ObjectsManager.metadata][0]):
+            created.create(obj)
+
+    print('{} objects in {} sets'.format(n_objects, n_sets))
+    print('{:<14} {:9.1f} MiB'.format('memory', memory / 1024 / 1024))
+    print('{:<14} {:9.3f} s'.format('load', load))
+    print('{:<14} {:9.3f} s'.format('create', timed(create)))
+    print('{:<14} {:9.3f} ms'.format(
+        'all', timed(manager.all, 100) * 1000))
+    print('{:<14} {:9.3f} ms'.format(
+        'sets', timed(iterate_sets, 100) * 1000))
+    print('{:<14} {:9.3f} ms'.format(
+        'to_template', timed(manager.to_template, 5) * 1000))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
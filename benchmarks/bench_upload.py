@@ -0,0 +1,91 @@
+# Copyright (C) 2017 O.S. Systems Software LTDA.
+# SPDX-License-Identifier: GPL-2.0
+
+"""Compares object uploads sent by requests and by sendfile.
+
+A local storage is started in another process, so only the client
+side is measured: wall time and CPU time (user + system) spent by this
+process to upload the same object a few times. Uploads are measured
+with and without ETag verification, as storage replies the MD5 of the
+object as ETag only to "/verified" URLs.
+
+Usage: PYTHONPATH=. python benchmarks/bench_upload.py [MiB] [uploads]
+"""
+
+import hashlib
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from uhu.updatehub.api import ObjectUploadResult, dummy_object_upload
+from uhu.updatehub.http import create_session
+from uhu.utils import UPLOAD_SENDFILE_VAR
+
+
+class StorageHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_PUT(self):  # pylint: disable=invalid-name
+        remaining = int(self.headers.get('Content-Length', 0))
+        md5 = hashlib.md5()
+        while remaining > 0:
+            chunk = self.rfile.read(min(remaining, 1024 * 1024))
+            md5.update(chunk)
+            remaining -= len(chunk)
+        self.send_response(200)
+        if self.path == '/verified':
+            self.send_header('ETag', '"{}"'.format(md5.hexdigest()))
+        self.send_header('Content-Length', 0)
+        self.end_headers()
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def serve(port):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StorageHandler)
+    port.put(server.server_address[1])
+    server.serve_forever()
+
+
+def measure(url, filename, uploads):
+    session = create_session()
+    wall, cpu = time.perf_counter(), time.process_time()
+    for _ in range(uploads):
+        result = dummy_object_upload(filename, url, session=session)
+        if result != ObjectUploadResult.SUCCESS:
+            raise RuntimeError('Upload failed.')
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    session.close()
+    return wall, cpu
+
+
+def main(size=256, uploads=5):
+    port = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(port,), daemon=True)
+    server.start()
+    url = 'http://127.0.0.1:{}'.format(port.get())
+    with tempfile.NamedTemporaryFile() as fp:
+        fp.write(os.urandom(size * 1024 * 1024))
+        fp.flush()
+        print('{} uploads of {} MiB'.format(uploads, size))
+        for path in ('/obj', '/verified'):
+            for name, sendfile in (('requests', 'off'), ('sendfile', 'on')):
+                os.environ[UPLOAD_SENDFILE_VAR] = sendfile
+                wall, cpu = measure(url + path, fp.name, uploads)
+                print('{:<10} {:<10} wall {:7.3f}s  cpu {:7.3f}s  '
+                      '{:8.1f} MiB/s'.format(
+                          name, path, wall, cpu, size * uploads / wall))
+    server.terminate()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,50 @@
+# Copyright (C) 2017 O.S. Systems Software LTDA.
+# SPDX-License-Identifier: GPL-2.0
+
+"""Measures how long objects take to be validated when created.
+
+Every object of a package is validated when the package is loaded,
+so this is most of the cost of loading large packages.
+
+Usage: PYTHONPATH=. python benchmarks/bench_validation.py [repeat]
+"""
+
+import sys
+import timeit
+
+from uhu.core.object import Object
+
+
+OPTIONS = {
+    'copy': {
+        'filename': 'rootfs/usr/share/file',
+        'target-type': 'device',
+        'target': '/dev/sda1',
+        'target-path': '/usr/share/file',
+        'filesystem': 'ext4',
+    },
+    'raw': {
+        'filename': 'boot.img',
+        'target-type': 'device',
+        'target': '/dev/sda',
+        'install-if-different': {'version': '1.0', 'pattern': 'u-boot'},
+    },
+    'flash': {
+        'filename': 'u-boot.bin',
+        'target-type': 'mtdname',
+        'target': 'u-boot',
+    },
+}
+
+
+def main(repeat=5000):
+    for mode, options in sorted(OPTIONS.items()):
+        options = dict(options, mode=mode)
+        elapsed = min(timeit.repeat(
+            lambda: Object(options), number=repeat, repeat=3))
+        print('{:<8} {:8.1f} us/object'.format(
+            mode, elapsed / repeat * 1000000))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -3,15 +3,18 @@
 
 import json
 import os
+import shutil
+import tempfile
 import unittest
 from unittest.mock import Mock, patch
 
 from click.testing import CliRunner
 
 from uhu.cli.package import (
-    add_object_command, edit_object_command, remove_object_command,
-    archive_command, export_command, show_command, set_version_command,
-    status_command, metadata_command, push_command)
+    add_object_command, diff_command, edit_object_command,
+    import_objects_command, remove_object_command, archive_command,
+    export_command, show_command, set_version_command, status_command,
+    metadata_command, push_command, push_many_command)
 from uhu.cli.utils import open_package
 from uhu.core.package import Package
 from uhu.core.utils import dump_package, load_package
@@ -220,6 +223,112 @@ class AddObjectCommandTestCase(PackageTestCase):
         self.assertEqual(result.exit_code, 0)
 
 
+class BulkAddObjectsTestCase(PackageTestCase):
+
+    def setUp(self):
+        super().setUp()
+        dump_package(Package().to_template(), self.pkg_fn)
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        os.makedirs(os.path.join(self.dir, 'etc', 'init.d'))
+        for name in ('etc/init.d/app', 'etc/app.conf', 'app'):
+            with open(os.path.join(self.dir, name), 'w') as fp:
+                fp.write(name)
+
+    def filenames(self):
+        package = load_package(self.pkg_fn)
+        return [(os.path.relpath(obj.filename, self.dir), obj['target-path'])
+                for obj in package.objects[0]]
+
+    def test_can_add_directory_recursively(self):
+        cmd = [self.dir, '--recursive', '-m', 'copy', '-tt', 'device',
+               '-t', '/dev/sda', '-fs', 'ext4', '--target-path-prefix', '/']
+        result = self.runner.invoke(add_object_command, cmd)
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(self.filenames(), [
+            ('app', '/app'),
+            ('etc/app.conf', '/etc/app.conf'),
+            ('etc/init.d/app', '/etc/init.d/app'),
+        ])
+
+    def test_recursive_add_adds_nothing_if_an_object_is_invalid(self):
+        # Without target path, copy objects are invalid
+        cmd = [self.dir, '--recursive', '-m', 'copy', '-tt', 'device',
+               '-t', '/dev/sda', '-fs', 'ext4']
+        result = self.runner.invoke(add_object_command, cmd)
+        self.assertEqual(result.exit_code, 2)
+        self.assertEqual(self.filenames(), [])
+
+    def test_target_path_prefix_requires_recursive_add(self):
+        cmd = [self.obj_fn, '-m', 'raw', '-t', '/dev/sda', '-tt', 'device',
+               '--target-path-prefix', '/']
+        result = self.runner.invoke(add_object_command, cmd)
+        self.assertEqual(result.exit_code, 2)
+
+    def test_can_import_json_manifest(self):
+        manifest = [{
+            'filename': os.path.join(self.dir, name),
+            'mode': 'copy',
+            'target-type': 'device',
+            'target': ['/dev/sda1', '/dev/sda2'],
+            'target-path': '/' + name,
+            'filesystem': 'ext4',
+        } for name in ('etc/app.conf', 'app')]
+        fn = self.create_file(json.dumps(manifest))
+        result = self.runner.invoke(import_objects_command, [fn])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(self.filenames(), [
+            ('app', '/app'), ('etc/app.conf', '/etc/app.conf')])
+        package = load_package(self.pkg_fn)
+        self.assertEqual(package.objects.get(0, 1)['target'], '/dev/sda2')
+
+    def test_can_import_csv_manifest(self):
+        rows = ['filename,mode,target-type,target,count']
+        for name in ('app', 'etc/app.conf'):
+            rows.append('{},raw,device,/dev/sda,'.format(
+                os.path.join(self.dir, name)))
+        fn = self.create_file('\n'.join(rows), name=self.dir + '/m.csv')
+        result = self.runner.invoke(import_objects_command, [fn])
+        self.assertEqual(result.exit_code, 0, result.output)
+        package = load_package(self.pkg_fn)
+        self.assertEqual(len(package.objects[0]), 2)
+        self.assertEqual(package.objects.get(0, 0)['count'], -1)
+
+    def test_import_fails_with_invalid_manifest(self):
+        for manifest in ('{}', '[{"mode": "raw"}]', 'invalid'):
+            fn = self.create_file(manifest)
+            result = self.runner.invoke(import_objects_command, [fn])
+            self.assertEqual(result.exit_code, 2)
+        self.assertEqual(self.filenames(), [])
+
+
+class DiffCommandTestCase(PackageTestCase):
+
+    def dump(self, version):
+        package = Package(version=version, product=self.product)
+        package.objects.create(self.obj_options)
+        fn = self.create_file()
+        dump_package(package.to_template(), fn)
+        return fn
+
+    def test_can_diff_packages(self):
+        old, new = self.dump('1.0'), self.dump('2.0')
+        result = self.runner.invoke(diff_command, [old, new])
+        self.assertEqual(result.exit_code, 1)
+        self.assertEqual(result.output, 'version: 1.0 -> 2.0\n')
+
+    def test_diff_of_same_packages_succeeds(self):
+        old, new = self.dump('1.0'), self.dump('1.0')
+        result = self.runner.invoke(diff_command, [old, new, '--content'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(result.output, 'No differences.\n')
+
+    def test_diff_fails_with_invalid_package(self):
+        invalid = self.create_file('invalid')
+        result = self.runner.invoke(diff_command, [self.dump('1.0'), invalid])
+        self.assertEqual(result.exit_code, 2)
+
+
 class ArchiveCommand(PackageTestCase):
 
     def setUp(self):
@@ -247,6 +356,25 @@ class ArchiveCommand(PackageTestCase):
         self.assertEqual(output, 'spam')
         self.assertTrue(force)
 
+    @patch('uhu.cli.package.dump_package_archive')
+    @patch('uhu.cli.package.dump_package_directory')
+    def test_can_archive_as_directory(self, directory, archive):
+        result = self.runner.invoke(
+            archive_command, ['--format', 'dir', '--output', 'spam'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertFalse(archive.called)
+        self.assertEqual(directory.call_count, 1)
+        _, output, force = directory.call_args[0]
+        self.assertEqual(output, 'spam')
+        self.assertFalse(force)
+
+    @patch('uhu.cli.package.dump_package_archive')
+    def test_cannot_archive_zip_into_directory(self, mock):
+        result = self.runner.invoke(
+            archive_command, ['--force', '--output', os.getcwd()])
+        self.assertEqual(result.exit_code, 2)
+        self.assertFalse(mock.called)
+
     @patch('uhu.cli.package.dump_package_archive', side_effect=FileExistsError)
     def test_archive_command_returns_1_if_archive_exists(self, mock):
         result = self.runner.invoke(archive_command)
@@ -410,18 +538,42 @@ class PackageStatusCommandTestCase(unittest.TestCase):
         self.runner = CliRunner()
 
     @patch('uhu.cli.package.open_package')
-    @patch('uhu.cli.package.get_package_status', return_value='Done')
+    @patch('uhu.updatehub.api.get_package_status', return_value='Done')
     def test_returns_0_if_successful(self, mock, open_package):
         open_package.return_value.__enter__.return_value = Mock()
         result = self.runner.invoke(status_command, args=['pkg_uid'])
         self.assertEqual(result.exit_code, 0)
 
     @patch('uhu.cli.package.open_package')
-    @patch('uhu.cli.package.get_package_status', side_effect=UpdateHubError)
+    @patch('uhu.updatehub.api.get_package_status', side_effect=UpdateHubError)
     def test_returns_2_if_fail(self, mock, open_package):
         result = self.runner.invoke(status_command, args=['pkg_uid'])
         self.assertEqual(result.exit_code, 2)
 
+    @patch('uhu.updatehub.engine.wait_for_packages_status')
+    def test_can_wait_for_package_status(self, mock):
+        mock.return_value = {'pkg_uid': 'done'}
+        result = self.runner.invoke(
+            status_command, args=['pkg_uid', '--wait', '--timeout', '10'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(result.output, 'done\n')
+        mock.assert_called_once_with(
+            ('pkg_uid',), ('done', 'error'), timeout=10)
+
+    @patch('uhu.updatehub.engine.wait_for_packages_status')
+    def test_can_wait_for_many_packages(self, mock):
+        mock.return_value = {'uid1': 'done', 'uid2': 'error'}
+        result = self.runner.invoke(status_command, args=[
+            'uid1', 'uid2', '--wait', '--until', 'done', '--until', 'error'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(result.output, 'uid1: done\nuid2: error\n')
+
+    @patch('uhu.updatehub.engine.wait_for_packages_status',
+           side_effect=UpdateHubError)
+    def test_returns_2_if_wait_times_out(self, mock):
+        result = self.runner.invoke(status_command, args=['uid1', '--wait'])
+        self.assertEqual(result.exit_code, 2)
+
 
 class UtilsTestCase(FileFixtureMixin, EnvironmentFixtureMixin, UHUTestCase):
 
@@ -458,6 +610,38 @@ class MetadataTestCase(PackageTestCase):
         self.assertEqual(result.exit_code, 1)
 
 
+class PushManyCommandTestCase(FileFixtureMixin, UHUTestCase):
+
+    def setUp(self):
+        self.runner = CliRunner()
+        self.package_files = [
+            self.create_file(json.dumps(Package(
+                version=version, product='a' * 64).to_template()))
+            for version in ('1.0', '2.0')]
+
+    @patch('uhu.cli.package.push_packages')
+    def test_can_push_many_packages(self, push):
+        result = self.runner.invoke(
+            push_many_command, self.package_files + ['--resume'])
+        self.assertEqual(result.exit_code, 0)
+        packages = push.call_args[0][0]
+        self.assertEqual(
+            [package.version for package in packages], ['1.0', '2.0'])
+        self.assertTrue(push.call_args[1]['resume'])
+
+    @patch('uhu.cli.package.push_packages', side_effect=UpdateHubError)
+    def test_returns_2_when_updatehub_error(self, _):
+        result = self.runner.invoke(push_many_command, self.package_files)
+        self.assertEqual(result.exit_code, 2)
+
+    @patch('uhu.cli.package.push_packages')
+    def test_returns_1_if_invalid_package_file(self, push):
+        package_file = self.create_file('[invalid')
+        result = self.runner.invoke(push_many_command, [package_file])
+        self.assertEqual(result.exit_code, 1)
+        self.assertFalse(push.called)
+
+
 class PushCommandTestCase(unittest.TestCase):
 
     def setUp(self):
@@ -469,6 +653,14 @@ class PushCommandTestCase(unittest.TestCase):
         result = self.runner.invoke(push_command)
         self.assertEqual(result.exit_code, 0)
 
+    @patch('uhu.cli.package.open_package')
+    def test_can_resume_push(self, open_package):
+        package = Mock()
+        open_package.return_value.__enter__.return_value = package
+        result = self.runner.invoke(push_command, ['--resume'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertTrue(package.push.call_args[1]['resume'])
+
     @patch('uhu.cli.package.open_package')
     def test_returns_2_when_updatehub_error(self, open_package):
         package = Mock()
@@ -0,0 +1,56 @@
+# Copyright (C) 2017 O.S. Systems Software LTDA.
+# SPDX-License-Identifier: GPL-2.0
+
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+import uhu
+
+
+# Maximum time, in seconds, to import command line utility. It is
+# several times what it takes (see benchmarks/bench_import.py), so
+# only an import of heavy dependencies on startup makes it fail.
+IMPORT_TIME_BUDGET = 1
+
+# Dependencies that must only be loaded by the commands using them
+DEFERRED_DEPENDENCIES = [
+    'Cryptodome', 'humanize', 'libarchive', 'pkgschema', 'prompt_toolkit',
+    'requests',
+]
+
+SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import uhu.cli
+elapsed = time.perf_counter() - start
+print(json.dumps([elapsed, sorted(sys.modules)]))
+'''
+
+
+def import_cli():
+    """Imports uhu.cli in a new interpreter.
+
+    Returns the import time and the loaded modules.
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.path.dirname(os.path.dirname(uhu.__file__))
+    output = subprocess.check_output([sys.executable, '-c', SCRIPT], env=env)
+    return json.loads(output.decode())
+
+
+class CLIStartupTestCase(unittest.TestCase):
+
+    def test_cli_does_not_load_deferred_dependencies(self):
+        _, modules = import_cli()
+        loaded = [module for module in modules
+                  if module.split('.')[0] in DEFERRED_DEPENDENCIES]
+        self.assertEqual(loaded, [])
+
+    def test_cli_import_time_is_within_budget(self):
+        # The best of a few runs is taken, so a busy machine does not
+        # make it fail.
+        elapsed = min(import_cli()[0] for _ in range(3))
+        self.assertLess(elapsed, IMPORT_TIME_BUDGET)
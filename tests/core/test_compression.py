@@ -168,9 +168,13 @@ class CompressedObjectTestCase(unittest.TestCase):
         self.options['filename'] = os.path.join(
             self.fixtures_dir, 'base.txt.bz2')
         obj = Object(self.options)
-        obj._compressed = True  # it's a compressed file, but not supported
-        obj.compressor = 'gzip'  # and it is a bz2, not a gzip.
-        metadata = obj.to_metadata()  # luckily metadata will ignore all this
+        # it's a compressed file, but not supported and objects have
+        # no room for anything else.
+        with self.assertRaises(AttributeError):
+            obj._compressed = True
+        with self.assertRaises(AttributeError):
+            obj.compressor = 'gzip'  # and it is a bz2, not a gzip.
+        metadata = obj.to_metadata()
         self.assertIsNone(metadata.get('compressed'))
         self.assertIsNone(metadata.get('required-uncompressed-size'))
 
@@ -0,0 +1,128 @@
+# Copyright (C) 2017 O.S. Systems Software LTDA.
+# SPDX-License-Identifier: GPL-2.0
+
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from unittest.mock import patch
+
+from uhu.core.diff import diff_packages
+from uhu.core.package import Package
+from uhu.core.utils import dump_package
+
+from utils import FileFixtureMixin, UHUTestCase
+
+
+class PackageDiffTestCase(FileFixtureMixin, UHUTestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.obj_fn = os.path.join(self.dir, 'object')
+        with open(self.obj_fn, 'wb') as fp:
+            fp.write(b'spam')
+        self.options = {
+            'filename': self.obj_fn,
+            'mode': 'raw',
+            'target-type': 'device',
+            'target': '/dev/sda',
+        }
+
+    def create_package(self, version='1.0'):
+        package = Package(version=version, product='a' * 64)
+        package.objects.create(self.options)
+        return package
+
+    def dump(self, package):
+        fn = self.create_file()
+        dump_package(package.to_template(), fn)
+        return fn
+
+    def archive(self, package):
+        fn = self.create_file()
+        with zipfile.ZipFile(fn, mode='w') as archive:
+            archive.writestr('metadata', json.dumps(package.to_metadata()))
+        return fn
+
+    def test_same_packages_have_no_differences(self):
+        package = self.create_package()
+        old, new = self.dump(package), self.dump(package)
+        with patch('uhu.core._object.BaseObject.load') as load:
+            diff = diff_packages(old, new, content=True)
+        self.assertFalse(diff)
+        self.assertFalse(load.called)
+        self.assertEqual(str(diff), '')
+
+    def test_can_diff_package_files(self):
+        old = self.create_package()
+        old.objects.create(dict(self.options, filename='/removed'))
+        new = self.create_package(version='2.0')
+        new.objects.create(dict(self.options, filename='/added'))
+        obj_index = new.objects.find(self.obj_fn)[0]
+        new.objects.update(obj_index, 'target', '/dev/sdb', set_index=1)
+        new.supported_hardware.add('PowerX')
+        diff = diff_packages(self.dump(old), self.dump(new))
+        self.assertEqual(diff.package, {
+            'version': ('1.0', '2.0'),
+            'supported-hardware': ('any', ['PowerX']),
+        })
+        self.assertEqual(diff.added, [('/added', 'raw')])
+        self.assertEqual(diff.removed, [('/removed', 'raw')])
+        self.assertEqual(diff.changed, {
+            (self.obj_fn, 'raw'): [(1, 'target', '/dev/sda', '/dev/sdb')],
+        })
+        self.assertEqual(str(diff), '\n'.join([
+            'version: 1.0 -> 2.0',
+            "supported-hardware: any -> ['PowerX']",
+            '+ /added [mode: raw]',
+            '- /removed [mode: raw]',
+            '~ {} [mode: raw]'.format(self.obj_fn),
+            '    target (set 1): /dev/sda -> /dev/sdb',
+        ]))
+
+    def test_can_diff_archives(self):
+        old = self.archive(self.create_package())
+        with open(self.obj_fn, 'wb') as fp:
+            fp.write(b'eggs')
+        new = self.archive(self.create_package())
+        diff = diff_packages(old, new)
+        sha256sum = (self.sha256sum(b'spam'), self.sha256sum(b'eggs'))
+        self.assertEqual(diff.changed, {
+            (self.obj_fn, 'raw'): [
+                (0, 'sha256sum') + sha256sum, (1, 'sha256sum') + sha256sum],
+        })
+
+    def test_can_diff_package_file_and_archive(self):
+        package = self.create_package()
+        archive = self.archive(package)
+        package_file = self.dump(package)
+        self.assertFalse(diff_packages(package_file, archive))
+        with open(self.obj_fn, 'wb') as fp:
+            fp.write(b'eggs')
+        self.assertFalse(diff_packages(package_file, archive))
+        diff = diff_packages(archive, package_file, content=True)
+        self.assertEqual(list(diff.changed), [(self.obj_fn, 'raw')])
+
+    def test_files_are_read_once_when_comparing_contents(self):
+        package = self.create_package()
+        archive = self.archive(package)
+        with patch('uhu.core._object.BaseObject._file_key',
+                   return_value='key'), \
+                patch('uhu.core._object.BaseObject.__iter__',
+                      return_value=iter([b'spam'])) as read:
+            diff = diff_packages(self.dump(package), archive, content=True)
+        self.assertFalse(diff)
+        self.assertEqual(read.call_count, 1)
+
+    def test_can_diff_directory_archives(self):
+        directory = os.path.join(self.dir, 'archive')
+        os.mkdir(directory)
+        package = self.create_package()
+        with open(os.path.join(directory, 'metadata'), 'w') as fp:
+            json.dump(package.to_metadata(), fp)
+        package.version = '2.0'
+        diff = diff_packages(directory, self.archive(package))
+        self.assertEqual(diff.package, {'version': ('1.0', '2.0')})
+        self.assertEqual(diff.changed, {})
@@ -3,6 +3,7 @@
 
 import hashlib
 import os
+from unittest.mock import patch
 
 from uhu.core.object import Object
 from uhu.utils import CHUNK_SIZE_VAR
@@ -28,6 +29,19 @@ class ObjectTestCase(EnvironmentFixtureMixin, FileFixtureMixin, UHUTestCase):
         self.assertEqual(obj['target-type'], 'device')
         self.assertEqual(obj['target'], '/dev/sda')
 
+    def test_objects_are_compact(self):
+        obj = Object(self.options)
+        self.assertFalse(hasattr(obj, '__dict__'))
+        # Values shared by many objects are shared strings
+        other = Object({
+            'filename': 'other',
+            'mode': 'raw',
+            'target-type': ''.join(['dev', 'ice']),
+            'target': ''.join(['/dev/', 'sda']),
+        })
+        self.assertIs(obj['target-type'], other['target-type'])
+        self.assertIs(obj['target'], other['target'])
+
     def test_create_object_raises_error_if_unknow_mode(self):
         with self.assertRaises(ValueError):
             Object({'mode': 'unknow'})
@@ -58,15 +72,69 @@ class ObjectTestCase(EnvironmentFixtureMixin, FileFixtureMixin, UHUTestCase):
     def test_can_load_object(self):
         content = b'spam'
         sha256sum = hashlib.sha256(content).hexdigest()
-        md5 = hashlib.md5(content).hexdigest()
         self.options['filename'] = self.create_file(content)
         obj = Object(self.options)
-        self.assertIsNone(obj.md5)
         self.assertIsNone(obj['sha256sum'])
         obj.load()
-        self.assertEqual(obj.md5, md5)
         self.assertEqual(obj['sha256sum'], sha256sum)
 
+    def test_load_reuses_analysis_of_same_file(self):
+        self.options['filename'] = self.create_file(b'spam')
+        analyzed = {}
+        obj = Object(self.options)
+        obj.load(analyzed=analyzed)
+        other = Object(self.options)
+        with patch('uhu.core._object.hashlib.sha256') as sha256:
+            other.load(analyzed=analyzed)
+        self.assertFalse(sha256.called)
+        self.assertEqual(other['sha256sum'], obj['sha256sum'])
+        self.assertEqual(other['size'], 4)
+        self.assertEqual(len(analyzed), 1)
+
+    def test_load_analyzes_file_again_if_it_changes(self):
+        fn = self.create_file(b'spam')
+        self.options['filename'] = fn
+        analyzed = {}
+        Object(self.options).load(analyzed=analyzed)
+        with open(fn, 'wb') as fp:
+            fp.write(b'spam and eggs')
+        obj = Object(self.options)
+        obj.load(analyzed=analyzed)
+        self.assertEqual(
+            obj['sha256sum'], hashlib.sha256(b'spam and eggs').hexdigest())
+
+    def test_load_does_not_compute_md5(self):
+        self.options['filename'] = self.create_file(b'spam')
+        obj = Object(self.options)
+        with patch('uhu.core._object.hashlib.md5') as md5:
+            obj.load()
+        self.assertFalse(md5.called)
+        self.assertIsNone(obj.to_upload()['md5'])
+
+    def test_load_can_compute_md5(self):
+        content = b'spam'
+        self.options['filename'] = self.create_file(content)
+        obj = Object(self.options)
+        obj.load(md5=True)
+        self.assertEqual(
+            obj.to_upload()['md5'], hashlib.md5(content).hexdigest())
+
+    def test_md5_is_computed_for_already_analyzed_file(self):
+        content = b'spam'
+        self.options['filename'] = self.create_file(content)
+        analyzed = {}
+        Object(self.options).load(analyzed=analyzed)
+        obj = Object(self.options)
+        obj.load(analyzed=analyzed, md5=True)
+        self.assertEqual(
+            obj.to_upload()['md5'], hashlib.md5(content).hexdigest())
+        with patch('uhu.core._object.hashlib') as hashlib_mock:
+            obj = Object(self.options)
+            obj.load(analyzed=analyzed, md5=True)
+        self.assertFalse(hashlib_mock.sha256.called)
+        self.assertEqual(
+            obj.to_upload()['md5'], hashlib.md5(content).hexdigest())
+
     def test_can_generate_metadata(self):
         content = b'spam'
         fn = self.create_file(content)
@@ -133,13 +201,11 @@ class ObjectTestCase(EnvironmentFixtureMixin, FileFixtureMixin, UHUTestCase):
         with open(__file__) as fp:
             data = fp.read().encode()
         sha = hashlib.sha256(data).hexdigest()
-        md5 = hashlib.md5(data).hexdigest()
         expected = {
             'filename': __file__,
             'size': os.path.getsize(__file__),
             'sha256sum': sha,
-            'md5': md5,
-            'chunks': 1,
+            'md5': None,  # computed only when needed
         }
         self.assertEqual(obj.to_upload(), expected)
 
@@ -155,3 +221,11 @@ class ObjectTestCase(EnvironmentFixtureMixin, FileFixtureMixin, UHUTestCase):
             obj.update('target-path', '/')  # invalid in raw mode
         with self.assertRaises(ValueError):
             obj['target-path']
+
+    def test_failed_update_does_not_change_object(self):
+        obj = Object(self.options)
+        with self.assertRaises(ValueError):
+            # install-condition-pattern-type requires version-diverges
+            obj.update('install-condition-pattern-type', 'regexp')
+        self.assertIsNone(obj['install-condition-pattern-type'])
+        self.assertEqual(obj['install-condition'], 'always')
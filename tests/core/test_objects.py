@@ -2,11 +2,12 @@
 # SPDX-License-Identifier: GPL-2.0
 
 import os
+import tempfile
 import unittest
 from unittest.mock import Mock, patch
 
 from uhu.core.object import Object
-from uhu.core.objects import ObjectsManager
+from uhu.core.objects import DuplicateObjectEntryError, ObjectsManager
 
 
 def verify_all_modes(fn):
@@ -235,6 +236,44 @@ class ObjectsManagerTestCase(unittest.TestCase):
         manager2.create(self.options)
         self.assertEqual(manager1, manager2)
 
+    def test_comparing_managers_does_not_read_files(self):
+        self.options['filename'] = '/does/not/exist'
+        manager1 = ObjectsManager()
+        manager2 = ObjectsManager()
+        manager1.create(self.options)
+        manager2.create(self.options)
+        self.assertEqual(manager1, manager2)
+        manager2.update(0, 'target', '/dev/sdb', set_index=1)
+        self.assertNotEqual(manager1, manager2)
+        self.assertNotEqual(ObjectsManager(1), ObjectsManager(2))
+
+    def test_managers_are_compared_by_known_sha256sum(self):
+        manager1 = ObjectsManager()
+        manager2 = ObjectsManager()
+        manager1.create(self.options)
+        manager2.create(self.options)
+        manager1.load()
+        self.assertEqual(manager1, manager2)
+        for obj in manager2.all():
+            obj['sha256sum'] = 'other'
+        self.assertNotEqual(manager1, manager2)
+
+    def test_can_compare_managers_by_content(self):
+        with tempfile.NamedTemporaryFile() as fp:
+            fp.write(b'spam')
+            fp.flush()
+            self.options['filename'] = fp.name
+            manager1 = ObjectsManager()
+            manager2 = ObjectsManager()
+            manager1.create(self.options)
+            manager2.create(self.options)
+            manager1.load()
+            fp.write(b'eggs')
+            fp.flush()
+            self.assertTrue(manager1.equals(manager2))
+            self.assertFalse(manager1.equals(manager2, content=True))
+            self.assertEqual(manager2.get(0, 0)['size'], 8)
+
     def test_can_sort_objects(self):
         manager = ObjectsManager()
         names = [str(n) for n in range(9, 0, -1)]
@@ -244,3 +283,90 @@ class ObjectsManagerTestCase(unittest.TestCase):
         observed = [objs[0].filename for objs in manager.objects]
         expected = [str(n) for n in range(1, 10)]
         self.assertEqual(observed, expected)
+
+    def test_sets_are_kept_aligned(self):
+        manager = ObjectsManager(2)
+        for name, target in (('b', '/dev/sdb'), ('a', '/dev/sda')):
+            self.options['filename'] = name
+            self.options['target'] = (target + '1', target + '2')
+            manager.create(self.options)
+        self.assertEqual([obj['target'] for obj in manager[0]],
+                         ['/dev/sda1', '/dev/sdb1'])
+        self.assertEqual([obj['target'] for obj in manager[1]],
+                         ['/dev/sda2', '/dev/sdb2'])
+        manager.remove(0)
+        self.assertEqual([obj.filename for obj in manager.all()], ['b', 'b'])
+        # Returned sets are copies
+        manager[0].clear()
+        self.assertEqual(len(manager[0]), 1)
+
+    def test_create_raises_error_if_object_is_duplicated(self):
+        manager = ObjectsManager()
+        manager.create(self.options)
+        with self.assertRaises(DuplicateObjectEntryError):
+            manager.create(self.options)
+        # The same file in other mode is another object
+        self.options['mode'] = 'flash'
+        manager.create(self.options)
+        manager.remove(0)
+        self.options['mode'] = 'raw'
+        manager.create(self.options)
+        self.assertEqual(len(manager.objects), 2)
+
+    def test_create_returns_sorted_index(self):
+        manager = ObjectsManager()
+        indexes = []
+        for name in ('b', 'd', 'a', 'c'):
+            self.options['filename'] = name
+            indexes.append(manager.create(self.options))
+        self.assertEqual(indexes, [0, 1, 0, 2])
+        self.assertEqual(
+            [obj.filename for obj in manager[0]], ['a', 'b', 'c', 'd'])
+
+    def test_can_find_objects_by_filename(self):
+        manager = ObjectsManager()
+        for name, mode in (('b', 'raw'), ('a', 'raw'), ('b', 'flash')):
+            self.options['filename'] = name
+            self.options['mode'] = mode
+            manager.create(self.options)
+        self.assertEqual(manager.find('a'), [0])
+        self.assertEqual(manager.find('b'), [1, 2])
+        self.assertEqual(manager.find('b', mode='flash'), [2])
+        self.assertEqual(manager.find('c'), [])
+
+    def test_updating_filename_keeps_objects_sorted(self):
+        manager = ObjectsManager()
+        for name in ('a', 'b'):
+            self.options['filename'] = name
+            manager.create(self.options)
+        manager.update(0, 'filename', 'c')
+        self.assertEqual([obj.filename for obj in manager[1]], ['b', 'c'])
+        self.assertEqual(manager.find('c'), [1])
+        self.assertEqual(manager.find('a'), [])
+        # The old filename can be used again
+        self.options['filename'] = 'a'
+        self.assertEqual(manager.create(self.options), 0)
+
+    def test_can_create_many_objects(self):
+        manager = ObjectsManager(2)
+        self.options['filename'] = 'b'
+        manager.create(self.options)
+        options = []
+        for name in ('d', 'a', 'c'):
+            options.append(dict(self.options, filename=name))
+        indexes = manager.create_many(options)
+        self.assertEqual(indexes, [3, 0, 2])
+        self.assertEqual(
+            [obj.filename for obj in manager[1]], ['a', 'b', 'c', 'd'])
+        self.assertEqual(manager.find('c'), [2])
+
+    def test_create_many_creates_nothing_if_an_object_is_invalid(self):
+        manager = ObjectsManager()
+        invalid = dict(self.options, filename='b', target=None)
+        with self.assertRaises(ValueError):
+            manager.create_many([dict(self.options, filename='a'), invalid])
+        duplicated = dict(self.options, filename='a')
+        with self.assertRaises(DuplicateObjectEntryError):
+            manager.create_many([duplicated, duplicated])
+        self.assertEqual(manager.all(), [])
+        self.assertEqual(manager.find('a'), [])
@@ -4,9 +4,11 @@
 import base64
 import hashlib
 import os
+import shutil
+import tempfile
 import zipfile
 import unittest
-from unittest.mock import patch
+from unittest.mock import Mock, call, patch
 
 from Cryptodome.PublicKey import RSA
 from Cryptodome.Hash import SHA256
@@ -15,8 +17,10 @@ from pkgschema import ValidationError
 
 from uhu.core.hardware import SupportedHardwareManager
 from uhu.core.objects import ObjectsManager
-from uhu.core.package import Package
-from uhu.core.utils import dump_package, load_package, dump_package_archive
+from uhu.core.package import Package, push_packages
+from uhu.core.utils import (
+    dump_package, load_package, dump_package_archive, dump_package_directory)
+from uhu.updatehub.api import UpdateHubError
 from uhu.utils import CHUNK_SIZE_VAR, PRIVATE_KEY_FN
 
 from utils import FileFixtureMixin, EnvironmentFixtureMixin, UHUTestCase
@@ -37,6 +41,7 @@ class PackageTestCase(FileFixtureMixin, EnvironmentFixtureMixin, UHUTestCase):
         content = b'spam'
         self.obj_fn = self.create_file(content, name='object')
         self.obj_sha256 = hashlib.sha256(content).hexdigest()
+        self.obj_md5 = hashlib.md5(content).hexdigest()
         self.obj_options = {
             'filename': self.obj_fn,
             'mode': 'raw',
@@ -85,6 +90,37 @@ class PackageConstructorsTestCase(PackageTestCase):
         self.assertEqual(pkg.objects, objects)
 
 
+class PackageComparisonTestCase(PackageTestCase):
+
+    def create_package(self):
+        pkg = Package(version=self.version, product=self.product)
+        pkg.objects.create(self.obj_options)
+        pkg.supported_hardware.add(self.hardware)
+        return pkg
+
+    def test_can_compare_packages(self):
+        pkg1 = self.create_package()
+        pkg2 = self.create_package()
+        self.assertEqual(pkg1, pkg2)
+        pkg2.version = '3.0'
+        self.assertNotEqual(pkg1, pkg2)
+        pkg2.version = self.version
+        pkg2.supported_hardware.add('PowerY')
+        self.assertNotEqual(pkg1, pkg2)
+
+    def test_comparing_packages_does_not_read_objects(self):
+        pkg1 = self.create_package()
+        pkg2 = self.create_package()
+        os.remove(self.obj_fn)
+        self.assertEqual(pkg1, pkg2)
+        with self.assertRaises(FileNotFoundError):
+            pkg1.equals(pkg2, content=True)
+
+    def test_packages_are_not_hashable(self):
+        with self.assertRaises(TypeError):
+            hash(self.create_package())
+
+
 class PackageSerializationTestCase(PackageTestCase):
 
     def create_package(self):
@@ -245,7 +281,7 @@ class PackageSerializationTestCase(PackageTestCase):
             with self.assertRaises(ValueError):
                 dump_package_archive(pkg, output)
 
-    @patch('uhu.core.utils.pkgschema.validate_metadata',
+    @patch('pkgschema.validate_metadata',
            side_effect=ValidationError(None))
     def test_cannot_archive_package_when_metadata_is_invalid(self, mock):
         pkg = self.create_package()[0]
@@ -253,12 +289,128 @@ class PackageSerializationTestCase(PackageTestCase):
         with self.assertRaises(ValueError):
             dump_package_archive(pkg, output, force=True)
 
+    def verify_directory(self, dest):
+        self.assertTrue(os.path.isdir(dest))
+        files = os.listdir(dest)
+        self.assertEqual(len(files), 3)
+        self.assertIn(self.obj_sha256, files)
+        member = os.path.join(dest, self.obj_sha256)
+        self.assertFalse(os.path.islink(member))
+        with open(member, 'rb') as fp:
+            self.assertEqual(fp.read(), b'spam')
+
+        with open(os.path.join(dest, 'metadata')) as fp:
+            message = SHA256.new(fp.read().encode())
+        with open(os.path.join(dest, 'signature')) as fp:
+            signature = base64.b64decode(fp.read())
+        verifier = PKCS1_v1_5.new(self.private_key)
+        self.assertTrue(verifier.verify(message, signature))
+
+    def test_can_archive_package_as_directory(self):
+        pkg = self.create_package()[0]
+        expected = '{}-{}'.format(self.product, self.version)
+        self.addCleanup(shutil.rmtree, expected)
+        observed = dump_package_directory(pkg)
+        self.assertEqual(expected, observed)
+        self.verify_directory(observed)
+
+    @patch('uhu.core.store.reflink', side_effect=OSError)
+    def test_archive_directory_is_not_changed_with_object_file(self, _):
+        pkg = self.create_package()[0]
+        output = dump_package_directory(pkg)
+        self.addCleanup(shutil.rmtree, output)
+        with open(self.obj_fn, 'wb') as fp:
+            fp.write(b'eggs')
+        with open(os.path.join(output, self.obj_sha256), 'rb') as fp:
+            self.assertEqual(fp.read(), b'spam')
+
+    def test_archive_directory_does_not_duplicate_objects(self):
+        pkg = Package(version=self.version, product=self.product)
+        slink = 'updatehub_slink'
+        self.addCleanup(os.remove, slink)
+        os.symlink(self.obj_fn, slink)
+        pkg.objects.create(self.obj_options)
+        self.obj_options['filename'] = slink
+        pkg.objects.create(self.obj_options)
+
+        output = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output)
+        dump_package_directory(pkg, output, force=True)
+        self.verify_directory(output)
+
+    def test_cannot_archive_directory_when_output_exists(self):
+        pkg = self.create_package()[0]
+        output = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output)
+        with self.assertRaises(FileExistsError):
+            dump_package_directory(pkg, output)
+
+    def test_can_overwrite_archive_directory(self):
+        pkg = self.create_package()[0]
+        output = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output)
+        dump_package_directory(pkg, output, force=True)
+        dump_package_directory(pkg, output, force=True)
+        self.verify_directory(output)
+
+    def test_does_not_overwrite_directory_that_is_not_archive(self):
+        pkg = self.create_package()[0]
+        output = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output)
+        with open(os.path.join(output, '.uhu'), 'w') as fp:
+            fp.write('{}')
+        with self.assertRaises(FileExistsError):
+            dump_package_directory(pkg, output, force=True)
+        self.assertEqual(os.listdir(output), ['.uhu'])
+
 
 class PackagePushTestCase(unittest.TestCase):
 
-    @patch('uhu.core.package.push_package', return_value='42')
+    @patch('uhu.updatehub.engine.run_push', return_value='42')
     def test_push_sets_package_uid_when_successful(self, mock):
         pkg = Package()
         uid = pkg.push()
         self.assertEqual(pkg.uid, '42')
         self.assertEqual(uid, '42')
+
+
+class PushManyTestCase(PackageTestCase):
+
+    def create_packages(self):
+        packages = []
+        for version in ('1.0', '2.0'):
+            pkg = Package(version=version, product=self.product)
+            pkg.objects.create(self.obj_options)
+            packages.append(pkg)
+        return packages
+
+    @patch('uhu.updatehub.engine.run_push_many', return_value=['1', '2'])
+    def test_can_push_many_packages(self, push):
+        packages = self.create_packages()
+        self.assertEqual(push_packages(packages), ['1', '2'])
+        self.assertEqual([pkg.uid for pkg in packages], ['1', '2'])
+        pushes = push.call_args[0][0]
+        self.assertEqual([metadata['version'] for metadata, _ in pushes],
+                         ['1.0', '2.0'])
+        for _, objects in pushes:
+            self.assertEqual(objects[0]['sha256sum'], self.obj_sha256)
+            # MD5 is computed while loading, not by the uploader
+            self.assertEqual(objects[0]['md5'], self.obj_md5)
+
+    @patch('uhu.updatehub.engine.run_push_many', return_value=['1', '2'])
+    def test_shared_files_are_read_once(self, _):
+        callback = Mock()
+        push_packages(self.create_packages(), callback)
+        # The file is read (in 2 bytes chunks) only by the first of
+        # the 4 objects (2 packages with 2 installation sets)
+        self.assertEqual(callback.progress.call_args_list, [
+            call(2), call(2), call(4), call(4), call(4)])
+
+    @patch('uhu.updatehub.engine.run_push_many')
+    def test_pushed_packages_get_uid_even_if_others_fail(self, push):
+        push.return_value = [UpdateHubError('failed'), '2']
+        packages = self.create_packages()
+        with self.assertRaises(UpdateHubError):
+            push_packages(packages)
+        self.assertIsNone(packages[0].uid)
+        self.assertEqual(packages[1].uid, '2')
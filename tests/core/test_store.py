@@ -0,0 +1,170 @@
+# Copyright (C) 2017 O.S. Systems Software LTDA.
+# SPDX-License-Identifier: GPL-2.0
+
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from unittest.mock import patch
+
+from uhu.core.object import Object
+from uhu.core.store import ObjectStore, get_object_store, link_file
+from uhu.utils import OBJECT_STORE_VAR
+
+from utils import EnvironmentFixtureMixin, FileFixtureMixin, UHUTestCase
+
+
+class StoreTestCase(EnvironmentFixtureMixin, FileFixtureMixin, UHUTestCase):
+
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.store_dir)
+        self.store = ObjectStore(self.store_dir)
+        self.content = b'spam'
+        self.sha256sum = hashlib.sha256(self.content).hexdigest()
+        self.fn = self.create_file(self.content)
+
+
+class LinkFileTestCase(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.dst = os.path.join(self.store_dir, 'dst')
+
+    def test_link_file_creates_file_with_same_content(self):
+        link_file(self.fn, self.dst)
+        with open(self.dst, 'rb') as fp:
+            self.assertEqual(fp.read(), self.content)
+
+    @patch('uhu.core.store.reflink', side_effect=OSError)
+    def test_link_file_falls_back_to_hard_link(self, mock):
+        self.assertEqual(link_file(self.fn, self.dst), 'hardlink')
+        self.assertTrue(os.path.samefile(self.fn, self.dst))
+
+    @patch('uhu.core.store.os.link', side_effect=OSError)
+    @patch('uhu.core.store.reflink', side_effect=OSError)
+    def test_link_file_falls_back_to_copy(self, *mocks):
+        self.assertEqual(link_file(self.fn, self.dst), 'copy')
+        self.assertFalse(os.path.samefile(self.fn, self.dst))
+        with open(self.dst, 'rb') as fp:
+            self.assertEqual(fp.read(), self.content)
+
+    @patch('uhu.core.store.reflink', side_effect=OSError)
+    def test_link_file_can_skip_hard_link(self, mock):
+        self.assertEqual(link_file(self.fn, self.dst, hardlink=False), 'copy')
+        self.assertFalse(os.path.samefile(self.fn, self.dst))
+
+
+class ObjectStoreTestCase(StoreTestCase):
+
+    def test_can_add_file(self):
+        self.assertNotIn(self.sha256sum, self.store)
+        path = self.store.add(self.fn, self.sha256sum)
+        self.assertIn(self.sha256sum, self.store)
+        self.assertEqual(path, os.path.join(self.store_dir, self.sha256sum))
+        with open(path, 'rb') as fp:
+            self.assertEqual(fp.read(), self.content)
+
+    def test_add_does_not_store_the_same_content_twice(self):
+        path = self.store.add(self.fn, self.sha256sum)
+        other = self.create_file(self.content)
+        with patch('uhu.core.store.link_file') as mock:
+            self.assertEqual(self.store.add(other, self.sha256sum), path)
+        self.assertFalse(mock.called)
+
+    def test_get_returns_None_when_file_is_not_stored(self):
+        self.assertIsNone(self.store.get(self.sha256sum))
+
+    @patch('uhu.core.store.reflink', side_effect=OSError)
+    def test_modified_hard_linked_file_is_stale(self, mock):
+        self.store.add(self.fn, self.sha256sum)
+        self.assertIn(self.sha256sum, self.store)
+        time.sleep(0.01)
+        with open(self.fn, 'wb') as fp:
+            fp.write(b'eggs')
+        self.assertNotIn(self.sha256sum, self.store)
+
+    @patch('uhu.core.store.os.link', side_effect=OSError)
+    @patch('uhu.core.store.reflink', side_effect=OSError)
+    def test_file_that_can_not_be_linked_is_not_stored(self, *mocks):
+        with patch('uhu.core.store.shutil.copyfile') as copy:
+            self.assertIsNone(self.store.add(self.fn, self.sha256sum))
+        self.assertFalse(copy.called)
+        self.assertNotIn(self.sha256sum, self.store)
+        self.assertEqual(
+            self.store.lookup(self.fn)['sha256sum'], self.sha256sum)
+
+    def test_can_remove_file(self):
+        self.store.add(self.fn, self.sha256sum)
+        self.store.remove(self.sha256sum)
+        self.assertNotIn(self.sha256sum, self.store)
+        self.assertEqual(os.listdir(self.store_dir), ['.index'])
+
+    def test_can_lookup_added_file(self):
+        self.assertIsNone(self.store.lookup(self.fn))
+        self.store.add(self.fn, self.sha256sum, md5='md5')
+        self.assertEqual(self.store.lookup(self.fn), {
+            'size': len(self.content),
+            'sha256sum': self.sha256sum,
+            'md5': 'md5',
+        })
+
+    def test_lookup_returns_None_when_file_changed(self):
+        self.store.add(self.fn, self.sha256sum)
+        time.sleep(0.01)
+        with open(self.fn, 'wb') as fp:
+            fp.write(b'eggs')
+        self.assertIsNone(self.store.lookup(self.fn))
+
+    def test_store_is_disabled_by_default(self):
+        self.remove_env_var(OBJECT_STORE_VAR)
+        self.assertIsNone(get_object_store())
+
+    def test_can_enable_store_by_environment_variable(self):
+        self.set_env_var(OBJECT_STORE_VAR, self.store_dir)
+        self.assertEqual(get_object_store().path, self.store_dir)
+
+
+class ObjectStoreLoadTestCase(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.obj = Object({
+            'filename': self.fn,
+            'mode': 'raw',
+            'target-type': 'device',
+            'target': '/dev/sda',
+        })
+
+    def test_object_is_read_from_filename_without_store(self):
+        self.remove_env_var(OBJECT_STORE_VAR)
+        self.obj.load()
+        self.assertEqual(self.obj.source, self.fn)
+        self.assertEqual(self.obj.to_upload()['filename'], self.fn)
+
+    def test_unchanged_file_is_not_hashed_again(self):
+        self.set_env_var(OBJECT_STORE_VAR, self.store_dir)
+        self.obj.load()
+        obj = Object(self.obj.to_template())
+        with patch('uhu.core._object.hashlib') as hashlib_mock:
+            obj.load()
+        self.assertFalse(hashlib_mock.sha256.called)
+        self.assertEqual(obj['sha256sum'], self.sha256sum)
+        self.assertEqual(obj['size'], len(self.content))
+
+    def test_file_is_read_again_when_md5_is_not_indexed(self):
+        self.set_env_var(OBJECT_STORE_VAR, self.store_dir)
+        self.obj.load()
+        obj = Object(self.obj.to_template())
+        obj.load(md5=True)
+        expected = hashlib.md5(self.content).hexdigest()
+        self.assertEqual(obj.to_upload()['md5'], expected)
+        self.assertEqual(get_object_store().lookup(self.fn)['md5'], expected)
+
+    def test_loaded_object_is_read_from_store(self):
+        self.set_env_var(OBJECT_STORE_VAR, self.store_dir)
+        self.obj.load()
+        expected = os.path.join(self.store_dir, self.sha256sum)
+        self.assertEqual(self.obj.source, expected)
+        self.assertEqual(self.obj.to_upload()['filename'], expected)
@@ -1,9 +1,16 @@
 # Copyright (C) 2017 O.S. Systems Software LTDA.
 # SPDX-License-Identifier: GPL-2.0
 
+import re
 import unittest
+from unittest.mock import patch
 
-from uhu.core.validators import validate_option_requirements
+from uhu.core._options import Options
+from uhu.core.install_condition import normalize_install_if_different
+from uhu.core.modes import CopyObject, RawObject
+from uhu.core.validators import (
+    inject_default_values, normalize, validate_option_requirements,
+    validate_options_requirements, validate_required_options)
 
 
 class ValidateOptionRequirementsTestCase(unittest.TestCase):
@@ -11,3 +18,113 @@ class ValidateOptionRequirementsTestCase(unittest.TestCase):
     def test_values_argument_type_checking(self):
         with self.assertRaises(TypeError):
             validate_option_requirements(None, {'key': 'value'})
+
+
+class OptionsValidatorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.values = {
+            'filename': __file__,
+            'target-type': 'device',
+            'target': '/dev/sda',
+            'target-path': '/boot/file',
+            'filesystem': 'ext4',
+        }
+
+    def validate_step_by_step(self, obj_class, values):
+        values = normalize_install_if_different(values)
+        values = normalize(obj_class, values)
+        values = inject_default_values(obj_class, values)
+        validate_required_options(obj_class, values)
+        validate_options_requirements(values)
+        return values
+
+    def assertSameValidation(self, obj_class, values):
+        try:
+            expected = self.validate_step_by_step(obj_class, dict(values))
+        except ValueError as error:
+            with self.assertRaisesRegex(ValueError, re.escape(str(error))):
+                obj_class.validator.validate(values)
+        else:
+            self.assertEqual(obj_class.validator.validate(values), expected)
+
+    def test_validator_is_compiled_for_each_mode(self):
+        self.assertIsNot(CopyObject.validator, RawObject.validator)
+        self.assertEqual(CopyObject.validator.mode, 'copy')
+        self.assertIn(Options.get('format?'), CopyObject.validator.defaults)
+
+    def test_validator_is_the_same_of_step_by_step_validation(self):
+        variations = [
+            {},
+            {'format?': True},
+            {'format?': False, 'format-options': '-F'},
+            {'install-condition': 'version-diverges'},
+            {'install-if-different': {'version': '1', 'pattern': 'u-boot'}},
+            {'install-condition-pattern-type': 'regexp'},
+            {'truncate': True},
+            {'target-path': None},
+            {'unknown': None},
+        ]
+        for obj_class in (CopyObject, RawObject):
+            for variation in variations:
+                values = dict(self.values)
+                values.update(variation)
+                with self.subTest(mode=obj_class.mode, values=variation):
+                    self.assertSameValidation(obj_class, values)
+
+    def test_values_are_not_changed(self):
+        iid = {'version': '1', 'pattern': {'regexp': '.+'}}
+        self.values['install-if-different'] = iid
+        CopyObject.validator.validate(self.values)
+        self.assertIs(self.values['install-if-different'], iid)
+        self.assertEqual(iid, {'version': '1', 'pattern': {'regexp': '.+'}})
+
+    def assertSameChange(self, obj_class, values, key, value):
+        option = Options.get(key)
+        metadata = {opt.metadata: val for opt, val in values.items()}
+        metadata[key] = value
+        try:
+            expected = obj_class.validator.validate(metadata)
+        except ValueError as error:
+            with self.assertRaisesRegex(ValueError, re.escape(str(error))):
+                obj_class.validator.change(values, option, value)
+        else:
+            self.assertEqual(
+                obj_class.validator.change(values, option, value), expected)
+
+    def test_change_is_the_same_of_full_validation(self):
+        changes = [
+            ('format?', True),
+            ('format-options', '-F'),
+            ('filesystem', None),
+            ('install-condition', 'version-diverges'),
+            ('install-condition-pattern-type', 'regexp'),
+            ('install-condition-version', '2.0'),
+            ('target', '/dev/sdb'),
+            ('size', 10),
+            ('truncate', True),
+        ]
+        values = CopyObject.validator.validate(self.values)
+        for key, value in changes:
+            with self.subTest(key=key, value=value):
+                self.assertSameChange(CopyObject, values, key, value)
+        values = CopyObject.validator.change(
+            values, Options.get('install-condition'), 'version-diverges')
+        values = CopyObject.validator.change(
+            values, Options.get('install-condition-pattern-type'), 'regexp')
+        for key, value in changes:
+            with self.subTest(key=key, value=value):
+                self.assertSameChange(CopyObject, values, key, value)
+
+    def test_computed_options_are_not_validated_again(self):
+        validator = CopyObject.validator
+        self.assertIn(Options.get('size'), validator.unconstrained)
+        self.assertIn(Options.get('sha256sum'), validator.unconstrained)
+        self.assertNotIn(
+            Options.get('install-condition-pattern-type'),
+            validator.unconstrained)
+        values = validator.validate(self.values)
+        with patch('uhu.core.validators.check_option_requirements') as check:
+            values = validator.change(values, Options.get('size'), 10)
+        self.assertFalse(check.called)
+        self.assertEqual(values[Options.get('size')], 10)
@@ -0,0 +1,93 @@
+# Copyright (C) 2017 O.S. Systems Software LTDA.
+# SPDX-License-Identifier: GPL-2.0
+
+import io
+import threading
+import unittest
+from contextlib import redirect_stdout
+
+from uhu.ui import BaseCallback, NoTTYCallback
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class RecordingCallback(BaseCallback):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.loaded = []
+        self.uploaded = []
+
+    def load_progress_callback(self, nbytes):
+        self.loaded.append(nbytes)
+
+    def upload_progress_callback(self, nbytes):
+        self.uploaded.append(nbytes)
+
+
+class BaseCallbackTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.callback = RecordingCallback(clock=self.clock)
+
+    def test_progress_updates_are_rate_limited(self):
+        for _ in range(10):
+            self.callback.progress(100)
+        self.assertEqual(self.callback.loaded, [100])
+        self.clock.now += self.callback.refresh_interval
+        self.callback.progress(100)
+        self.assertEqual(self.callback.loaded, [100, 1000])
+        self.assertEqual(self.callback.current, 1100)
+
+    def test_pending_progress_is_flushed_when_stage_ends(self):
+        self.callback.start_objects_load()
+        self.callback.progress(10)
+        self.callback.progress(20)
+        self.callback.finish_objects_load()
+        self.assertEqual(self.callback.loaded, [10, 20])
+        self.callback.start_package_upload([{'size': 30}, {'size': 70}])
+        self.assertEqual(self.callback.max, 100)
+        self.callback.progress(60)
+        self.callback.progress(40)
+        self.callback.finish_package_upload()
+        self.assertEqual(self.callback.uploaded, [60, 40])
+        self.assertEqual(self.callback.current, 100)
+
+    def test_progress_can_be_reported_by_many_threads(self):
+        self.callback.start_package_upload([{'size': 8000}])
+
+        def upload():
+            for _ in range(1000):
+                self.callback.progress(1)
+        threads = [threading.Thread(target=upload) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.callback.finish_package_upload()
+        self.assertEqual(sum(self.callback.uploaded), 8000)
+        self.assertEqual(self.callback.current, 8000)
+
+
+class NoTTYCallbackTestCase(unittest.TestCase):
+
+    def test_prints_upload_percentage_by_bytes(self):
+        clock = FakeClock()
+        callback = NoTTYCallback(clock=clock)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            callback.start_package_upload([{'size': 1000}])
+            callback.progress(120)
+            clock.now += 1
+            callback.progress(130)
+            callback.finish_package_upload()
+        self.assertEqual(
+            output.getvalue(), 'Uploading objects:\n0% 5% 10% 15% 20% 100%\n')
@@ -73,6 +73,28 @@ class UtilsTestCase(EnvironmentFixtureMixin, UHUTestCase):
         observed = utils.get_custom_ca_certs_file()
         self.assertEqual(observed, None)
 
+    def test_get_upload_workers_by_environment_variable(self):
+        os.environ[utils.UPLOAD_WORKERS_VAR] = '8'
+        self.addCleanup(self.remove_env_var, utils.UPLOAD_WORKERS_VAR)
+        self.assertEqual(utils.get_upload_workers(), 8)
+
+    def test_get_default_upload_workers(self):
+        observed = utils.get_upload_workers()
+        self.assertEqual(observed, utils.DEFAULT_UPLOAD_WORKERS)
+
+
+class FileMD5TestCase(FileFixtureMixin, UHUTestCase):
+
+    def test_can_compute_file_md5(self):
+        fn = self.create_file(b'spam and eggs')
+        self.assertEqual(
+            utils.file_md5(fn), hashlib.md5(b'spam and eggs').hexdigest())
+
+    def test_can_compute_md5_of_file_part(self):
+        fn = self.create_file(b'spam and eggs')
+        self.assertEqual(
+            utils.file_md5(fn, 5, 3), hashlib.md5(b'and').hexdigest())
+
 
 class StringUtilsTestCase(unittest.TestCase):
 
@@ -0,0 +1,174 @@
+# Copyright (C) 2017 O.S. Systems Software LTDA.
+# SPDX-License-Identifier: GPL-2.0
+
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from uhu.updatehub.api import ObjectUploadResult, UpdateHubError
+from uhu.updatehub.cache import KnownObjectsCache, get_known_objects_cache
+from uhu.updatehub.engine import PushEngine, run, run_push
+from uhu.utils import (
+    ACCESS_ID_VAR, ACCESS_SECRET_VAR, KNOWN_OBJECTS_CACHE_VAR,
+    KNOWN_OBJECTS_TTL_VAR, PUSH_JOURNAL_DIR_VAR, SERVER_URL_VAR)
+
+from utils import (
+    EnvironmentFixtureMixin, FakeClock, UHUTestCase, UpdateHubStubMixin,
+    fake_metadata_request)
+
+
+class KnownObjectsCacheTestCase(EnvironmentFixtureMixin, UHUTestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, 'cache', 'known.json')
+        self.set_env_var(KNOWN_OBJECTS_CACHE_VAR, self.path)
+        self.set_env_var(SERVER_URL_VAR, 'http://server-a')
+        self.clock = FakeClock(1000)
+
+    def cache(self, ttl=60):
+        return KnownObjectsCache(ttl=ttl, clock=self.clock)
+
+    def test_can_add_and_discard_objects(self):
+        cache = self.cache()
+        self.assertNotIn('sha1', cache)
+        cache.add('sha1', 'sha2')
+        self.assertIn('sha1', cache)
+        cache.discard('sha1')
+        self.assertNotIn('sha1', cache)
+        self.assertIn('sha2', cache)
+
+    def test_objects_expire_after_ttl(self):
+        cache = self.cache()
+        cache.add('sha1')
+        self.clock.now += 59
+        self.assertIn('sha1', cache)
+        self.clock.now += 1
+        self.assertNotIn('sha1', cache)
+
+    def test_can_save_and_load_cache(self):
+        cache = self.cache()
+        cache.add('sha1')
+        cache.save()
+        self.assertIn('sha1', self.cache())
+
+    def test_objects_are_kept_by_server(self):
+        cache = self.cache()
+        cache.add('sha1')
+        cache.save()
+        self.set_env_var(SERVER_URL_VAR, 'http://server-b')
+        cache = self.cache()
+        self.assertNotIn('sha1', cache)
+        cache.add('sha2')
+        cache.save()
+        self.set_env_var(SERVER_URL_VAR, 'http://server-a')
+        self.assertIn('sha1', self.cache())
+
+    def test_expired_objects_are_not_saved(self):
+        cache = self.cache()
+        cache.add('sha1')
+        self.clock.now += 120
+        cache.add('sha2')
+        cache.save()
+        self.clock.now -= 120
+        cache = self.cache()
+        self.assertNotIn('sha1', cache)
+        self.assertIn('sha2', cache)
+
+    def test_corrupted_cache_is_ignored(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'w') as fp:
+            fp.write('[corrupted')
+        cache = self.cache()
+        self.assertNotIn('sha1', cache)
+        cache.add('sha1')
+        cache.save()
+        self.assertIn('sha1', self.cache())
+
+    def test_cache_is_disabled_by_default(self):
+        self.remove_env_var(KNOWN_OBJECTS_TTL_VAR)
+        self.assertIsNone(get_known_objects_cache())
+
+    def test_cache_can_be_disabled(self):
+        self.set_env_var(KNOWN_OBJECTS_TTL_VAR, 0)
+        self.assertIsNone(get_known_objects_cache())
+        self.set_env_var(KNOWN_OBJECTS_TTL_VAR, 10)
+        self.assertEqual(get_known_objects_cache().ttl, 10)
+
+
+class KnownObjectsPushTestCase(
+        UpdateHubStubMixin, EnvironmentFixtureMixin, UHUTestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.set_env_var(
+            KNOWN_OBJECTS_CACHE_VAR, os.path.join(self.dir, 'known.json'))
+        self.set_env_var(KNOWN_OBJECTS_TTL_VAR, 60 * 60 * 24)
+        self.set_env_var(PUSH_JOURNAL_DIR_VAR, self.dir)
+        self.set_env_var(ACCESS_ID_VAR, 'access')
+        self.set_env_var(ACCESS_SECRET_VAR, 'secret')
+        self.start_server()
+        patcher = patch(
+            'uhu.updatehub.engine.metadata_request',
+            side_effect=fake_metadata_request)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch('uhu.updatehub.api.transfer_object')
+        self.transfer = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.transfer.return_value = ObjectUploadResult.SUCCESS
+        self.objects = [{'sha256sum': 'sha1', 'md5': 'md5', 'size': 1},
+                        {'sha256sum': 'sha2', 'md5': 'md5', 'size': 1}]
+
+    def engine(self):
+        engine = PushEngine()
+        self.addCleanup(engine.close)
+        return engine
+
+    def negotiated(self):
+        return [request.path.split('/')[-1]
+                for request in self.server.requests
+                if '/objects/' in request.path]
+
+    def test_cached_objects_are_not_negotiated(self):
+        self.server_stub.known.add('sha2')
+        cache = KnownObjectsCache()
+        cache.add('sha1')
+        plan = run(self.engine().plan_upload(
+            '1234', self.objects, cache=cache))
+        self.assertEqual(self.negotiated(), ['sha2'])
+        self.assertEqual(plan.cached, [self.objects[0]])
+        self.assertEqual(plan.confirmed, [self.objects[1]])
+        self.assertIn('sha2', cache)
+
+    def test_uploaded_objects_are_cached(self):
+        self.transfer.side_effect = lambda obj, *args, **kwargs: (
+            ObjectUploadResult.FAIL if obj['sha256sum'] == 'sha1'
+            else ObjectUploadResult.SUCCESS)
+        cache = KnownObjectsCache()
+        with self.assertRaises(UpdateHubError):
+            run(self.engine().upload_objects(
+                '1234', self.objects, cache=cache))
+        cache = KnownObjectsCache()
+        self.assertNotIn('sha1', cache)
+        self.assertIn('sha2', cache)
+
+    def test_cached_objects_are_sent_again_if_server_refuses_package(self):
+        cache = KnownObjectsCache()
+        cache.add('sha1')
+        cache.save()
+        self.server_stub.finish_statuses = [400, 204]
+        self.assertEqual(run_push({}, self.objects), '1234')
+        self.assertEqual(self.negotiated(), ['sha2', 'sha1'])
+        self.assertEqual(self.transfer.call_count, 2)
+        self.assertEqual(self.server_stub.finished, ['1234', '1234'])
+
+    def test_push_fails_if_server_refuses_package_without_cache(self):
+        self.server_stub.finish_statuses = [400]
+        with self.assertRaises(UpdateHubError):
+            run_push({}, self.objects)
+        self.assertEqual(self.transfer.call_count, 2)
+        self.assertEqual(self.server_stub.finished, ['1234'])
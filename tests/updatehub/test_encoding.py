@@ -0,0 +1,101 @@
+# Copyright (C) 2017 O.S. Systems Software LTDA.
+# SPDX-License-Identifier: GPL-2.0
+
+import gzip
+import unittest
+from unittest.mock import patch
+
+from uhu.updatehub import encoding
+from uhu.updatehub.api import UpdateHubError
+from uhu.updatehub.engine import PushEngine, run
+from uhu.utils import (
+    ACCESS_ID_VAR, ACCESS_SECRET_VAR, METADATA_ENCODING_VAR,
+    RETRY_MAX_ATTEMPTS_VAR)
+
+from utils import EnvironmentFixtureMixin, UHUTestCase, UpdateHubStubMixin
+
+
+class EncodingTestCase(EnvironmentFixtureMixin, UHUTestCase):
+
+    def test_can_encode_with_gzip(self):
+        payload = encoding.encode('{"product": "1234"}', 'gzip')
+        self.assertEqual(gzip.decompress(payload), b'{"product": "1234"}')
+        # The same payload is always encoded the same
+        self.assertEqual(encoding.encode('{"product": "1234"}', 'gzip'),
+                         payload)
+
+    def test_identity_payload_is_not_changed(self):
+        self.assertEqual(encoding.encode('{}', None), b'{}')
+
+    @unittest.skipIf(encoding.zstandard is None, 'zstandard not installed')
+    def test_can_encode_with_zstd(self):
+        payload = encoding.encode('{}', 'zstd')
+        decompressor = encoding.zstandard.ZstdDecompressor()
+        self.assertEqual(decompressor.decompress(payload), b'{}')
+
+    def test_uses_best_encoding_supported_by_server_by_default(self):
+        self.remove_env_var(METADATA_ENCODING_VAR)
+        capabilities = {'metadata-gzip', 'metadata-zstd'}
+        self.assertEqual(encoding.choose_encoding(lambda: capabilities),
+                         encoding.get_available_encodings()[0])
+        self.assertIsNone(encoding.choose_encoding(frozenset))
+
+    def test_can_configure_encoding(self):
+        self.set_env_var(METADATA_ENCODING_VAR, 'gzip')
+        self.assertEqual(encoding.choose_encoding(frozenset), 'gzip')
+        self.set_env_var(METADATA_ENCODING_VAR, 'identity')
+        self.assertIsNone(encoding.choose_encoding(
+            lambda: {'metadata-gzip'}))
+
+    def test_raises_error_if_configured_encoding_is_unavailable(self):
+        self.set_env_var(METADATA_ENCODING_VAR, 'brotli')
+        with self.assertRaises(encoding.EncodingError):
+            encoding.choose_encoding(frozenset)
+
+
+@patch('uhu.updatehub.api.config.get_private_key_path', return_value='fn')
+@patch('uhu.updatehub.api.sign_dict', return_value='signature')
+@patch('uhu.updatehub.api.validate_metadata')
+class EncodedMetadataUploadTestCase(
+        UpdateHubStubMixin, EnvironmentFixtureMixin, UHUTestCase):
+
+    def setUp(self):
+        self.set_env_var(ACCESS_ID_VAR, 'access')
+        self.set_env_var(ACCESS_SECRET_VAR, 'secret')
+        self.remove_env_var(METADATA_ENCODING_VAR)
+        self.metadata = {'product': '1234', 'version': '1.0'}
+
+    def metadata_upload(self):
+        return [request for request in self.server.requests
+                if request.path == '/packages'][-1]
+
+    def upload_metadata(self):
+        engine = PushEngine()
+        self.addCleanup(engine.close)
+        return run(engine.upload_metadata(self.metadata))
+
+    def test_metadata_is_compressed_if_server_supports_it(self, *mocks):
+        self.start_server(metadata_encodings=['gzip'])
+        self.assertEqual(self.upload_metadata(), '1234')
+        self.assertEqual(self.server_stub.metadata, self.metadata)
+        request = self.metadata_upload()
+        self.assertEqual(request.headers['Content-Encoding'], 'gzip')
+        # The encoding is also signed
+        self.assertIn('content-encoding', request.headers['Authorization'])
+
+    def test_metadata_is_not_compressed_by_default(self, *mocks):
+        self.start_server()
+        self.assertEqual(self.upload_metadata(), '1234')
+        self.assertEqual(self.server_stub.metadata, self.metadata)
+        self.assertNotIn('Content-Encoding', self.metadata_upload().headers)
+
+    def test_configured_encoding_is_always_used(self, *mocks):
+        self.set_env_var(RETRY_MAX_ATTEMPTS_VAR, 1)
+        self.set_env_var(METADATA_ENCODING_VAR, 'gzip')
+        self.start_server()
+        self.assertEqual(self.upload_metadata(), '1234')
+        self.assertEqual(
+            self.metadata_upload().headers['Content-Encoding'], 'gzip')
+        self.set_env_var(METADATA_ENCODING_VAR, 'brotli')
+        with self.assertRaises(UpdateHubError):
+            self.upload_metadata()
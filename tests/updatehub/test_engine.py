@@ -0,0 +1,330 @@
+# Copyright (C) 2017 O.S. Systems Software LTDA.
+# SPDX-License-Identifier: GPL-2.0
+
+import asyncio
+import shutil
+import tempfile
+import threading
+from unittest.mock import Mock, patch
+
+from uhu.updatehub import http
+from uhu.updatehub.api import (
+    ObjectUploadError, ObjectUploadResult, UpdateHubError)
+from uhu.updatehub.engine import (
+    PushEngine, ThreadedTransport, Transport, run, run_push, run_push_many,
+    wait_for_package_status)
+from uhu.updatehub.journal import PushJournal
+from uhu.utils import (
+    ACCESS_ID_VAR, ACCESS_SECRET_VAR, KNOWN_OBJECTS_TTL_VAR,
+    PUSH_JOURNAL_DIR_VAR, RETRY_BASE_DELAY_VAR, RETRY_MAX_ATTEMPTS_VAR)
+
+from utils import (
+    EnvironmentFixtureMixin, FileFixtureMixin, UHUTestCase,
+    UpdateHubStubMixin, fake_metadata_request)
+
+
+class RecordingTransport(Transport):
+    """Transport that records requests before sending them."""
+
+    def __init__(self):
+        self.transport = ThreadedTransport()
+        self.requests = []
+
+    async def request(self, method, url, **kwargs):
+        self.requests.append((method, url))
+        return await self.transport.request(method, url, **kwargs)
+
+    def close(self):
+        self.transport.close()
+
+
+class PushEngineTestCase(
+        UpdateHubStubMixin, EnvironmentFixtureMixin, FileFixtureMixin,
+        UHUTestCase):
+
+    def setUp(self):
+        self.set_env_var(ACCESS_ID_VAR, 'access')
+        self.set_env_var(ACCESS_SECRET_VAR, 'secret')
+        self.set_env_var(RETRY_BASE_DELAY_VAR, 0)
+        self.set_env_var(KNOWN_OBJECTS_TTL_VAR, 0)
+        journal_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, journal_dir)
+        self.set_env_var(PUSH_JOURNAL_DIR_VAR, journal_dir)
+        patcher = patch(
+            'uhu.updatehub.engine.metadata_request',
+            side_effect=fake_metadata_request)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.objects = [{
+            'filename': self.create_file(content.encode()),
+            'sha256sum': content,
+            'md5': 'md5',
+            'size': 4,
+        } for content in ('sha1', 'sha2', 'sha3')]
+
+    def engine(self, **kwargs):
+        engine = PushEngine(**kwargs)
+        self.addCleanup(engine.close)
+        return engine
+
+    def test_can_push_package(self):
+        self.start_server(known=['sha2'])
+        callback = Mock()
+        uid = run_push({}, self.objects, callback)
+        self.assertEqual(uid, '1234')
+        self.assertEqual(sorted(self.server_stub.stored), ['sha1', 'sha3'])
+        self.assertEqual(self.server_stub.stored['sha3'], b'sha3')
+        self.assertEqual(self.server_stub.finished, ['1234'])
+        callback.push_finish.assert_called_once_with('1234')
+        # Only objects missing on server are accounted
+        callback.start_package_upload.assert_called_once_with(
+            [self.objects[0], self.objects[2]])
+        progress = sum(call[0][0] for call in callback.progress.call_args_list)
+        self.assertEqual(progress, 8)
+
+    def test_can_push_package_with_batch_negotiation(self):
+        self.start_server(known=['sha2'], batch=True)
+        self.assertEqual(run_push({}, self.objects), '1234')
+        negotiations = [request.path for request in self.server.requests
+                        if '/objects' in request.path]
+        self.assertEqual(negotiations, ['/packages/1234/objects'])
+        self.assertEqual(sorted(self.server_stub.stored), ['sha1', 'sha3'])
+
+    def test_failed_objects_are_reported(self):
+        self.start_server()
+        self.objects[0]['sha256sum'] = 'invalid-sha'
+        with self.assertRaises(ObjectUploadError) as error:
+            run_push({}, self.objects)
+        self.assertEqual(error.exception.failed, [self.objects[0]])
+        self.assertEqual(self.server_stub.finished, [])
+        # Other objects are still uploaded
+        self.assertEqual(sorted(self.server_stub.stored), ['sha2', 'sha3'])
+
+    def test_uploads_largest_objects_first(self):
+        self.start_server(batch=True)
+        for size, obj in enumerate(self.objects):
+            obj['size'] = size
+        run(self.engine(workers=1).upload_objects('1234', self.objects))
+        self.assertEqual(self.server_stub.uploads, ['sha3', 'sha2', 'sha1'])
+
+    def test_expired_upload_urls_are_negotiated_again(self):
+        self.start_server(expired=['sha1'])
+        callback = Mock()
+        self.assertEqual(run_push({}, self.objects, callback), '1234')
+        self.assertEqual(self.server_stub.negotiated.count('sha1'), 2)
+        self.assertEqual(self.server_stub.stored['sha1'], b'sha1')
+        # Progress of the refused upload is rolled back
+        progress = sum(call[0][0] for call in callback.progress.call_args_list)
+        self.assertEqual(progress, 12)
+
+    @patch('uhu.updatehub.api.transfer_object',
+           return_value=ObjectUploadResult.EXPIRED)
+    def test_upload_urls_are_negotiated_again_only_once(self, transfer):
+        self.start_server()
+        with self.assertRaises(ObjectUploadError) as error:
+            run_push({}, self.objects[:1])
+        self.assertEqual(error.exception.failed, self.objects[:1])
+        self.assertEqual(transfer.call_count, 2)
+        self.assertEqual(self.server_stub.negotiated, ['sha1', 'sha1'])
+
+    def test_finish_failure_raises_error(self):
+        self.set_env_var(RETRY_MAX_ATTEMPTS_VAR, 1)
+        self.start_server(finish_statuses=[400])
+        with self.assertRaises(UpdateHubError):
+            run_push({}, self.objects)
+
+    def test_negotiations_and_uploads_are_bounded(self):
+        self.start_server()
+        engine = self.engine(workers=2, negotiations=1)
+        running = []
+        peak = []
+
+        async def negotiate(package_uid, obj):
+            running.append(obj)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.remove(obj)
+            return ('dummy', '{}/storage/{}'.format(
+                self.server.url, obj['sha256sum']))
+        engine.negotiate_object = negotiate
+        run(engine.upload_objects('1234', self.objects))
+        self.assertEqual(max(peak), 1)
+        self.assertEqual(len(self.server_stub.stored), 3)
+
+    def test_cancelling_push_cancels_pending_negotiations(self):
+        self.start_server()
+        engine = self.engine(negotiations=1)
+        cancelled = []
+
+        async def negotiate(package_uid, obj):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(obj)
+                raise
+
+        async def push():
+            task = asyncio.ensure_future(
+                engine.upload_objects('1234', self.objects))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            return task
+        engine.negotiate_object = negotiate
+        task = run(push())
+        self.assertTrue(task.cancelled())
+        self.assertEqual(len(cancelled), 1)
+        self.assertEqual(self.server_stub.stored, {})
+
+    @patch('uhu.updatehub.api.transfer_object')
+    def test_cancelling_push_stops_running_transfers(self, transfer):
+        self.start_server()
+        engine = self.engine(workers=1)
+        started = threading.Event()
+        events = []
+
+        def upload(obj, storage, url, callback=None, cancelled=None,
+                   **kwargs):
+            events.append(cancelled)
+            started.set()
+            cancelled.wait(5)
+            return ObjectUploadResult.FAIL
+        transfer.side_effect = upload
+
+        async def push():
+            task = asyncio.ensure_future(
+                engine.upload_objects('1234', self.objects))
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, started.wait, 5)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        run(push())
+        self.assertEqual(len(events), 1)
+        self.assertTrue(events[0].is_set())
+
+    @patch('uhu.updatehub.engine.close_upload_session')
+    def test_upload_connections_are_closed_when_push_ends(self, close):
+        self.start_server()
+        session = http.create_session()
+        run_push({}, self.objects, session=session)
+        close.assert_called_once_with(session)
+
+    def test_can_use_custom_transport(self):
+        self.start_server()
+        transport = RecordingTransport()
+        engine = self.engine(transport=transport, session=http.get_session())
+        run(engine.push({}, self.objects))
+        methods = [method for method, _ in transport.requests]
+        self.assertEqual(methods.count('POST'), 4)
+        self.assertEqual(methods.count('PUT'), 1)
+        # Storage uploads do not go through the server transport
+        self.assertEqual(len(self.server_stub.stored), 3)
+
+    def test_can_push_many_packages(self):
+        self.start_server(known=['sha3'])
+        callback = Mock()
+        pushes = [({'version': '1'}, self.objects[:2]),
+                  ({'version': '2'}, self.objects[1:])]
+        uids = run_push_many(pushes, callback)
+        self.assertEqual(uids, ['1234', '1234'])
+        self.assertEqual(self.server_stub.finished, ['1234', '1234'])
+        # Objects shared by packages are uploaded once
+        self.assertEqual(sorted(self.server_stub.uploads), ['sha1', 'sha2'])
+        # Objects are accounted once, no matter how many packages have them
+        callback.start_package_upload.assert_called_once_with(
+            self.objects[:2])
+        callback.finish_package_upload.assert_called_once_with()
+        progress = sum(call[0][0] for call in callback.progress.call_args_list)
+        self.assertEqual(progress, 8)
+
+    def test_push_many_progress_leaves_out_skipped_objects(self):
+        self.start_server()
+        metadata = {'version': '1'}
+        journal = PushJournal(metadata)
+        journal.set_package_uid('1234')
+        journal.mark_uploaded('sha1')
+        callback = Mock()
+        pushes = [(metadata, self.objects[:2]),
+                  ({'version': '2'}, self.objects[1:])]
+        run_push_many(pushes, callback, resume=True)
+        callback.start_package_upload.assert_called_once_with(
+            self.objects[1:])
+        progress = sum(call[0][0] for call in callback.progress.call_args_list)
+        self.assertEqual(progress, 8)
+
+    def test_can_push_package_installing_the_same_file_twice(self):
+        self.start_server()
+        content = b'0' * 3 * 1024 * 1024
+        obj = {
+            'filename': self.create_file(content),
+            'sha256sum': self.sha256sum(content),
+            'md5': None,
+            'size': len(content),
+        }
+        objects = [obj, dict(obj)]
+        pushes = [({'version': '1'}, objects), ({'version': '2'}, objects)]
+        engine = self.engine()
+        uid = run(asyncio.wait_for(engine.push({}, objects), 10))
+        self.assertEqual(uid, '1234')
+        uids = run(asyncio.wait_for(engine.push_many(pushes), 10))
+        self.assertEqual(uids, ['1234', '1234'])
+        self.assertEqual(self.server_stub.uploads, [obj['sha256sum']])
+
+    def test_push_many_reports_errors_of_each_package(self):
+        self.start_server()
+        self.objects[0]['sha256sum'] = 'invalid-sha'
+        pushes = [({}, self.objects[:1]), ({}, self.objects[1:])]
+        failed, uid = run_push_many(pushes)
+        self.assertIsInstance(failed, ObjectUploadError)
+        self.assertEqual(uid, '1234')
+
+    def test_can_wait_for_package_status(self):
+        self.start_server(statuses=['processing', 'processing', 'ready'])
+        engine = self.engine()
+        status = run(engine.wait_for_package_status(
+            '1234', ['ready'], interval=0.01))
+        self.assertEqual(status, 'ready')
+        polls = [request for request in self.server.requests
+                 if request.path == '/packages/1234']
+        self.assertEqual(len(polls), 3)
+
+    def test_status_polls_use_etags(self):
+        self.start_server(statuses=['processing', 'processing', 'done'])
+        engine = self.engine()
+        run(engine.wait_for_package_status(
+            '1234', ['done'], interval=0.01))
+        polls = [request for request in self.server.requests
+                 if request.path == '/packages/1234']
+        self.assertNotIn('If-None-Match', polls[0].headers)
+        self.assertEqual(polls[1].headers['If-None-Match'], '"processing"')
+        self.assertEqual(polls[2].headers['If-None-Match'], '"processing"')
+
+    def test_status_is_long_polled_if_server_supports_it(self):
+        self.start_server(statuses=['processing', 'done'], long_poll=True)
+        engine = self.engine()
+        status = run(engine.wait_for_package_status(
+            '1234', ['done'], interval=0.01))
+        self.assertEqual(status, 'done')
+        polls = [request for request in self.server.requests
+                 if request.path == '/packages/1234']
+        self.assertEqual(len(polls), 2)
+        for poll in polls:
+            self.assertEqual(poll.query, {'wait': ['20']})
+
+    def test_can_wait_for_many_packages(self):
+        self.start_server(statuses=['processing', 'done'])
+        engine = self.engine()
+        statuses = run(engine.wait_for_packages_status(
+            ['uid1', 'uid2'], ['done'], interval=0.01))
+        self.assertEqual(statuses, {'uid1': 'done', 'uid2': 'done'})
+
+    def test_can_wait_for_package_status_without_event_loop(self):
+        self.start_server(statuses=['done'])
+        self.assertEqual(wait_for_package_status('1234', ['done']), 'done')
+
+    def test_waiting_for_package_status_can_time_out(self):
+        self.start_server(statuses=['processing'])
+        engine = self.engine()
+        with self.assertRaises(UpdateHubError):
+            run(engine.wait_for_package_status(
+                '1234', ['ready'], timeout=0.05, interval=0.01))
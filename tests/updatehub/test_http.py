@@ -12,7 +12,8 @@ import requests
 from uhu import utils
 from uhu.updatehub._request import Request
 from uhu.updatehub.http import (
-    format_server_error, HTTPError, request, UNKNOWN_ERROR, get, post, put)
+    create_session, format_server_error, get_session, HTTPError, request,
+    UNKNOWN_ERROR, get, post, put)
 from uhu.updatehub.auth import UHV1Signature
 
 
@@ -38,7 +39,7 @@ class RequestTestCase(unittest.TestCase):
         put(url)
         mock.assert_called_with('PUT', url)
 
-    @patch('uhu.updatehub.http.requests.request')
+    @patch('uhu.updatehub.http.requests.Session.request')
     @patch('uhu.updatehub.http.get_custom_ca_certs_file',
            return_value=FAKE_CA_CERTS)
     def test_can_use_custom_ca_certs_in_requests(self, ca_cert_mock, mock):
@@ -143,6 +144,42 @@ class RequestTestCase(unittest.TestCase):
         self.assertTrue(observed)
 
 
+class SessionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        set_credentials()
+
+    def test_session_pools_connections_by_host(self):
+        session = create_session(pool_size=3)
+        for prefix in ['http://', 'https://']:
+            adapter = session.get_adapter(prefix)
+            self.assertEqual(adapter._pool_connections, 3)
+            self.assertEqual(adapter._pool_maxsize, 3)
+
+    @patch.dict(os.environ, {utils.HTTP_POOL_SIZE_VAR: '7'})
+    def test_session_pool_size_by_environment_variable(self):
+        adapter = create_session().get_adapter('https://')
+        self.assertEqual(adapter._pool_maxsize, 7)
+
+    def test_requests_share_the_same_session_by_default(self):
+        self.assertIs(get_session(), get_session())
+
+    @patch('uhu.updatehub.http.get_session')
+    def test_request_uses_shared_session(self, mock):
+        mock.return_value.request.return_value.status_code = 200
+        request('GET', 'http://localhost', sign=False)
+        request('GET', 'http://localhost')
+        self.assertEqual(mock.return_value.request.call_count, 2)
+
+    @patch('uhu.updatehub.http.get_session')
+    def test_request_can_use_custom_session(self, mock):
+        session = Mock()
+        session.request.return_value.status_code = 200
+        request('GET', 'http://localhost', session=session)
+        self.assertEqual(session.request.call_count, 1)
+        self.assertFalse(mock.called)
+
+
 class CanonicalRequestTestCase(unittest.TestCase):
 
     @patch('uhu.updatehub._request.datetime')
@@ -300,8 +337,11 @@ class RequestErrorsTestCase(unittest.TestCase):
 
     def setUp(self):
         set_credentials()
+        # Errors must be raised at first attempt
+        os.environ[utils.RETRY_MAX_ATTEMPTS_VAR] = '1'
+        self.addCleanup(os.environ.pop, utils.RETRY_MAX_ATTEMPTS_VAR)
 
-    @patch('uhu.updatehub.http.requests.request')
+    @patch('uhu.updatehub.http.requests.Session.request')
     def test_returns_response_if_no_error_is_present(self, mock):
         mock.return_value.ok = True
         mock.return_value.status_code = 200
@@ -309,7 +349,7 @@ class RequestErrorsTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTrue(response.ok)
 
-    @patch('uhu.updatehub.http.requests.request')
+    @patch('uhu.updatehub.http.requests.Session.request')
     def test_raises_error_when_invalid_url(self, mock):
         exceptions = [
             requests.exceptions.MissingSchema,
@@ -322,7 +362,7 @@ class RequestErrorsTestCase(unittest.TestCase):
             with self.assertRaises(HTTPError):
                 request('GET', 'foo')
 
-    @patch('uhu.updatehub.http.requests.request')
+    @patch('uhu.updatehub.http.requests.Session.request')
     def test_raises_error_when_server_is_unavailable(self, mock):
         exceptions = [requests.ConnectionError, requests.ConnectTimeout]
         mock.side_effect = exceptions
@@ -330,7 +370,7 @@ class RequestErrorsTestCase(unittest.TestCase):
             with self.assertRaises(HTTPError):
                 request('GET', 'foo')
 
-    @patch('uhu.updatehub.http.requests.request')
+    @patch('uhu.updatehub.http.requests.Session.request')
     def test_raises_error_with_any_other_requests_exception(self, mock):
         exceptions = [
             requests.exceptions.HTTPError,
@@ -357,13 +397,13 @@ class RequestErrorsTestCase(unittest.TestCase):
             with self.assertRaises(HTTPError):
                 request('GET', 'foo')
 
-    @patch('uhu.updatehub.http.requests.request')
+    @patch('uhu.updatehub.http.requests.Session.request')
     def test_raises_error_when_unathorized(self, mock):
         mock.return_value.status_code = 401
         with self.assertRaises(HTTPError):
             request('GET', 'foo')
 
-    @patch('uhu.updatehub.http.requests.request')
+    @patch('uhu.updatehub.http.requests.Session.request')
     def test_raises_error_if_response_is_not_ok(self, mock):
         mock.return_value.ok = False
         with self.assertRaises(HTTPError):
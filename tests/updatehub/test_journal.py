@@ -0,0 +1,146 @@
+# Copyright (C) 2017 O.S. Systems Software LTDA.
+# SPDX-License-Identifier: GPL-2.0
+
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from uhu.updatehub.api import ObjectUploadResult, UpdateHubError
+from uhu.updatehub.engine import run_push
+from uhu.updatehub.journal import PushJournal
+from uhu.utils import (
+    ACCESS_ID_VAR, ACCESS_SECRET_VAR, KNOWN_OBJECTS_TTL_VAR,
+    PUSH_JOURNAL_DIR_VAR)
+
+from utils import (
+    EnvironmentFixtureMixin, UHUTestCase, UpdateHubStubMixin,
+    fake_metadata_request)
+
+
+class PushJournalTestCase(EnvironmentFixtureMixin, UHUTestCase):
+
+    def setUp(self):
+        self.journal_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.journal_dir)
+        self.set_env_var(PUSH_JOURNAL_DIR_VAR, self.journal_dir)
+        self.metadata = {'product': '1', 'version': '2.0'}
+
+    def test_journal_is_saved_within_journal_dir(self):
+        journal = PushJournal(self.metadata)
+        journal.save()
+        self.assertEqual(os.path.dirname(journal.path), self.journal_dir)
+        self.assertTrue(os.path.exists(journal.path))
+
+    def test_can_save_and_load_journal(self):
+        journal = PushJournal(self.metadata)
+        journal.set_package_uid('1234')
+        journal.mark_uploaded('sha256')
+        journal = PushJournal(self.metadata)
+        self.assertTrue(journal.load())
+        self.assertEqual(journal.package_uid, '1234')
+        self.assertTrue(journal.is_uploaded('sha256'))
+        self.assertFalse(journal.is_uploaded('another'))
+
+    def test_uploaded_objects_are_appended_to_log(self):
+        journal = PushJournal(self.metadata)
+        journal.set_package_uid('1234')
+        with patch.object(journal, 'save') as save:
+            for sha256sum in ('sha1', 'sha2', 'sha1'):
+                journal.mark_uploaded(sha256sum)
+        self.assertFalse(save.called)
+        with open(journal.log_path) as fp:
+            self.assertEqual(fp.read(), 'sha1\nsha2\n')
+
+    def test_log_is_compacted_on_load(self):
+        journal = PushJournal(self.metadata)
+        journal.set_package_uid('1234')
+        journal.mark_uploaded('sha1')
+        with open(journal.log_path, 'a') as fp:
+            fp.write('sha2\nincomplete')
+        journal = PushJournal(self.metadata)
+        self.assertTrue(journal.load())
+        self.assertEqual(journal.uploaded, {'sha1', 'sha2'})
+        self.assertFalse(os.path.exists(journal.log_path))
+        journal = PushJournal(self.metadata)
+        self.assertTrue(journal.load())
+        self.assertEqual(journal.uploaded, {'sha1', 'sha2'})
+
+    def test_journal_of_another_package_is_not_loaded(self):
+        PushJournal(self.metadata).set_package_uid('1234')
+        self.metadata['version'] = '3.0'
+        journal = PushJournal(self.metadata)
+        self.assertFalse(journal.load())
+        self.assertIsNone(journal.package_uid)
+
+    def test_load_returns_False_when_journal_is_corrupted(self):
+        journal = PushJournal(self.metadata)
+        with open(journal.path, 'w') as fp:
+            fp.write('{')
+        self.assertFalse(journal.load())
+
+    def test_can_remove_journal(self):
+        journal = PushJournal(self.metadata)
+        journal.save()
+        journal.remove()
+        self.assertFalse(os.path.exists(journal.path))
+        journal.remove()  # must not raise
+
+
+class ResumePushTestCase(UpdateHubStubMixin, PushJournalTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.set_env_var(ACCESS_ID_VAR, 'access')
+        self.set_env_var(ACCESS_SECRET_VAR, 'secret')
+        self.set_env_var(KNOWN_OBJECTS_TTL_VAR, 0)
+        self.start_server()
+        patcher = patch(
+            'uhu.updatehub.engine.metadata_request',
+            side_effect=fake_metadata_request)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch('uhu.updatehub.api.transfer_object')
+        self.transfer = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.transfer.return_value = ObjectUploadResult.SUCCESS
+        self.objects = [
+            {'sha256sum': 'sha1', 'md5': 'md5', 'size': 1},
+            {'sha256sum': 'sha2', 'md5': 'md5', 'size': 2},
+        ]
+
+    def metadata_uploads(self):
+        return [request for request in self.server.requests
+                if request.path == '/packages']
+
+    def test_journal_is_removed_when_push_finishes(self):
+        run_push(self.metadata, self.objects)
+        self.assertEqual(os.listdir(self.journal_dir), [])
+
+    def test_can_resume_interrupted_push(self):
+        self.transfer.side_effect = lambda obj, *args, **kwargs: (
+            ObjectUploadResult.FAIL if obj['sha256sum'] == 'sha1'
+            else ObjectUploadResult.SUCCESS)
+        with self.assertRaises(UpdateHubError):
+            run_push(self.metadata, self.objects)
+        self.assertEqual(len(self.metadata_uploads()), 1)
+        self.assertEqual(self.transfer.call_count, 2)
+        self.assertEqual(self.server_stub.finished, [])
+
+        self.transfer.reset_mock()
+        self.transfer.side_effect = None
+        uid = run_push(self.metadata, self.objects, resume=True)
+        self.assertEqual(uid, '1234')
+        self.assertEqual(len(self.metadata_uploads()), 1)
+        self.assertEqual(self.transfer.call_count, 1)
+        self.assertEqual(
+            self.transfer.call_args[0][0]['sha256sum'], 'sha1')
+        self.assertEqual(self.server_stub.finished, ['1234'])
+
+    def test_push_without_resume_starts_over(self):
+        self.server_stub.finish_statuses = [400, 204]
+        with self.assertRaises(UpdateHubError):
+            run_push(self.metadata, self.objects)
+        run_push(self.metadata, self.objects)
+        self.assertEqual(len(self.metadata_uploads()), 2)
+        self.assertEqual(self.transfer.call_count, 4)
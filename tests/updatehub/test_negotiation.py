@@ -0,0 +1,162 @@
+# Copyright (C) 2017 O.S. Systems Software LTDA.
+# SPDX-License-Identifier: GPL-2.0
+
+import hashlib
+import json
+import threading
+from unittest.mock import patch
+
+from uhu.updatehub.api import (
+    BATCH_CAPABILITY, ObjectUploadError, get_object_md5, transfer_object)
+from uhu.updatehub.engine import PushEngine, run
+from uhu.updatehub.http import create_session
+from uhu.utils import (
+    ACCESS_ID_VAR, ACCESS_SECRET_VAR, RETRY_BASE_DELAY_VAR, file_md5)
+
+from utils import (
+    EnvironmentFixtureMixin, FileFixtureMixin, UHUTestCase,
+    UpdateHubStubMixin)
+
+
+class UpdateHubStubTestCase(
+        UpdateHubStubMixin, EnvironmentFixtureMixin, FileFixtureMixin,
+        UHUTestCase):
+
+    def setUp(self):
+        self.set_env_var(ACCESS_ID_VAR, 'access')
+        self.set_env_var(ACCESS_SECRET_VAR, 'secret')
+        self.set_env_var(RETRY_BASE_DELAY_VAR, 0)
+        self.objects = [{
+            'filename': self.create_file(content.encode()),
+            'sha256sum': content,
+            'md5': 'md5',
+            'size': 4,
+        } for content in ('sha1', 'sha2', 'sha3')]
+        self.session = create_session()
+
+    def engine(self, **kwargs):
+        engine = PushEngine(session=self.session, **kwargs)
+        self.addCleanup(engine.close)
+        return engine
+
+    def upload_objects(self, **kwargs):
+        return run(self.engine(**kwargs).upload_objects('1234', self.objects))
+
+    def negotiation_bodies(self):
+        return [json.loads(request.body.decode())
+                for request in self.negotiations()]
+
+    def negotiations(self):
+        return [request for request in self.server.requests
+                if request.method == 'POST']
+
+
+class NegotiationTestCase(UpdateHubStubTestCase):
+
+    def test_uploads_only_objects_missing_on_server(self):
+        self.start_server(known=['sha2'])
+        self.upload_objects()
+        self.assertEqual(sorted(self.server_stub.stored), ['sha1', 'sha3'])
+        self.assertEqual(self.server_stub.stored['sha1'], b'sha1')
+
+    def test_negotiates_each_object_when_server_has_no_batch(self):
+        self.start_server(known=['sha2'])
+        self.upload_objects()
+        self.assertEqual(len(self.negotiations()), 3)
+
+    def test_negotiates_all_objects_at_once_when_server_has_batch(self):
+        self.start_server(known=['sha2'], batch=True)
+        self.upload_objects()
+        negotiations = self.negotiations()
+        self.assertEqual(len(negotiations), 1)
+        self.assertEqual(negotiations[0].path, '/packages/1234/objects')
+        self.assertEqual(sorted(self.server_stub.stored), ['sha1', 'sha3'])
+
+    def test_failed_negotiations_are_reported(self):
+        self.start_server()
+        self.objects[0]['sha256sum'] = 'invalid-sha'
+        with self.assertRaises(ObjectUploadError) as error:
+            self.upload_objects()
+        self.assertEqual(error.exception.failed, [self.objects[0]])
+        self.assertEqual(len(self.server_stub.stored), 2)
+
+    def test_capabilities_are_fetched_once(self):
+        self.start_server(batch=True)
+        for _ in range(2):
+            capabilities = run(self.engine().get_capabilities())
+            self.assertIn(BATCH_CAPABILITY, capabilities)
+        paths = [request.path for request in self.server.requests]
+        self.assertEqual(paths.count('/capabilities'), 1)
+
+    def test_server_without_capabilities_has_none(self):
+        self.start_server()
+        for _ in range(2):
+            self.assertEqual(
+                run(self.engine().get_capabilities()), frozenset())
+        paths = [request.path for request in self.server.requests]
+        self.assertEqual(paths.count('/capabilities'), 1)
+
+
+class LazyMD5TestCase(UpdateHubStubTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for obj in self.objects:
+            obj['md5'] = None
+
+    def test_can_compute_md5_of_upload_entry(self):
+        obj = self.objects[0]
+        md5 = hashlib.md5(b'sha1').hexdigest()
+        self.assertEqual(get_object_md5(obj), md5)
+        self.assertEqual(obj['md5'], md5)
+
+    def test_md5_is_sent_when_server_requires_it(self):
+        self.start_server(known=['sha2'])
+        self.upload_objects()
+        bodies = self.negotiation_bodies()
+        self.assertEqual(sorted(body['etag'] for body in bodies), sorted(
+            hashlib.md5(obj['sha256sum'].encode()).hexdigest()
+            for obj in self.objects))
+
+    def test_md5_is_not_computed_when_server_defers_it(self):
+        self.start_server(known=['sha2'], deferred_etag=True)
+        with patch('uhu.updatehub.api.get_object_md5') as get_md5:
+            self.upload_objects()
+        self.assertFalse(get_md5.called)
+        for body in self.negotiation_bodies():
+            self.assertNotIn('etag', body)
+        self.assertEqual(sorted(self.server_stub.stored), ['sha1', 'sha3'])
+
+    def test_md5_is_computed_once(self):
+        self.start_server()
+        with patch('uhu.updatehub.api.file_md5',
+                   wraps=file_md5) as md5, \
+                patch('uhu.updatehub.storage.hashlib') as storage_hashlib:
+            self.upload_objects()
+        self.assertEqual(md5.call_count, len(self.objects))
+        self.assertFalse(storage_hashlib.md5.called)
+        for obj in self.objects:
+            self.assertIsNotNone(obj['md5'])
+
+    def test_md5_is_not_computed_by_upload_workers(self):
+        self.start_server()
+        threads = {}
+
+        def record(name, func):
+            def wrapper(*args, **kwargs):
+                threads.setdefault(name, set()).add(threading.get_ident())
+                return func(*args, **kwargs)
+            return wrapper
+        with patch('uhu.updatehub.api.get_object_md5',
+                   side_effect=record('md5', get_object_md5)), \
+                patch('uhu.updatehub.api.transfer_object',
+                      side_effect=record('transfer', transfer_object)):
+            self.upload_objects(workers=1)
+        self.assertFalse(threads['md5'] & threads['transfer'])
+
+    def test_batch_negotiation_can_defer_md5(self):
+        self.start_server(batch=True, deferred_etag=True)
+        self.upload_objects()
+        body = self.negotiation_bodies()[0]
+        self.assertEqual(body['objects'], [
+            {'sha256sum': obj['sha256sum']} for obj in self.objects])
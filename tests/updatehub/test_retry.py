@@ -0,0 +1,168 @@
+# Copyright (C) 2017 O.S. Systems Software LTDA.
+# SPDX-License-Identifier: GPL-2.0
+
+import time
+from unittest.mock import Mock, patch
+
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from uhu.updatehub.http import HTTPError, create_session, request
+from uhu.updatehub.retry import RetryPolicy, get_retry_counters
+from uhu.utils import RETRY_BASE_DELAY_VAR, RETRY_MAX_ATTEMPTS_VAR
+
+from utils import EnvironmentFixtureMixin, StubServer, UHUTestCase
+
+
+def response(status, retry_after=None):
+    headers = {} if retry_after is None else {'Retry-After': retry_after}
+    return Mock(status_code=status, headers=headers)
+
+
+class RetryPolicyTestCase(UHUTestCase):
+
+    def setUp(self):
+        self.policy = RetryPolicy(
+            max_attempts=3, base_delay=1, max_delay=10, deadline=60)
+        self.started = time.monotonic()
+
+    def test_retries_transient_status(self):
+        for status in (429, 500, 502, 503, 504):
+            delay = self.policy.next_delay(
+                1, self.started, response=response(status))
+            self.assertIsNotNone(delay)
+
+    def test_does_not_retry_client_errors(self):
+        for status in (400, 401, 403, 404):
+            delay = self.policy.next_delay(
+                1, self.started, response=response(status))
+            self.assertIsNone(delay)
+
+    def test_retries_connection_errors(self):
+        error = requests.ConnectionError()
+        self.assertIsNotNone(self.policy.next_delay(
+            1, self.started, error=error))
+
+    def test_gives_up_after_max_attempts(self):
+        error = requests.ConnectionError()
+        self.assertIsNotNone(self.policy.next_delay(
+            2, self.started, error=error))
+        self.assertIsNone(self.policy.next_delay(
+            3, self.started, error=error))
+
+    def test_rules_can_set_max_attempts_by_error(self):
+        policy = RetryPolicy(rules={500: 2, requests.Timeout: 5})
+        self.assertEqual(policy.get_max_attempts(status=500), 2)
+        self.assertEqual(policy.get_max_attempts(status=503), 1)
+        self.assertEqual(
+            policy.get_max_attempts(error=requests.ReadTimeout()), 5)
+
+    def test_backoff_is_exponential_with_jitter(self):
+        for attempt, limit in ((1, 1), (2, 2), (3, 4), (6, 10)):
+            for _ in range(20):
+                delay = self.policy.backoff(attempt)
+                self.assertTrue(0 <= delay <= limit)
+
+    def test_backoff_honors_retry_after(self):
+        delay = self.policy.next_delay(
+            1, self.started, response=response(503, '5'))
+        self.assertGreaterEqual(delay, 5)
+
+    def test_retry_after_is_limited_by_max_delay(self):
+        delay = self.policy.next_delay(
+            1, self.started, response=response(503, '3600'))
+        self.assertLessEqual(delay, 10)
+
+    def test_gives_up_when_deadline_would_be_exceeded(self):
+        started = time.monotonic() - 60
+        self.assertIsNone(self.policy.next_delay(
+            1, started, error=requests.ConnectionError()))
+
+    def test_does_not_retry_non_idempotent_requests(self):
+        delay = self.policy.next_delay(
+            1, self.started, response=response(503), idempotent=False)
+        self.assertIsNone(delay)
+        delay = self.policy.next_delay(
+            1, self.started, error=requests.ReadTimeout(), idempotent=False)
+        self.assertIsNone(delay)
+
+    def test_retries_non_idempotent_requests_not_sent(self):
+        delay = self.policy.next_delay(
+            1, self.started, error=requests.ConnectTimeout(),
+            idempotent=False)
+        self.assertIsNotNone(delay)
+
+    def test_retries_non_idempotent_requests_refused(self):
+        refused = MaxRetryError(
+            None, '/', NewConnectionError(None, 'Connection refused'))
+        delay = self.policy.next_delay(
+            1, self.started, error=requests.ConnectionError(refused),
+            idempotent=False)
+        self.assertIsNotNone(delay)
+        # The connection may have been lost after sending the request
+        delay = self.policy.next_delay(
+            1, self.started, error=requests.ConnectionError('reset'),
+            idempotent=False)
+        self.assertIsNone(delay)
+
+    def test_counts_retries_by_reason(self):
+        before = get_retry_counters().get('HTTP 502', 0)
+        self.policy.next_delay(1, self.started, response=response(502))
+        self.assertEqual(get_retry_counters()['HTTP 502'], before + 1)
+
+
+class RequestRetryTestCase(EnvironmentFixtureMixin, UHUTestCase):
+
+    def setUp(self):
+        self.set_env_var(RETRY_BASE_DELAY_VAR, 0)
+        self.set_env_var(RETRY_MAX_ATTEMPTS_VAR, 3)
+        self.replies = []
+        self.server = StubServer(self.reply).start()
+        self.addCleanup(self.server.stop)
+        self.session = create_session()
+
+    def reply(self, _):
+        if self.replies:
+            return self.replies.pop(0), {}, ''
+        return 200, {}, 'ok'
+
+    def request(self, method='GET', **kwargs):
+        return request(method, self.server.url + '/', sign=False,
+                       session=self.session, **kwargs)
+
+    def test_retries_transient_errors(self):
+        self.replies = [503, 502]
+        self.assertEqual(self.request().text, 'ok')
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_raises_error_after_max_attempts(self):
+        self.replies = [503, 503, 503]
+        with self.assertRaises(HTTPError) as cm:
+            self.request()
+        self.assertEqual(cm.exception.response.status_code, 503)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_does_not_retry_non_idempotent_requests(self):
+        self.replies = [503]
+        with self.assertRaises(HTTPError):
+            self.request('POST')
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_can_force_retry_of_non_idempotent_requests(self):
+        self.replies = [503]
+        self.assertEqual(self.request('POST', idempotent=True).text, 'ok')
+
+    def test_notifies_retries_to_callback(self):
+        self.replies = [500]
+        callback = Mock()
+        self.request(callback=callback)
+        callback.request_retry.assert_called_once_with(
+            'GET', self.server.url + '/', 1, 'HTTP 500')
+
+    def test_signed_requests_are_signed_again_on_retry(self):
+        with patch('uhu.updatehub.http.Request') as mock:
+            mock.return_value.send.side_effect = [
+                Mock(ok=False, status_code=503, headers={}),
+                Mock(ok=True, status_code=200)]
+            request('GET', self.server.url, session=self.session)
+        self.assertEqual(mock.call_count, 2)
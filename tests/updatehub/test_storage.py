@@ -0,0 +1,372 @@
+# Copyright (C) 2017 O.S. Systems Software LTDA.
+# SPDX-License-Identifier: GPL-2.0
+
+import hashlib
+import json
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock, patch
+
+from uhu.updatehub.api import (
+    ObjectUploadResult, dummy_object_upload, s3_object_upload,
+    swift_object_upload)
+from uhu.updatehub.http import create_session
+from uhu.updatehub.sendfile import (
+    SendfileSession, can_sendfile, get_upload_session, send_file)
+from uhu.updatehub.storage import ObjectReader, add_query
+from uhu.utils import (
+    CHUNK_SIZE_VAR, RETRY_BASE_DELAY_VAR, UPLOAD_PART_RETRIES_VAR,
+    UPLOAD_PART_SIZE_VAR, UPLOAD_SENDFILE_VAR)
+
+from utils import (
+    EnvironmentFixtureMixin, FileFixtureMixin, StubServer, UHUTestCase)
+
+
+class S3Stub:
+    """Minimal S3 storage that supports multipart uploads."""
+
+    def __init__(self):
+        self.objects = {}
+        self.parts = {}
+        self.failures = {}  # part number: list of status to reply
+        self.multipart = True
+        self.corrupt = set()  # part numbers stored with wrong content
+
+    def __call__(self, request):
+        if request.method == 'POST' and 'uploads' in request.query:
+            if not self.multipart:
+                return 403, {}, ''
+            body = ('<InitiateMultipartUploadResult xmlns="ns">'
+                    '<UploadId>upload-1</UploadId>'
+                    '</InitiateMultipartUploadResult>')
+            return 200, {}, body
+        if request.method == 'PUT' and 'partNumber' in request.query:
+            number = int(request.query['partNumber'][0])
+            failures = self.failures.get(number)
+            if failures:
+                return failures.pop(0), {}, ''
+            self.parts[number] = request.body
+            if number in self.corrupt:
+                self.parts[number] = request.body[::-1]
+            etag = '"{}"'.format(hashlib.md5(
+                self.parts[number]).hexdigest())
+            return 200, {'ETag': etag}, ''
+        if request.method == 'POST' and 'uploadId' in request.query:
+            numbers = re.findall(
+                r'<PartNumber>(\d+)</PartNumber>', request.body.decode())
+            self.objects[request.path] = b''.join(
+                self.parts[int(number)] for number in numbers)
+            return 200, {}, '<CompleteMultipartUploadResult/>'
+        if request.method == 'DELETE':
+            self.parts.clear()
+            return 204, {}, ''
+        if request.method == 'PUT':
+            self.objects[request.path] = request.body
+            return 200, {}, ''
+        return 404, {}, ''
+
+
+class SwiftStub:
+    """Minimal Swift storage that supports static large objects."""
+
+    def __init__(self):
+        self.objects = {}
+        self.segmented = True
+
+    def __call__(self, request):
+        if request.method != 'PUT':
+            return 404, {}, ''
+        path = request.path
+        if 'multipart-manifest' in request.query:
+            manifest = json.loads(request.body.decode())
+            self.objects[path] = b''.join(
+                self.objects['/v1/AUTH_test' + segment['path']]
+                for segment in manifest)
+            return 201, {}, ''
+        if '/segments/' in path and not self.segmented:
+            return 401, {}, ''
+        self.objects[path] = request.body
+        etag = '"{}"'.format(hashlib.md5(request.body).hexdigest())
+        return 201, {'ETag': etag}, ''
+
+
+class StorageTestCase(
+        EnvironmentFixtureMixin, FileFixtureMixin, UHUTestCase):
+
+    def setUp(self):
+        self.set_env_var(CHUNK_SIZE_VAR, 4)
+        self.set_env_var(UPLOAD_PART_SIZE_VAR, 8)
+        self.set_env_var(UPLOAD_PART_RETRIES_VAR, 2)
+        self.set_env_var(RETRY_BASE_DELAY_VAR, 0)
+        self.content = bytes(range(30))
+        self.fn = self.create_file(self.content)
+        self.session = create_session()
+
+
+class AddQueryTestCase(UHUTestCase):
+
+    def test_can_add_query_to_url_without_query(self):
+        url = add_query('http://localhost/obj', 'uploads')
+        self.assertEqual(url, 'http://localhost/obj?uploads')
+
+    def test_can_add_query_to_url_with_query(self):
+        url = add_query('http://localhost/obj?s=1', partNumber=2, id='a/b')
+        self.assertEqual(url, 'http://localhost/obj?s=1&id=a%2Fb&partNumber=2')
+
+
+class S3UploadTestCase(StorageTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.storage = S3Stub()
+        self.server = StubServer(self.storage).start()
+        self.addCleanup(self.server.stop)
+        self.url = self.server.url + '/bucket/obj'
+
+    def upload(self):
+        return s3_object_upload(self.fn, self.url, session=self.session)
+
+    def test_can_upload_object_in_parts(self):
+        self.assertEqual(self.upload(), ObjectUploadResult.SUCCESS)
+        self.assertEqual(self.storage.objects['/bucket/obj'], self.content)
+        self.assertEqual(len(self.storage.parts), 4)
+
+    def test_retries_failed_parts(self):
+        self.storage.failures[2] = [500]
+        self.assertEqual(self.upload(), ObjectUploadResult.SUCCESS)
+        self.assertEqual(self.storage.objects['/bucket/obj'], self.content)
+
+    def test_fails_when_part_fails_after_all_retries(self):
+        self.storage.failures[3] = [500, 503]
+        self.assertEqual(self.upload(), ObjectUploadResult.FAIL)
+        self.assertNotIn('/bucket/obj', self.storage.objects)
+        methods = [request.method for request in self.server.requests]
+        self.assertIn('DELETE', methods)  # aborted
+
+    def test_fails_when_part_is_corrupted(self):
+        self.storage.corrupt.add(2)
+        self.assertEqual(self.upload(), ObjectUploadResult.FAIL)
+        self.assertNotIn('/bucket/obj', self.storage.objects)
+
+    def test_uploads_in_a_single_request_when_multipart_is_refused(self):
+        self.storage.multipart = False
+        self.assertEqual(self.upload(), ObjectUploadResult.SUCCESS)
+        self.assertEqual(self.storage.objects['/bucket/obj'], self.content)
+        self.assertEqual(self.storage.parts, {})
+
+    def test_uploads_small_object_in_a_single_request(self):
+        self.set_env_var(UPLOAD_PART_SIZE_VAR, len(self.content))
+        self.assertEqual(self.upload(), ObjectUploadResult.SUCCESS)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.storage.objects['/bucket/obj'], self.content)
+
+    def test_reports_progress_in_bytes(self):
+        class Callback:
+            uploaded = 0
+
+            def progress(self, nbytes):
+                self.uploaded += nbytes
+
+        callback = Callback()
+        s3_object_upload(self.fn, self.url, callback, session=self.session)
+        self.assertEqual(callback.uploaded, len(self.content))
+
+
+class SwiftUploadTestCase(StorageTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.storage = SwiftStub()
+        self.server = StubServer(self.storage).start()
+        self.addCleanup(self.server.stop)
+        self.path = '/v1/AUTH_test/container/obj'
+        self.url = self.server.url + self.path
+
+    def upload(self):
+        return swift_object_upload(self.fn, self.url, session=self.session)
+
+    def test_can_upload_object_in_segments(self):
+        self.assertEqual(self.upload(), ObjectUploadResult.SUCCESS)
+        self.assertEqual(self.storage.objects[self.path], self.content)
+        segments = [path for path in self.storage.objects
+                    if '/segments/' in path]
+        self.assertEqual(len(segments), 4)
+
+    def test_uploads_in_a_single_request_when_segments_are_refused(self):
+        self.storage.segmented = False
+        self.assertEqual(self.upload(), ObjectUploadResult.SUCCESS)
+        self.assertEqual(self.storage.objects[self.path], self.content)
+
+
+class DummyUploadTestCase(StorageTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.etag = None
+        self.server = StubServer(
+            lambda request: (200, {'ETag': self.etag}, '')).start()
+        self.addCleanup(self.server.stop)
+
+    def upload(self):
+        return dummy_object_upload(
+            self.fn, self.server.url + '/obj', session=self.session)
+
+    def test_succeeds_when_etag_matches_object_md5(self):
+        self.etag = '"{}"'.format(hashlib.md5(self.content).hexdigest())
+        self.assertEqual(self.upload(), ObjectUploadResult.SUCCESS)
+
+    def test_fails_when_etag_does_not_match_object_md5(self):
+        self.etag = '"{}"'.format(hashlib.md5(b'corrupted').hexdigest())
+        self.assertEqual(self.upload(), ObjectUploadResult.FAIL)
+
+    def test_ignores_etag_that_is_not_a_md5(self):
+        self.etag = '"{}-2"'.format(hashlib.md5(b'parts').hexdigest())
+        self.assertEqual(self.upload(), ObjectUploadResult.SUCCESS)
+
+    def test_progress_of_retried_uploads_is_not_accounted_twice(self):
+        for sendfile in ('on', 'off'):
+            with self.subTest(sendfile=sendfile):
+                self.set_env_var(UPLOAD_SENDFILE_VAR, sendfile)
+                replies = [503]
+                server = StubServer(lambda _: (
+                    replies.pop() if replies else 200, {}, '')).start()
+                self.addCleanup(server.stop)
+                callback = Mock()
+                result = dummy_object_upload(
+                    self.fn, server.url + '/obj', callback,
+                    session=self.session)
+                self.assertEqual(result, ObjectUploadResult.SUCCESS)
+                self.assertEqual(len(server.requests), 2)
+                progress = [call[0][0]
+                            for call in callback.progress.call_args_list]
+                self.assertEqual(sum(progress), 30)
+                self.assertIn(-30, progress)
+
+    def test_fails_when_upload_is_cancelled(self):
+        self.set_env_var(UPLOAD_SENDFILE_VAR, 'off')
+        cancelled = threading.Event()
+        cancelled.set()
+        result = dummy_object_upload(
+            self.fn, self.server.url + '/obj', session=self.session,
+            cancelled=cancelled)
+        self.assertEqual(result, ObjectUploadResult.FAIL)
+
+
+class SendfileUploadTestCase(StorageTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.remove_env_var(UPLOAD_SENDFILE_VAR)
+        self.etag = '"{}"'.format(hashlib.md5(self.content).hexdigest())
+        self.server = StubServer(
+            lambda request: (200, {'ETag': self.etag}, '')).start()
+        self.addCleanup(self.server.stop)
+        patcher = patch(
+            'uhu.updatehub.sendfile.send_file', side_effect=send_file)
+        self.send_file = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload(self):
+        return dummy_object_upload(
+            self.fn, self.server.url + '/obj', session=self.session)
+
+    def test_objects_are_sent_with_sendfile_on_plain_http(self):
+        self.assertEqual(self.upload(), ObjectUploadResult.SUCCESS)
+        self.assertEqual(self.send_file.call_count, 1)
+        request = self.server.requests[0]
+        self.assertEqual(request.body, self.content)
+        self.assertEqual(request.headers['Content-Length'], '30')
+
+    def test_corrupted_upload_is_detected(self):
+        self.etag = '"{}"'.format(hashlib.md5(b'corrupted').hexdigest())
+        self.assertEqual(self.upload(), ObjectUploadResult.FAIL)
+
+    def test_object_parts_are_sent_with_sendfile(self):
+        storage = S3Stub()
+        server = StubServer(storage).start()
+        self.addCleanup(server.stop)
+        result = s3_object_upload(
+            self.fn, server.url + '/bucket/obj', session=self.session)
+        self.assertEqual(result, ObjectUploadResult.SUCCESS)
+        self.assertEqual(storage.objects['/bucket/obj'], self.content)
+        self.assertEqual(self.send_file.call_count, 4)
+
+    def test_cancelled_upload_is_not_sent(self):
+        cancelled = threading.Event()
+        cancelled.set()
+        result = dummy_object_upload(
+            self.fn, self.server.url + '/obj', session=self.session,
+            cancelled=cancelled)
+        self.assertEqual(result, ObjectUploadResult.FAIL)
+        # Connection is dropped, since its request was left unfinished
+        self.assertEqual(self.upload(), ObjectUploadResult.SUCCESS)
+        self.assertEqual(self.server.requests[-1].body, self.content)
+
+    def test_connections_are_reused(self):
+        for _ in range(3):
+            self.assertEqual(self.upload(), ObjectUploadResult.SUCCESS)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_known_md5_is_not_computed_again(self):
+        with patch.object(ObjectReader, 'compute_md5') as compute_md5:
+            result = dummy_object_upload(
+                self.fn, self.server.url + '/obj', session=self.session,
+                md5=hashlib.md5(self.content).hexdigest())
+        self.assertEqual(result, ObjectUploadResult.SUCCESS)
+        self.assertEqual(self.send_file.call_count, 1)
+        self.assertFalse(compute_md5.called)
+
+    def test_closing_session_closes_connections_of_every_thread(self):
+        session = SendfileSession(self.session)
+        url = self.server.url + '/obj'
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            for _ in range(2):
+                executor.submit(session.request, 'PUT', url,
+                                data=ObjectReader(self.fn)).result()
+            self.assertEqual(self.server.connections, 1)
+            session.close()
+            executor.submit(session.request, 'PUT', url,
+                            data=ObjectReader(self.fn)).result()
+        session.close()
+        self.assertEqual(self.server.connections, 2)
+
+    def test_requests_with_other_options_are_sent_by_wrapped_session(self):
+        wrapped = Mock()
+        session = SendfileSession(wrapped)
+        reader = ObjectReader(self.fn)
+        response = session.request(
+            'PUT', self.server.url + '/obj', data=reader,
+            allow_redirects=False)
+        self.assertIs(response, wrapped.request.return_value)
+        self.assertFalse(wrapped.request.call_args[1]['allow_redirects'])
+        self.assertFalse(self.send_file.called)
+
+    def test_reports_progress_and_uses_rate_limiter(self):
+        callback, limiter = Mock(), Mock()
+        reader = ObjectReader(
+            self.fn, callback, offset=2, size=10, limiter=limiter)
+        session = SendfileSession(self.session)
+        self.addCleanup(session.close)
+        session.request('PUT', self.server.url + '/obj', data=reader)
+        self.assertEqual(self.server.requests[0].body, self.content[2:12])
+        progress = [call[0][0] for call in callback.progress.call_args_list]
+        self.assertEqual(progress, [4, 4, 2])
+        self.assertEqual(limiter.consume.call_count, 3)
+
+    def test_sendfile_can_be_disabled(self):
+        self.set_env_var(UPLOAD_SENDFILE_VAR, 'off')
+        self.assertIs(get_upload_session(self.session), self.session)
+        self.assertEqual(self.upload(), ObjectUploadResult.SUCCESS)
+        self.assertFalse(self.send_file.called)
+        self.assertEqual(self.server.requests[0].body, self.content)
+
+    def test_other_requests_are_sent_by_wrapped_session(self):
+        reader = ObjectReader(self.fn)
+        self.assertTrue(can_sendfile('http://localhost/obj', reader))
+        # TLS connections are not zero-copy
+        self.assertFalse(can_sendfile('https://localhost/obj', reader))
+        self.assertFalse(can_sendfile('http://localhost/obj', b'data'))
+        self.set_env_var('HTTP_PROXY', 'http://proxy:3128')
+        self.set_env_var('NO_PROXY', '')
+        self.assertFalse(can_sendfile('http://localhost/obj', reader))
@@ -0,0 +1,235 @@
+# Copyright (C) 2017 O.S. Systems Software LTDA.
+# SPDX-License-Identifier: GPL-2.0
+
+import hashlib
+import threading
+from unittest.mock import Mock, patch
+
+from uhu.updatehub.api import ObjectUploadError, ObjectUploadResult
+from uhu.updatehub.engine import PushEngine, run
+from uhu.updatehub.storage import ObjectReader
+from uhu.updatehub.throttle import (
+    MIN_SAMPLE_SIZE, AdaptiveConcurrency, TokenBucket, get_rate_limiter)
+from uhu.utils import (
+    ACCESS_ID_VAR, ACCESS_SECRET_VAR, CHUNK_SIZE_VAR, UPLOAD_ADAPTIVE_VAR,
+    UPLOAD_RATE_LIMIT_VAR)
+
+from utils import (
+    EnvironmentFixtureMixin, FakeClock, FileFixtureMixin, UHUTestCase,
+    UpdateHubStubMixin)
+
+
+class TokenBucketTestCase(UHUTestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.bucket = TokenBucket(
+            100, clock=self.clock, sleep=self.clock.sleep)
+
+    def test_does_not_wait_while_there_are_tokens(self):
+        self.bucket.consume(60)
+        self.bucket.consume(40)
+        self.assertEqual(self.clock.slept, [])
+
+    def test_waits_for_missing_tokens(self):
+        self.bucket.consume(100)
+        self.bucket.consume(50)
+        self.assertEqual(self.clock.slept, [0.5])
+
+    def test_can_consume_more_than_capacity(self):
+        self.bucket.consume(300)
+        self.assertEqual(self.clock.slept, [2])
+
+    def test_tokens_are_refilled_over_time(self):
+        self.bucket.consume(100)
+        self.clock.now += 1
+        self.bucket.consume(100)
+        self.assertEqual(self.clock.slept, [])
+
+    def test_tokens_are_limited_by_capacity(self):
+        self.clock.now += 10
+        self.bucket.consume(200)
+        self.assertEqual(self.clock.slept, [1])
+
+    def test_limits_the_average_rate(self):
+        for _ in range(10):
+            self.bucket.consume(50)
+        self.assertEqual(sum(self.clock.slept), 4)
+
+
+class RateLimiterTestCase(EnvironmentFixtureMixin, UHUTestCase):
+
+    def test_rate_is_not_limited_by_default(self):
+        self.remove_env_var(UPLOAD_RATE_LIMIT_VAR)
+        self.assertIsNone(get_rate_limiter())
+
+    def test_can_set_rate_limit_by_environment_variable(self):
+        self.set_env_var(UPLOAD_RATE_LIMIT_VAR, 1024)
+        limiter = get_rate_limiter()
+        self.assertEqual(limiter.rate, 1024)
+        self.assertIs(get_rate_limiter(), limiter)
+        self.set_env_var(UPLOAD_RATE_LIMIT_VAR, 2048)
+        self.assertEqual(get_rate_limiter().rate, 2048)
+
+
+class ObjectReaderTestCase(
+        EnvironmentFixtureMixin, FileFixtureMixin, UHUTestCase):
+
+    def setUp(self):
+        self.set_env_var(CHUNK_SIZE_VAR, 4)
+        self.fn = self.create_file(bytes(range(10)))
+
+    def test_reads_whole_file_in_chunks(self):
+        reader = ObjectReader(self.fn, limiter=Mock())
+        self.assertEqual(len(reader), 10)
+        self.assertEqual(list(reader), [
+            bytes(range(4)), bytes(range(4, 8)), bytes(range(8, 10))])
+
+    def test_can_read_part_of_file(self):
+        reader = ObjectReader(self.fn, offset=3, size=5, limiter=Mock())
+        self.assertEqual(len(reader), 5)
+        self.assertEqual(b''.join(reader), bytes(range(3, 8)))
+        # Readers can be read again (e.g. on retries)
+        self.assertEqual(b''.join(reader), bytes(range(3, 8)))
+
+    def test_every_chunk_is_accounted_in_limiter(self):
+        limiter = Mock()
+        list(ObjectReader(self.fn, limiter=limiter))
+        amounts = [args[0] for args, _ in limiter.consume.call_args_list]
+        self.assertEqual(amounts, [4, 4, 2])
+
+    def test_computes_md5_of_what_was_read(self):
+        reader = ObjectReader(self.fn, offset=3, size=5, limiter=Mock())
+        list(reader)
+        self.assertEqual(
+            reader.md5, hashlib.md5(bytes(range(3, 8))).hexdigest())
+
+    def test_known_md5_is_not_computed_again(self):
+        reader = ObjectReader(self.fn, limiter=Mock(), md5='known')
+        with patch('uhu.updatehub.storage.hashlib') as storage_hashlib:
+            list(reader)
+        self.assertFalse(storage_hashlib.md5.called)
+        self.assertEqual(reader.md5, 'known')
+
+    def test_uses_global_rate_limiter_by_default(self):
+        self.set_env_var(UPLOAD_RATE_LIMIT_VAR, 1024)
+        self.assertIs(ObjectReader(self.fn).limiter, get_rate_limiter())
+
+
+class AdaptiveConcurrencyTestCase(UHUTestCase):
+
+    def setUp(self):
+        self.concurrency = AdaptiveConcurrency(4)
+        self.size = MIN_SAMPLE_SIZE
+
+    def transfer(self, elapsed, succeeded=True, size=None):
+        self.concurrency.acquire()
+        self.concurrency.release(
+            self.size if size is None else size, elapsed, succeeded)
+
+    def test_starts_with_minimum_limit(self):
+        self.assertEqual(self.concurrency.limit, 1)
+
+    def test_grows_while_throughput_is_kept(self):
+        for _ in range(2):
+            self.transfer(1)
+        self.assertEqual(self.concurrency.limit, 3)
+
+    def test_does_not_grow_beyond_maximum(self):
+        for _ in range(10):
+            self.transfer(1)
+        self.assertEqual(self.concurrency.limit, 4)
+
+    def test_shrinks_when_throughput_drops(self):
+        for _ in range(3):
+            self.transfer(1)
+        self.transfer(3)
+        self.assertEqual(self.concurrency.limit, 3)
+
+    def test_halves_on_errors(self):
+        for _ in range(3):
+            self.transfer(1)
+        self.transfer(1, succeeded=False)
+        self.assertEqual(self.concurrency.limit, 2)
+        self.transfer(1, succeeded=False)
+        self.transfer(1, succeeded=False)
+        self.assertEqual(self.concurrency.limit, 1)
+
+    def test_small_transfers_do_not_change_limit(self):
+        self.transfer(1, size=MIN_SAMPLE_SIZE - 1)
+        self.assertEqual(self.concurrency.limit, 1)
+
+    def test_acquire_blocks_while_limit_is_reached(self):
+        self.concurrency.acquire()
+        acquired = threading.Event()
+
+        def acquire():
+            self.concurrency.acquire()
+            acquired.set()
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        self.assertFalse(acquired.wait(0.05))
+        self.concurrency.release()
+        self.assertTrue(acquired.wait(1))
+        thread.join()
+
+
+class AdaptiveUploadTestCase(
+        UpdateHubStubMixin, EnvironmentFixtureMixin, UHUTestCase):
+
+    def setUp(self):
+        self.set_env_var(ACCESS_ID_VAR, 'access')
+        self.set_env_var(ACCESS_SECRET_VAR, 'secret')
+        self.start_server()
+
+    def upload_objects(self, objects, workers):
+        engine = PushEngine(workers=workers)
+        self.addCleanup(engine.close)
+        run(engine.upload_objects('1234', objects))
+
+    @patch('uhu.updatehub.api.transfer_object')
+    def test_concurrency_is_limited_in_adaptive_mode(self, mock):
+        lock = threading.Lock()
+        running = []
+        peak = []
+
+        def upload(*args, **kwargs):
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+            with lock:
+                running.pop()
+            return ObjectUploadResult.FAIL
+        mock.side_effect = upload
+        self.set_env_var(UPLOAD_ADAPTIVE_VAR, 'yes')
+        objects = [{'size': 1, 'sha256sum': 'sha{}'.format(i), 'md5': 'md5'}
+                   for i in range(8)]
+        with self.assertRaises(ObjectUploadError):
+            self.upload_objects(objects, workers=4)
+        self.assertEqual(mock.call_count, 8)
+        # Failures keep the limit at minimum
+        self.assertEqual(max(peak), 1)
+
+    @patch('uhu.updatehub.engine.AdaptiveConcurrency')
+    @patch('uhu.updatehub.api.transfer_object')
+    def test_adaptive_mode_is_disabled_by_default(self, mock, concurrency):
+        mock.return_value = ObjectUploadResult.SUCCESS
+        self.remove_env_var(UPLOAD_ADAPTIVE_VAR)
+        self.upload_objects(
+            [{'size': 1, 'sha256sum': 'sha1', 'md5': 'md5'}], workers=2)
+        self.assertFalse(concurrency.called)
+
+    @patch('uhu.updatehub.engine.AdaptiveConcurrency')
+    @patch('uhu.updatehub.api.transfer_object')
+    def test_reports_transfers_to_adaptive_concurrency(
+            self, mock, concurrency):
+        mock.return_value = ObjectUploadResult.SUCCESS
+        self.set_env_var(UPLOAD_ADAPTIVE_VAR, 'yes')
+        self.upload_objects(
+            [{'size': 10, 'sha256sum': 'sha1', 'md5': 'md5'}], workers=2)
+        concurrency.assert_called_once_with(2)
+        limiter = concurrency.return_value
+        self.assertEqual(limiter.acquire.call_count, 1)
+        size, _ = limiter.release.call_args[0]
+        self.assertEqual(size, 10)
+        self.assertTrue(limiter.release.call_args[1]['succeeded'])
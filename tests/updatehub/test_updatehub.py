@@ -2,13 +2,16 @@
 # SPDX-License-Identifier: GPL-2.0
 
 import unittest
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
 from uhu.updatehub.api import (
-    finish_package, ObjectUploadResult, push_package, get_package_status,
-    upload_metadata, upload_object, upload_objects, UpdateHubError)
+    finish_package, ObjectUploadError, ObjectUploadResult, push_package,
+    get_package_status, upload_metadata, upload_object, upload_objects,
+    UpdateHubError)
 from uhu.updatehub.http import HTTPError
 
+from utils import fake_upload_plan as plan
+
 
 class PushPackageTestCase(unittest.TestCase):
 
@@ -19,9 +22,25 @@ class PushPackageTestCase(unittest.TestCase):
         uid = push_package({}, [])
         self.assertEqual(uid, '1')
 
+    @patch('uhu.updatehub.api.upload_metadata', return_value='1')
+    @patch('uhu.updatehub.api.upload_objects')
+    @patch('uhu.updatehub.api.finish_package')
+    def test_uses_the_same_session_for_all_requests(self, m1, m2, m3):
+        session = object()
+        push_package({}, [], session=session)
+        for mock in [m1, m2, m3]:
+            self.assertIs(mock.call_args[1]['session'], session)
+
 
 class UploadMetadataTestCase(unittest.TestCase):
 
+    def setUp(self):
+        patcher = patch(
+            'uhu.updatehub.api.get_server_capabilities',
+            return_value=frozenset())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     @patch('uhu.updatehub.api.config.get_private_key_path', return_value='fn')
     @patch('uhu.updatehub.api.sign_dict', return_value='signature')
     @patch('uhu.updatehub.api.validate_metadata')
@@ -63,7 +82,7 @@ class UploadObjectTestCase(unittest.TestCase):
             'filename': __file__,
             'sha256sum': 'sha1234',
             'md5': 'md51234',
-            'chunks': 10,
+            'size': 10,
         }
         self.package_uid = '1234'
 
@@ -104,17 +123,43 @@ class UploadObjectTestCase(unittest.TestCase):
 
 class UploadObjectsTestCase(unittest.TestCase):
 
-    @patch('uhu.updatehub.api.upload_object')
+    def setUp(self):
+        patcher = patch('uhu.updatehub.api.plan_upload', side_effect=plan)
+        self.plan_upload = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('uhu.updatehub.api.transfer_object')
     def test_returns_None_when_successful(self, mock):
         mock.return_value = ObjectUploadResult.SUCCESS
         self.assertIsNone(upload_objects('1234', [{}]))
 
-    @patch('uhu.updatehub.api.upload_object')
+    @patch('uhu.updatehub.api.transfer_object')
     def test_returns_None_when_file_exists(self, mock):
-        mock.return_value = ObjectUploadResult.EXISTS
+        self.plan_upload.side_effect = lambda uid, objects, **kw: plan(
+            uid, [], existing=objects)
         self.assertIsNone(upload_objects('1234', [{}]))
+        self.assertFalse(mock.called)
+
+    @patch('uhu.updatehub.api.transfer_object')
+    def test_raises_error_when_negotiation_fails(self, mock):
+        mock.return_value = ObjectUploadResult.SUCCESS
+        self.plan_upload.side_effect = lambda uid, objects, **kw: plan(
+            uid, [], failed=objects)
+        with self.assertRaises(ObjectUploadError):
+            upload_objects('1234', [{}])
 
-    @patch('uhu.updatehub.api.upload_object')
+    @patch('uhu.updatehub.api.transfer_object')
+    def test_progress_only_accounts_objects_to_upload(self, mock):
+        mock.return_value = ObjectUploadResult.SUCCESS
+        existing = {'sha256sum': 'sha1'}
+        upload = {'sha256sum': 'sha2'}
+        self.plan_upload.side_effect = lambda uid, objects, **kw: plan(
+            uid, [upload], existing=[existing])
+        callback = Mock()
+        upload_objects('1234', [existing, upload], callback=callback)
+        callback.start_package_upload.assert_called_once_with([upload])
+
+    @patch('uhu.updatehub.api.transfer_object')
     def test_raises_error_when_some_upload_fails(self, mock):
         mock.side_effect = [
             ObjectUploadResult.SUCCESS,
@@ -123,6 +168,38 @@ class UploadObjectsTestCase(unittest.TestCase):
         with self.assertRaises(UpdateHubError):
             upload_objects('1234', [{}, {}])
 
+    @patch('uhu.updatehub.api.transfer_object')
+    def test_uploads_largest_objects_first(self, mock):
+        mock.return_value = ObjectUploadResult.SUCCESS
+        objects = [{'size': 1}, {'size': 3}, {'size': 2}]
+        upload_objects('1234', objects, workers=1)
+        sizes = [args[0]['size'] for args, _ in mock.call_args_list]
+        self.assertEqual(sizes, [3, 2, 1])
+
+    @patch('uhu.updatehub.api.transfer_object')
+    def test_uploads_all_objects_even_if_some_fails(self, mock):
+        def upload(obj, *args, **kwargs):
+            if obj['size'] % 2:
+                return ObjectUploadResult.FAIL
+            return ObjectUploadResult.SUCCESS
+        mock.side_effect = upload
+        objects = [{'size': size} for size in range(6)]
+        with self.assertRaises(ObjectUploadError) as context:
+            upload_objects('1234', objects, workers=3)
+        self.assertEqual(mock.call_count, 6)
+        failed = sorted(obj['size'] for obj in context.exception.failed)
+        self.assertEqual(failed, [1, 3, 5])
+
+    @patch('uhu.updatehub.api.transfer_object')
+    def test_workers_receive_synchronized_callback(self, mock):
+        mock.return_value = ObjectUploadResult.SUCCESS
+        callback = Mock()
+        upload_objects('1234', [{}], callback=callback)
+        worker_callback = mock.call_args[0][3]
+        self.assertIsNot(worker_callback, callback)
+        worker_callback.progress(10)
+        callback.progress.assert_called_once_with(10)
+
 
 class FinishPackageTestCase(unittest.TestCase):
 
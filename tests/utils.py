@@ -1,11 +1,23 @@
 # Copyright (C) 2017 O.S. Systems Software LTDA.
 # SPDX-License-Identifier: GPL-2.0
 
+import gzip
 import hashlib
+import json
 import os
+import re
 import shutil
+import socketserver
 import tempfile
+import threading
 import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from uhu.updatehub.api import (
+    BATCH_CAPABILITY, DEFERRED_ETAG_CAPABILITY, LONG_POLL_CAPABILITY,
+    UploadPlan)
+from uhu.utils import SERVER_URL_VAR, get_server_url
 
 
 class UHUTestCase(unittest.TestCase):
@@ -79,3 +91,259 @@ class EnvironmentFixtureMixin:
         super().clean()
         for var in self._vars:
             self.remove_env_var(var)
+
+
+class FakeClock:
+    """Clock that only moves when told to sleep."""
+
+    def __init__(self, now=0):
+        self.now = now
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def fake_upload_plan(package_uid, objects, existing=(), failed=(), **kw):
+    """Replaces plan_upload, planning to upload all objects."""
+    plan = UploadPlan()
+    for obj in objects:
+        plan.add(obj, ('dummy', 'http://storage'))
+    plan.existing.extend(existing)
+    plan.failed.extend(failed)
+    return plan
+
+
+def fake_metadata_request(metadata, *args):
+    """Replaces metadata_request, neither validating nor signing."""
+    return get_server_url('/packages'), json.dumps(metadata), {}
+
+
+class StubRequest:  # pylint: disable=too-few-public-methods
+    """A request received by StubServer."""
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, method, path, query, headers, body, client):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+        self.client = client
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StubServer:
+    """Local HTTP server that stands in for UpdateHub and storages.
+
+    Every request is recorded in requests and passed to handler, which
+    must return a (status, headers, body) tuple.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = []
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _read_body(self):
+                if self.headers.get('Transfer-Encoding') == 'chunked':
+                    body = b''
+                    while True:
+                        size = int(self.rfile.readline().strip(), 16)
+                        chunk = self.rfile.read(size + 2)[:size]
+                        if not size:
+                            return body
+                        body += chunk
+                length = int(self.headers.get('Content-Length', 0))
+                return self.rfile.read(length)
+
+            def _handle(self):
+                url = urlsplit(self.path)
+                request = StubRequest(
+                    self.command, url.path,
+                    parse_qs(url.query, keep_blank_values=True),
+                    self.headers, self._read_body(), self.client_address)
+                with stub._lock:
+                    stub.requests.append(request)
+                status, headers, body = stub.handler(request)
+                if isinstance(body, str):
+                    body = body.encode()
+                self.send_response(status)
+                for header, value in (headers or {}).items():
+                    self.send_header(header, value)
+                self.send_header('Content-Length', len(body))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+            def log_message(self, *args):  # pylint: disable=arguments-differ
+                pass
+
+        self._httpd = _ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, kwargs={'poll_interval': 0.01},
+            daemon=True)
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self._httpd.server_address[1])
+
+    @property
+    def connections(self):
+        """Returns the number of distinct client connections."""
+        return len({request.client for request in self.requests})
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class UpdateHubStub:
+    """Minimal UpdateHub server, meant to be the handler of StubServer.
+
+    It creates packages (decompressing metadata sent with one of
+    metadata_encodings), negotiates object uploads (objects in known
+    are already on server), stores uploaded objects (which are known
+    from then on) and reports the given package statuses, one per
+    status request (with their ETags). Likewise, finish requests are
+    replied with finish_statuses. The first upload of each object in
+    expired is refused with 403, as storages do with expired URLs.
+    """
+
+    decoders = {'gzip': gzip.decompress}
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, known=(), batch=False, deferred_etag=False,
+                 statuses=('ready',), finish_statuses=(200,),
+                 metadata_encodings=(), long_poll=False, expired=()):
+        self.known = set(known)
+        self.expired = set(expired)
+        self.negotiated = []
+        self.metadata = None
+        self.statuses = list(statuses)
+        self.finish_statuses = list(finish_statuses)
+        self.finished = []
+        self.capabilities = []
+        if batch:
+            self.capabilities.append(BATCH_CAPABILITY)
+        if deferred_etag:
+            self.capabilities.append(DEFERRED_ETAG_CAPABILITY)
+        if long_poll:
+            self.capabilities.append(LONG_POLL_CAPABILITY)
+        for encoding in metadata_encodings:
+            self.capabilities.append('metadata-{}'.format(encoding))
+        self.stored = {}
+        self.uploads = []
+        self.url = None
+
+    def target(self, sha256sum):
+        return {'storage': 'dummy',
+                'url': '{}/storage/{}'.format(self.url, sha256sum)}
+
+    def create_package(self, request):
+        # Content-sha256 must match what was sent, not the metadata
+        sha256sum = hashlib.sha256(request.body).hexdigest()
+        if request.headers.get('Content-sha256') != sha256sum:
+            return 400, {}, ''
+        body = request.body
+        encoding = request.headers.get('Content-Encoding')
+        if encoding is not None:
+            if encoding not in self.decoders:
+                return 415, {}, ''
+            body = self.decoders[encoding](body)
+        self.metadata = json.loads(body.decode())
+        return 201, {}, json.dumps({'uid': '1234'})
+
+    def package_status(self, request):
+        status = self.statuses[0]
+        if len(self.statuses) > 1:
+            self.statuses.pop(0)
+        etag = '"{}"'.format(status)
+        if request.headers.get('If-None-Match') == etag:
+            return 304, {'ETag': etag}, ''
+        return 200, {'ETag': etag}, json.dumps({'status': status})
+
+    def __call__(self, request):  # pylint: disable=too-many-return-statements
+        if request.method == 'POST' and request.path == '/packages':
+            return self.create_package(request)
+        match = re.match(r'^/packages/(\w+)/finish$', request.path)
+        if request.method == 'PUT' and match:
+            self.finished.append(match.group(1))
+            status = self.finish_statuses[0]
+            if len(self.finish_statuses) > 1:
+                self.finish_statuses.pop(0)
+            return status, {}, ''
+        if request.method == 'GET' and re.match(
+                r'^/packages/\w+$', request.path):
+            return self.package_status(request)
+        if request.path == '/capabilities':
+            if not self.capabilities:
+                return 404, {}, ''
+            body = {'capabilities': self.capabilities}
+            return 200, {}, json.dumps(body)
+        match = re.match(r'^/packages/\w+/objects/(\w+)$', request.path)
+        if request.method == 'POST' and match:
+            sha256sum = match.group(1)
+            self.negotiated.append(sha256sum)
+            if sha256sum in self.known:
+                return 200, {}, ''
+            return 201, {}, json.dumps(self.target(sha256sum))
+        if request.method == 'POST' and re.match(
+                r'^/packages/\w+/objects$', request.path):
+            objects = []
+            for obj in json.loads(request.body.decode())['objects']:
+                sha256sum = obj['sha256sum']
+                if sha256sum in self.known:
+                    objects.append({'sha256sum': sha256sum, 'exists': True})
+                else:
+                    entry = self.target(sha256sum)
+                    entry['sha256sum'] = sha256sum
+                    objects.append(entry)
+            return 200, {}, json.dumps({'objects': objects})
+        if request.method == 'PUT' and request.path.startswith('/storage/'):
+            sha256sum = request.path.split('/')[-1]
+            if sha256sum in self.expired:
+                self.expired.discard(sha256sum)
+                return 403, {}, ''
+            self.stored[sha256sum] = request.body
+            self.uploads.append(sha256sum)
+            self.known.add(sha256sum)
+            return 200, {}, ''
+        return 404, {}, ''
+
+
+class UpdateHubStubMixin:  # pylint: disable=too-few-public-methods
+    """Serves an UpdateHubStub and sets it as the UpdateHub server.
+
+    Must be mixed with EnvironmentFixtureMixin.
+    """
+
+    def start_server(self, **kwargs):
+        self.server_stub = UpdateHubStub(**kwargs)
+        self.server = StubServer(self.server_stub).start()
+        self.addCleanup(self.server.stop)
+        self.server_stub.url = self.server.url
+        self.set_env_var(SERVER_URL_VAR, self.server.url)
+        return self.server
@@ -4,11 +4,10 @@
 import click
 
 from .. import get_version
-from ..repl import repl
 
 from .config import config_cli, cleanup_command
 from .hardware import hardware_cli
-from .package import package_cli
+from .package import package_cli, push_many_command
 from .product import product_cli
 
 
@@ -24,11 +23,14 @@ def cli(ctx, package):
     UpdateHub API server address.
     """
     if ctx.invoked_subcommand is None:
+        # prompt_toolkit is only loaded by the interactive prompt
+        from ..repl import repl
         repl(package)
 
 
 # General commands
 cli.add_command(cleanup_command)
+cli.add_command(push_many_command)
 
 # Subcommands
 cli.add_command(config_cli)
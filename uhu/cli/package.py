@@ -2,20 +2,28 @@
 # SPDX-License-Identifier: GPL-2.0
 
 import json
+import os
+import sys
 
 import click
 
-from pkgschema import validate_metadata, ValidationError
 from uhu.core.objects import DuplicateObjectEntryError
 from ..core.object import Modes
-from ..updatehub.api import get_package_status, UpdateHubError
-from ..core.utils import dump_package, dump_package_archive
+from ..core.diff import diff_packages
+from ..core.package import push_packages
+from ..core.utils import (
+    dump_package, dump_package_archive, dump_package_directory,
+    list_directory_objects, load_objects_manifest, load_package)
 from ..ui import get_callback, show_cursor
 
 from ._object import CLICK_ADD_OPTIONS
 from .utils import error, open_package
 
 
+# Package statuses waited for by default
+DEFAULT_WAIT_STATES = ('done', 'error')
+
+
 @click.group(name='package')
 def package_cli():
     """Package related commands."""
@@ -50,16 +58,30 @@ def export_command(filename):
 @click.argument('filename', type=click.Path(exists=True))
 @click.option('--mode', '-m', type=click.Choice(Modes.names()),
               help='How the object will be installed', required=True)
-def add_object_command(filename, mode, **options):
+@click.option('--recursive', is_flag=True,
+              help='Adds an entry for each file within directory')
+@click.option('--target-path-prefix',
+              help='Where files are installed, when added recursively')
+def add_object_command(filename, mode, recursive, target_path_prefix,
+                       **options):
     """Adds an entry in the package file for the given artifact."""
     options = {CLICK_ADD_OPTIONS[opt].metadata: value
                for opt, value in options.items()
                if value is not None}
-    options['filename'] = filename
     options['mode'] = mode
+    if target_path_prefix is not None and not recursive:
+        error(2, '--target-path-prefix requires --recursive.')
+    if recursive:
+        if not os.path.isdir(filename):
+            error(2, '"{}" is not a directory.'.format(filename))
+        objects = list_directory_objects(
+            filename, options, target_path_prefix)
+    else:
+        options['filename'] = filename
+        objects = [options]
     with open_package() as package:
         try:
-            package.objects.create(options)
+            package.objects.create_many(objects)
         except ValueError as err:
             error(2, err)
         except DuplicateObjectEntryError as err:
@@ -71,6 +93,26 @@ for opt in CLICK_ADD_OPTIONS.values():
     add_object_command.params.append(opt)
 
 
+@package_cli.command('import')
+@click.argument('manifest', type=click.Path(exists=True, dir_okay=False))
+def import_objects_command(manifest):
+    """Adds the objects listed in a JSON or CSV manifest."""
+    try:
+        objects = load_objects_manifest(manifest)
+    except ValueError as err:
+        error(2, 'Invalid manifest: {}'.format(err))
+    for obj in objects:
+        if not os.path.exists(obj['filename']):
+            error(2, '"{}" does not exist.'.format(obj['filename']))
+    with open_package() as package:
+        try:
+            package.objects.create_many(objects)
+        except ValueError as err:
+            error(2, err)
+        except DuplicateObjectEntryError as err:
+            error(2, err)
+
+
 @package_cli.command(name='edit')
 @click.option('--index', type=click.INT, required=True,
               help='The object index')
@@ -99,31 +141,80 @@ def remove_object_command(object_id):
 # Transaction commands
 
 @package_cli.command(name='push')
-def push_command():
+@click.option('--resume', is_flag=True,
+              help='Continues an interrupted push of this package')
+def push_command(resume):
     """Pushes a package file to server with the given version."""
+    from ..updatehub.api import UpdateHubError
     callback = get_callback()
     with open_package(read_only=True) as package:
         try:
-            package.push(callback)
+            package.push(callback, resume=resume)
         except UpdateHubError as err:
             error(2, err)
         finally:
             show_cursor()
 
 
+@click.command(name='push-many')
+@click.argument('package-files', nargs=-1, required=True,
+                type=click.Path(exists=True, dir_okay=False))
+@click.option('--resume', is_flag=True,
+              help='Continues interrupted pushes of these packages')
+def push_many_command(package_files, resume):
+    """Pushes many package files to server at once.
+
+    Files shared by the packages are read and uploaded only once.
+    """
+    from ..updatehub.api import UpdateHubError
+    packages = []
+    for package_file in package_files:
+        try:
+            packages.append(load_package(package_file))
+        except ValueError as err:
+            error(1, 'Invalid package file {}: {}'.format(package_file, err))
+    callback = get_callback()
+    try:
+        push_packages(packages, callback, resume=resume)
+    except UpdateHubError as err:
+        error(2, err)
+    finally:
+        show_cursor()
+
+
 @package_cli.command(name='status')
-@click.argument('package-uid')
-def status_command(package_uid):
-    """Prints the status of the given package."""
+@click.argument('package-uids', nargs=-1, required=True)
+@click.option('--wait', is_flag=True,
+              help='Waits until packages reach one of the --until states')
+@click.option('--until', 'states', multiple=True,
+              default=DEFAULT_WAIT_STATES, show_default=True,
+              help='Status to wait for (can be given many times)')
+@click.option('--timeout', type=click.FLOAT,
+              help='Maximum time to wait, in seconds')
+def status_command(package_uids, wait, states, timeout):
+    """Prints the status of the given packages."""
+    from ..updatehub.api import get_package_status, UpdateHubError
+    from ..updatehub.engine import wait_for_packages_status
     try:
-        print(get_package_status(package_uid))
+        if wait:
+            statuses = wait_for_packages_status(
+                package_uids, states, timeout=timeout)
+        else:
+            statuses = {package_uid: get_package_status(package_uid)
+                        for package_uid in package_uids}
     except UpdateHubError as err:
         error(2, err)
+    if len(package_uids) == 1:
+        print(statuses[package_uids[0]])
+        return
+    for package_uid in package_uids:
+        print('{}: {}'.format(package_uid, statuses[package_uid]))
 
 
 @package_cli.command(name='metadata')
 def metadata_command():
     """Loads package and prints its metadata."""
+    from pkgschema import validate_metadata, ValidationError
     with open_package(read_only=True) as package:
         metadata = package.to_metadata()
         print(json.dumps(metadata, indent=4, sort_keys=True))
@@ -135,16 +226,45 @@ def metadata_command():
 
 
 @package_cli.command(name='archive')
-@click.option('--output', type=click.Path(dir_okay=False),
+@click.option('--output', type=click.Path(),
               help="Where to write archive")
 @click.option('--force', is_flag=True,
               help="Overwrites output file if output exists")
-def archive_command(output, force):
+@click.option('--format', 'format_', type=click.Choice(['zip', 'dir']),
+              default='zip', help="Archive format (zip file or directory)")
+def archive_command(output, force, format_):
     """Saves package as archive."""
+    if format_ == 'zip' and output is not None and os.path.isdir(output):
+        raise click.BadParameter(
+            'Path "{}" is a directory.'.format(output), param_hint='--output')
     with open_package(read_only=True) as package:
         try:
-            dump_package_archive(package, output, force)
+            if format_ == 'dir':
+                dump_package_directory(package, output, force)
+            else:
+                dump_package_archive(package, output, force)
         except FileExistsError as err:
             error(1, err)
         except ValueError as err:
             error(2, err)
+
+
+@package_cli.command(name='diff')
+@click.argument('old', type=click.Path(exists=True))
+@click.argument('new', type=click.Path(exists=True))
+@click.option('--content', is_flag=True,
+              help='Reads object files to compare them with archives')
+def diff_command(old, new, content):
+    """Shows the differences between two package files or archives.
+
+    Exits with 1 if packages differ.
+    """
+    try:
+        diff = diff_packages(old, new, content)
+    except (ValueError, KeyError, OSError) as err:
+        error(2, 'Invalid package: {}'.format(err))
+    if not diff:
+        print('No differences.')
+        return
+    print(diff)
+    sys.exit(1)
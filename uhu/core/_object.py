@@ -5,12 +5,13 @@ import hashlib
 import math
 import os
 
-from ..utils import call, get_chunk_size
+from ..utils import get_chunk_size, get_progress_reporter
 
 from ._options import Options
 from .compression import compression_to_metadata
 from .install_condition import InstallCondition
-from .validators import validate_options
+from .store import get_object_store
+from .validators import OptionsValidator, validate_options
 
 
 class Modes:
@@ -30,6 +31,12 @@ class Modes:
 
 class ObjectType(type):
 
+    def __new__(mcs, classname, bases, methods):
+        # Packages may have thousands of objects, so modes must not
+        # add a __dict__ to the slots of BaseObject.
+        methods.setdefault('__slots__', ())
+        return super().__new__(mcs, classname, bases, methods)
+
     def __init__(cls, classname, bases, methods):
         super().__init__(classname, bases, methods)
         # register class into modes registry
@@ -60,9 +67,14 @@ class ObjectType(type):
         cls.string_template = [
             (Options.get(opt), [Options.get(child) for child in children])
             for opt, children in cls.string_template]
+        cls.validator = OptionsValidator(cls)
 
 
 class BaseObject(metaclass=ObjectType):
+    # Objects have no __dict__, so setting any attribute not listed
+    # here (e.g. by code that used to tag objects) raises AttributeError
+    __slots__ = ('_values', 'chunk_size', '_md5', 'blob')
+
     mode = None
     allow_compression = False
     allow_install_condition = False
@@ -70,6 +82,7 @@ class BaseObject(metaclass=ObjectType):
     required_options = []
     string_template = tuple()
     target_types = None
+    validator = None  # set by ObjectType
 
     @classmethod
     def is_required(cls, option):
@@ -78,7 +91,8 @@ class BaseObject(metaclass=ObjectType):
     def __init__(self, values):
         self._values = validate_options(self, values)
         self.chunk_size = get_chunk_size()
-        self.md5 = None
+        self._md5 = None
+        self.blob = None
 
     def to_template(self):
         template = {opt.metadata: value
@@ -87,12 +101,36 @@ class BaseObject(metaclass=ObjectType):
         template['mode'] = self.mode
         return template
 
-    def to_metadata(self, callback=None):
-        self.load(callback)
+    def equals(self, other, content=False, analyzed=None):
+        """Checks if other object has the same options.
+
+        Files are only compared by their sha256sum when both objects
+        already know it, unless content is True, in which case files
+        are read (see load) as needed.
+        """
+        if self.to_template() != other.to_template():
+            return False
+        if content:
+            for obj in (self, other):
+                if obj['sha256sum'] is None:
+                    obj.load(analyzed=analyzed)
+        sha256sum, other_sha256sum = self['sha256sum'], other['sha256sum']
+        if sha256sum is None or other_sha256sum is None:
+            return True
+        return sha256sum == other_sha256sum
+
+    def to_metadata(self, callback=None, analyzed=None, md5=False):
+        """Serializes object as metadata.
+
+        analyzed is an optional dict of already analyzed files, shared
+        by objects (even of different packages) that may refer to the
+        same files. See load.
+        """
+        analysis = self.load(callback, analyzed, md5)
         metadata = {opt.metadata: value for opt, value in self._values.items()}
         metadata['mode'] = self.mode
         metadata.update(self._metadata_install_condition(metadata))
-        metadata.update(self._metadata_compression())
+        metadata.update(self._metadata_compression(analysis))
         return metadata
 
     def _metadata_install_condition(self, metadata):
@@ -100,18 +138,23 @@ class BaseObject(metaclass=ObjectType):
             return {}
         return InstallCondition(metadata).to_metadata()
 
-    def _metadata_compression(self):
+    def _metadata_compression(self, analysis=None):
         if not self.allow_compression:
             return {}
-        return compression_to_metadata(self.filename)
+        if analysis is None:
+            return compression_to_metadata(self.source)
+        if 'compression' not in analysis:
+            analysis['compression'] = compression_to_metadata(self.source)
+        return analysis['compression']
 
     def to_upload(self):
         return {
-            'filename': self['filename'],
+            'filename': self.source,
             'size': self['size'],
             'sha256sum': self['sha256sum'],
-            'md5': self.md5,
-            'chunks': len(self)
+            # MD5 is only needed by some uploads, so it is computed
+            # by the uploader when needed (unless already loaded).
+            'md5': self._md5,
         }
 
     @property
@@ -119,6 +162,16 @@ class BaseObject(metaclass=ObjectType):
         """Shortcut to returns object filename option."""
         return self['filename']
 
+    @property
+    def source(self):
+        """Returns the file from where object content must be read.
+
+        After loading, this is the object store copy (if enabled).
+        """
+        if self.blob is not None:
+            return self.blob
+        return self.filename
+
     @property
     def size(self):
         """Returns the size of object file."""
@@ -133,17 +186,64 @@ class BaseObject(metaclass=ObjectType):
         """Updates a given option value."""
         self[option] = value
 
-    def load(self, callback=None):
-        """Reads object to set its size, sha256sum and MD5."""
+    def _file_key(self):
+        """Identifies the object file contents (as long as unchanged)."""
+        stat = os.stat(self.filename)
+        return (os.path.realpath(self.filename), stat.st_size,
+                stat.st_mtime_ns)
+
+    def load(self, callback=None, analyzed=None, md5=False):
+        """Reads object to set its size and sha256sum.
+
+        If md5 is True, the MD5 needed to upload the object is computed
+        in the same read. If analyzed is given, a file already in it is
+        not read again and the analysis of newly read files is added to
+        it. Files left unchanged since the object store (if enabled)
+        got them are not read either. Returns the file analysis.
+        """
+        key = None
+        if analyzed is not None:
+            key = self._file_key()
+            analysis = analyzed.get(key)
+            if analysis is not None and (not md5 or analysis['md5']):
+                get_progress_reporter(callback)(analysis['size'])
+                self['sha256sum'] = analysis['sha256sum']
+                self['size'] = analysis['size']
+                self._md5 = analysis['md5']
+                self.blob = analysis['blob']
+                return analysis
+        store = get_object_store()
+        analysis = None if store is None else store.lookup(self.filename)
+        if analysis is None or (md5 and analysis['md5'] is None):
+            analysis = self._read(callback, md5)
+        else:
+            get_progress_reporter(callback)(analysis['size'])
+        self['sha256sum'] = analysis['sha256sum']
+        self['size'] = analysis['size']
+        self._md5 = analysis['md5']
+        if store is not None:
+            self.blob = store.add(
+                self.filename, self['sha256sum'], md5=self._md5)
+        analysis['blob'] = self.blob
+        if key is not None:
+            analyzed[key] = analysis
+        return analysis
+
+    def _read(self, callback, md5):
+        """Reads object file to hash it."""
         sha256sum = hashlib.sha256()
-        md5 = hashlib.md5()
+        md5sum = hashlib.md5() if md5 else None
+        progress = get_progress_reporter(callback)
         for chunk in self:
             sha256sum.update(chunk)
-            md5.update(chunk)
-            call(callback, 'object_read')
-        self['sha256sum'] = sha256sum.hexdigest()
-        self['size'] = self.size
-        self.md5 = md5.hexdigest()
+            if md5sum is not None:
+                md5sum.update(chunk)
+            progress(len(chunk))
+        return {
+            'sha256sum': sha256sum.hexdigest(),
+            'size': self.size,
+            'md5': None if md5sum is None else md5sum.hexdigest(),
+        }
 
     def __setitem__(self, key, value):
         try:
@@ -151,13 +251,12 @@ class BaseObject(metaclass=ObjectType):
         except ValueError:
             raise TypeError('You must provide a registered option')
         try:
-            self._values[option] = option.validate(value)
+            validated = option.validate(value)
         except ValueError:
             raise TypeError('You must provide a valid value.')
-        values = {option.metadata: value
-                  for option, value in self._values.items()}
-        values[key] = value
-        self._values = validate_options(self, values)
+        if value is None:
+            validated = None
+        self._values = self.validator.change(self._values, option, validated)
 
     def __getitem__(self, key):
         if not isinstance(key, str):
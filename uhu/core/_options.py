@@ -2,6 +2,7 @@
 # SPDX-License-Identifier: GPL-2.0
 
 import re
+import sys
 
 
 class Options:
@@ -44,6 +45,10 @@ class BaseOption(metaclass=OptionType):
     # symmetric determines if this option can have more than on value,
     # one for each installation set.
     symmetric = True
+    # interned determines if values must be interned, so the many
+    # objects of a package that share a value share a single string.
+    # Values of options with choices are always interned.
+    interned = False
 
     choices = None
     min = None
@@ -140,6 +145,8 @@ class StringOption(BaseOption):
         if cls.max is not None and len(value) > cls.max:
             err = '{} length is greater than {}'
             raise ValueError(err.format(value, cls.max))
+        if cls.choices or cls.interned:
+            value = sys.intern(value)
         return value
 
     @classmethod
@@ -0,0 +1,150 @@
+# Copyright (C) 2017 O.S. Systems Software LTDA.
+# SPDX-License-Identifier: GPL-2.0
+
+import json
+import os
+import zipfile
+from collections import OrderedDict, namedtuple
+
+from .object import Object
+from .utils import load_package
+
+
+PACKAGE_OPTIONS = ('product', 'version', 'supported-hardware')
+
+
+PackageSnapshot = namedtuple(
+    'PackageSnapshot', ['values', 'n_sets', 'objects'])
+PackageSnapshot.__doc__ = """The values of a package to be compared.
+
+values has the package options, n_sets the number of installation
+sets and objects maps the (filename, mode) of each object to its
+objects in every installation set.
+"""
+
+
+def load_snapshot(fn):
+    """Returns the PackageSnapshot of a package file or archive.
+
+    Package files (.uhu) are read as templates, so no object file is
+    read to create a snapshot. Archives (.uhupkg files or directories
+    created by dump_package_directory) are read from their metadata,
+    which already has the sha256sum of each object, without reading
+    their objects either.
+    """
+    if os.path.isdir(fn):
+        with open(os.path.join(fn, 'metadata')) as fp:
+            return _snapshot_from_metadata(json.load(fp))
+    if zipfile.is_zipfile(fn):
+        with zipfile.ZipFile(fn) as archive:
+            metadata = archive.read('metadata').decode()
+        return _snapshot_from_metadata(json.loads(metadata))
+    return _snapshot_from_package(load_package(fn))
+
+
+def _snapshot_from_package(package):
+    template = package.to_template()
+    objects = OrderedDict()
+    for entry in package.objects.objects:
+        objects[_object_key(entry[0])] = list(entry)
+    return PackageSnapshot(
+        {opt: template[opt] for opt in PACKAGE_OPTIONS},
+        package.objects.n_sets, objects)
+
+
+def _snapshot_from_metadata(metadata):
+    sets = metadata.get('objects') or [[]]
+    objects = OrderedDict()
+    for entry in zip(*sets):
+        entry = [Object(values) for values in entry]
+        objects[_object_key(entry[0])] = entry
+    return PackageSnapshot(
+        {opt: metadata.get(opt) for opt in PACKAGE_OPTIONS},
+        len(sets), objects)
+
+
+def _object_key(obj):
+    return (obj.filename, obj.mode)
+
+
+class PackageDiff:
+    """The differences between two packages.
+
+    package has the changed package values, added and removed the
+    (filename, mode) of the objects only in the new or old package
+    and changed the option changes of the objects in both, as
+    (set index, option, old value, new value) tuples.
+    """
+
+    def __init__(self):
+        self.package = OrderedDict()
+        self.added = []
+        self.removed = []
+        self.changed = OrderedDict()
+
+    def __bool__(self):
+        return bool(self.package or self.added or self.removed or
+                    self.changed)
+
+    def __str__(self):
+        lines = ['{}: {} -> {}'.format(opt, old, new)
+                 for opt, (old, new) in self.package.items()]
+        lines.extend('+ {} [mode: {}]'.format(*key) for key in self.added)
+        lines.extend('- {} [mode: {}]'.format(*key) for key in self.removed)
+        for key, changes in self.changed.items():
+            lines.append('~ {} [mode: {}]'.format(*key))
+            for set_index, opt, old, new in changes:
+                lines.append('    {} (set {}): {} -> {}'.format(
+                    opt, set_index, old, new))
+        return '\n'.join(lines)
+
+
+def _diff_objects(old_obj, new_obj, content, analyzed):
+    """Yields (option, old value, new value) for each changed option."""
+    old, new = old_obj.to_template(), new_obj.to_template()
+    for opt in sorted(set(old) | set(new)):
+        if old.get(opt) != new.get(opt):
+            yield opt, old.get(opt), new.get(opt)
+    if content:
+        # Objects of a package file are the files themselves, so their
+        # contents are only read to compare them with archived ones.
+        for obj, other in ((old_obj, new_obj), (new_obj, old_obj)):
+            if obj['sha256sum'] is None and other['sha256sum'] is not None:
+                obj.load(analyzed=analyzed)
+    sha256sum, new_sha256sum = old_obj['sha256sum'], new_obj['sha256sum']
+    if None not in (sha256sum, new_sha256sum) and \
+            sha256sum != new_sha256sum:
+        yield 'sha256sum', sha256sum, new_sha256sum
+
+
+def diff_packages(old_fn, new_fn, content=False):
+    """Returns the differences (a PackageDiff) between two packages.
+
+    Packages may be package files or archives (see load_snapshot).
+    Object contents are compared by their sha256sum when both are
+    known. If content is True, files of package files are read (once
+    each, see BaseObject.load) when compared with archived objects.
+    Files of objects referred by both packages are never read.
+    """
+    old, new = load_snapshot(old_fn), load_snapshot(new_fn)
+    diff = PackageDiff()
+    for opt in PACKAGE_OPTIONS:
+        if old.values[opt] != new.values[opt]:
+            diff.package[opt] = (old.values[opt], new.values[opt])
+    if old.n_sets != new.n_sets:
+        diff.package['installation-sets'] = (old.n_sets, new.n_sets)
+    diff.added = [key for key in new.objects if key not in old.objects]
+    diff.removed = [key for key in old.objects if key not in new.objects]
+    analyzed = {}
+    for key, entry in old.objects.items():
+        new_entry = new.objects.get(key)
+        if new_entry is None:
+            continue
+        changes = [
+            (set_index, opt, old_value, new_value)
+            for set_index, (obj, new_obj) in enumerate(zip(entry, new_entry))
+            for opt, old_value, new_value in _diff_objects(
+                obj, new_obj, content, analyzed)]
+        if changes:
+            diff.changed[key] = changes
+    return diff
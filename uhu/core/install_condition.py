@@ -4,8 +4,6 @@
 import re
 import string
 import struct
-from copy import deepcopy
-import libarchive
 
 
 # Utilities
@@ -88,6 +86,7 @@ def get_arm_z_image_version(fp):
     # In ARM uImage kernel is compressed within the image. To retrive
     # its version, we need find the compressed kernel, uncompress it,
     # and extract the version from the uncompressed data.
+    import libarchive
 
     for header in [
             # Headers taken from:
@@ -212,7 +211,7 @@ def get_version(fn, type_, **kwargs):
 
 def normalize_install_if_different(values):
     """Converts metadata install-if-different key to install-condition."""
-    values = deepcopy(values)
+    values = dict(values)
     iid = values.pop('install-if-different', None)
 
     # Without install-if-different
@@ -1,6 +1,8 @@
 # Copyright (C) 2017 O.S. Systems Software LTDA.
 # SPDX-License-Identifier: GPL-2.0
 
+from bisect import bisect_left, bisect_right
+from collections import Counter
 from itertools import chain
 from .object import Object
 from ._options import Options
@@ -9,6 +11,14 @@ from ..utils import call, list_to_str
 
 
 class ObjectsManager:
+    """Objects of all installation sets of a package.
+
+    Objects are stored by column: one list per installation set, where
+    the objects at the same index are the same object in each set.
+    Objects are kept sorted by filename (of the first set), so they
+    are inserted and found by bisection, and (filename, mode) pairs are
+    counted, so duplicates are detected without scanning the objects.
+    """
 
     metadata = 'objects'
 
@@ -17,7 +27,9 @@ class ObjectsManager:
 
     def __init__(self, n_sets=2, dump=None):
         self.n_sets = None
-        self.objects = None
+        self._sets = None
+        self._filenames = None
+        self._keys = None
         if dump is None:
             self._init_empty(n_sets)
         else:
@@ -25,7 +37,9 @@ class ObjectsManager:
 
     def _init_empty(self, n_sets):
         self.n_sets = self._validate_n_sets(n_sets)
-        self.objects = []
+        self._sets = [[] for _ in range(self.n_sets)]
+        self._filenames = []
+        self._keys = Counter()
 
     def _init_from_dump(self, dump):
         sets = dump.get(self.metadata)
@@ -34,10 +48,18 @@ class ObjectsManager:
         if not isinstance(sets, list):
             raise TypeError('objects key has an invalid value type')
         self.n_sets = self._validate_n_sets(len(sets))
-        self.objects = [tuple(Object(obj) for obj in objs)
-                        for objs in zip(*sets)]
+        # Sets are cut to the shortest one, since an object must be
+        # in all sets.
+        n_objects = min(len(objs) for objs in sets)
+        self._sets = [[Object(obj) for obj in objs[:n_objects]]
+                      for objs in sets]
         self.sort()
 
+    @property
+    def objects(self):
+        """Returns a tuple of the objects in each set, for each object."""
+        return list(zip(*self._sets))
+
     def _validate_n_sets(self, n_sets):
         if n_sets < self.MIN_N_SETS or n_sets > self.MAX_N_SETS:
             error = ('It is only possible to have between '
@@ -45,30 +67,82 @@ class ObjectsManager:
             raise ValueError(error.format(self.MIN_N_SETS, self.MAX_N_SETS))
         return n_sets
 
-    def load(self, callback=None):
+    def load(self, callback=None, analyzed=None):
         call(callback, 'start_objects_load')
         for obj in self.all():
-            obj.load(callback=callback)
+            obj.load(callback=callback, analyzed=analyzed)
         call(callback, 'finish_objects_load')
 
-    def _check_duplicate_object_entry(self, options):
-        for obj in self.objects:
-            metadata = [{'filename': entry.filename,
-                         'mode': entry.mode}
-                        for entry in obj]
-            for meta in metadata:
-                if meta['filename'] == options['filename'] and \
-                   meta['mode'] == options['mode']:
-                    raise DuplicateObjectEntryError("Object duplicate.")
+    def _check_duplicate_object_entry(self, entry):
+        for obj in entry:
+            if self._keys[(obj.filename, obj.mode)]:
+                raise DuplicateObjectEntryError("Object duplicate.")
+
+    def _insert(self, entry):
+        """Inserts entry keeping objects sorted and returns its index."""
+        filename = entry[0].filename
+        obj_index = bisect_right(self._filenames, filename)
+        self._filenames.insert(obj_index, filename)
+        for objs, obj in zip(self._sets, entry):
+            objs.insert(obj_index, obj)
+        self._keys.update((obj.filename, obj.mode) for obj in entry)
+        return obj_index
+
+    def _pop(self, obj_index):
+        """Removes an object from all sets and returns its entry."""
+        self._filenames.pop(obj_index)
+        entry = [objs.pop(obj_index) for objs in self._sets]
+        for obj in entry:
+            key = (obj.filename, obj.mode)
+            self._keys[key] -= 1
+            if not self._keys[key]:
+                del self._keys[key]
+        return entry
 
     def create(self, options):
         """Creates a new object in all installation sets."""
         normalized_options = self._normalize_create_options_values(options)
         entry = self._create_object_entry(normalized_options)
-        self._check_duplicate_object_entry(options)
-        self.objects.append(entry)
+        self._check_duplicate_object_entry(entry)
+        return self._insert(entry)
+
+    def create_many(self, options_list):
+        """Creates many objects in all installation sets at once.
+
+        Either all objects are created or, if any of them is invalid
+        or duplicated, none is. Objects are sorted only once, after
+        all of them are validated. Returns the indexes of the created
+        objects.
+        """
+        entries = []
+        keys = Counter()
+        for options in options_list:
+            normalized_options = self._normalize_create_options_values(
+                options)
+            entry = self._create_object_entry(normalized_options)
+            self._check_duplicate_object_entry(entry)
+            entry_keys = {(obj.filename, obj.mode) for obj in entry}
+            if any(keys[key] for key in entry_keys):
+                raise DuplicateObjectEntryError("Object duplicate.")
+            keys.update(entry_keys)
+            entries.append(entry)
+        for set_index, objs in enumerate(self._sets):
+            objs.extend(entry[set_index] for entry in entries)
         self.sort()
-        return self.objects.index(entry)
+        indexes = {id(obj): obj_index
+                   for obj_index, obj in enumerate(self._sets[0])}
+        return [indexes[id(entry[0])] for entry in entries]
+
+    def find(self, filename, mode=None):
+        """Returns the indexes of the objects of a given filename.
+
+        Only the filename of the first installation set is considered.
+        If mode is given, only objects of that mode are returned.
+        """
+        start = bisect_left(self._filenames, filename)
+        end = bisect_right(self._filenames, filename, lo=start)
+        return [obj_index for obj_index in range(start, end)
+                if mode is None or self._sets[0][obj_index].mode == mode]
 
     def _normalize_create_options_values(self, options):
         """Returns a tuple of options with n_sets size."""
@@ -91,50 +165,63 @@ class ObjectsManager:
     def get(self, obj_index, set_index):
         """Retrives an object from an given installation set."""
         try:
-            return self.objects[obj_index][set_index]
+            return self._sets[set_index][obj_index]
         except IndexError:
             raise ValueError('Object not found')
 
     def update(self, obj_index, option, value, set_index=None):
         """Updates an object option value."""
         option = Options.get(option)
-        if option.symmetric:
+        if option.metadata == 'filename':
+            # Changing the filename may change where the object belongs
+            entry = self._pop(obj_index)
+            try:
+                for obj in entry:
+                    obj.update(option.metadata, value)
+            finally:
+                self._insert(entry)
+        elif option.symmetric:
             self._update_symmetric_option(obj_index, option, value)
         else:
             self._update_asymmetric_option(obj_index, set_index, option, value)
 
     def _update_symmetric_option(self, obj_index, option, value):
-        for obj in self.objects[obj_index]:
-            obj.update(option.metadata, value)
+        for objs in self._sets:
+            objs[obj_index].update(option.metadata, value)
 
     def _update_asymmetric_option(self, obj_index, set_index, option, value):
         if set_index is None:
             error = 'You must specify an installation set for this option'
             raise ValueError(error)
-        obj = self.objects[obj_index][set_index]
+        obj = self._sets[set_index][obj_index]
         obj.update(option.metadata, value)
 
     def remove(self, obj_index):
         """Removes an object from all sets."""
         try:
-            self.objects.pop(obj_index)
+            self._pop(obj_index)
         except IndexError:
             raise ValueError('Object not found')
 
     def all(self):
         """Returns all objects from all sets."""
-        return list(chain.from_iterable(self.objects))
+        return list(chain.from_iterable(zip(*self._sets)))
 
     def sort(self):
-        self.objects.sort(key=lambda objs: objs[0].filename)
+        first = self._sets[0]
+        order = sorted(range(len(first)), key=lambda i: first[i].filename)
+        self._sets = [[objs[i] for i in order] for objs in self._sets]
+        self._filenames = [obj.filename for obj in self._sets[0]]
+        self._keys = Counter(
+            (obj.filename, obj.mode) for obj in self.all())
 
     def is_single(self):
         """Checks if it is single mode."""
         return self.n_sets == 1
 
-    def to_metadata(self, callback=None):
+    def to_metadata(self, callback=None, analyzed=None, md5=False):
         sets = self._to_list_of_sets()
-        objects = [[obj.to_metadata(callback) for obj in set_]
+        objects = [[obj.to_metadata(callback, analyzed, md5) for obj in set_]
                    for set_ in sets]
         return {self.metadata: objects}
 
@@ -149,11 +236,26 @@ class ObjectsManager:
         return objects
 
     def _to_list_of_sets(self):
-        return [[objs[set_index] for objs in self.objects]
-                for set_index in range(self.n_sets)]
+        return self._sets
+
+    def equals(self, other, content=False):
+        """Checks if other manager has the same objects.
+
+        Objects are compared by their options, so no file is read
+        unless content is True (see BaseObject.equals).
+        """
+        if self.n_sets != other.n_sets:
+            return False
+        if len(self[0]) != len(other[0]):
+            return False
+        analyzed = {} if content else None
+        return all(obj.equals(other_obj, content, analyzed)
+                   for obj, other_obj in zip(self.all(), other.all()))
 
     def __eq__(self, other):
-        return self.to_metadata() == other.to_metadata()
+        if not isinstance(other, ObjectsManager):
+            return NotImplemented
+        return self.equals(other)
 
     def __getitem__(self, set_index):
         """Returns an installation set."""
@@ -161,13 +263,13 @@ class ObjectsManager:
             raise TypeError('Installation set index must be a integer')
         if set_index < 0 or set_index > self.n_sets:
             raise IndexError('Installation set not found')
-        return [objs[set_index] for objs in self.objects]
+        return list(self._sets[set_index])
 
     def __len__(self):
         return self.n_sets
 
     def __str__(self):
-        if not self.all():
+        if not self._sets[0]:
             return 'Objects: None'
         sets = self._to_list_of_sets()
         lst = [self._objects_to_str(objects) for objects in sets]
@@ -1,8 +1,6 @@
 # Copyright (C) 2017 O.S. Systems Software LTDA.
 # SPDX-License-Identifier: GPL-2.0
 
-from humanize.filesize import naturalsize
-
 from ._options import (
     AbsolutePathOption, BooleanOption, IntegerOption, StringOption)
 
@@ -32,6 +30,7 @@ class ChunkSizeOption(IntegerOption):
 
     @classmethod
     def humanize(cls, value):
+        from humanize.filesize import naturalsize
         return naturalsize(value, binary=True)
 
 
@@ -99,6 +98,7 @@ class MountOptionsOption(StringOption):
     help = 'Options to mount the filesystem in target-device'
     cli = ['--mount-options']
     verbose_name = 'Mount options'
+    interned = True
 
 
 class Padding1koption(BooleanOption):
@@ -149,6 +149,7 @@ class TargetOption(StringOption):
     cli = ['--target', '-t']
     help = 'The target itself'
     verbose_name = 'Target'
+    interned = True
 
     @classmethod
     def humanize(cls, value):
@@ -160,6 +161,7 @@ class TargetTypeOption(StringOption):
     cli = ['--target-type', '-tt']
     help = 'The type of target'
     verbose_name = 'Target type'
+    interned = True
 
     @classmethod
     def get_choices(cls, obj):
@@ -1,7 +1,6 @@
 # Copyright (C) 2017 O.S. Systems Software LTDA.
 # SPDX-License-Identifier: GPL-2.0
 
-from uhu.updatehub.api import push_package
 from uhu.utils import call
 
 from .hardware import SupportedHardwareManager
@@ -24,14 +23,19 @@ class Package:
             self.supported_hardware = SupportedHardwareManager(dump=dump)
         self.uid = None
 
-    def to_metadata(self, callback=None):
-        """Serialize package as metadata."""
+    def to_metadata(self, callback=None, analyzed=None, md5=False):
+        """Serialize package as metadata.
+
+        analyzed is an optional dict of already analyzed object files
+        and md5 tells if the MD5 of objects must be computed too (see
+        BaseObject.load).
+        """
         metadata = {
             'product': self.product,
             'version': self.version,
         }
         metadata.update(self.supported_hardware.to_metadata())
-        metadata.update(self.objects.to_metadata(callback))
+        metadata.update(self.objects.to_metadata(callback, analyzed, md5))
         return metadata
 
     def to_template(self, with_version=True):
@@ -42,13 +46,39 @@ class Package:
         template.update(self.supported_hardware.to_template())
         return template
 
-    def push(self, callback=None):
-        """Uploads package to UpdateHub server."""
+    def equals(self, other, content=False):
+        """Checks if other package is the same.
+
+        Object files are not read unless content is True (see
+        ObjectsManager.equals).
+        """
+        return (self.product == other.product and
+                self.version == other.version and
+                self.supported_hardware == other.supported_hardware and
+                self.objects.equals(other.objects, content))
+
+    def __eq__(self, other):
+        if not isinstance(other, Package):
+            return NotImplemented
+        return self.equals(other)
+
+    # Packages are mutable, so equal packages can not share a hash
+    __hash__ = None
+
+    def push(self, callback=None, resume=False):
+        """Uploads package to UpdateHub server.
+
+        If resume is True, an interrupted push of this same package is
+        continued.
+        """
+        from uhu.updatehub.engine import run_push
         call(callback, 'start_objects_load')
-        metadata = self.to_metadata(callback)
+        # Installation sets usually share files, so each one is read
+        # once, computing the MD5 that upload may need in the same read
+        metadata = self.to_metadata(callback, analyzed={}, md5=True)
         call(callback, 'finish_objects_load')
         objects = self.objects.to_upload()
-        self.uid = push_package(metadata, objects, callback)
+        self.uid = run_push(metadata, objects, callback, resume=resume)
         return self.uid
 
     def __str__(self):
@@ -58,3 +88,31 @@ class Package:
             str(self.supported_hardware),
             str(self.objects),
         ])
+
+
+def push_packages(packages, callback=None, resume=False):
+    """Uploads many packages to UpdateHub server at once.
+
+    Files shared by packages are read and uploaded only once. The UID
+    of each pushed package is set even if others fail, in which case
+    UpdateHubError is raised after all pushes end.
+    """
+    from uhu.updatehub.api import UpdateHubError
+    from uhu.updatehub.engine import run_push_many
+    analyzed = {}
+    call(callback, 'start_objects_load')
+    pushes = [(package.to_metadata(callback, analyzed, md5=True),
+               package.objects.to_upload()) for package in packages]
+    call(callback, 'finish_objects_load')
+    results = run_push_many(pushes, callback, resume=resume)
+    errors = []
+    for package, result in zip(packages, results):
+        if isinstance(result, UpdateHubError):
+            errors.append('{} {}: {}'.format(
+                package.product, package.version, result))
+        else:
+            package.uid = result
+    if errors:
+        raise UpdateHubError('Could not push {} of {} packages:\n{}'.format(
+            len(errors), len(packages), '\n'.join(errors)))
+    return [package.uid for package in packages]
@@ -0,0 +1,206 @@
+# Copyright (C) 2017 O.S. Systems Software LTDA.
+# SPDX-License-Identifier: GPL-2.0
+
+import errno
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # pylint: disable=invalid-name
+
+from ..utils import get_object_store_dir
+
+
+# ioctl request to clone a file (FICLONE from linux/fs.h)
+FICLONE = 0x40049409
+
+
+def reflink(src, dst):
+    """Creates dst as a copy-on-write clone of src.
+
+    Raises OSError if the platform or the filesystem does not support
+    reflinks (e.g. ext4 or src and dst in different filesystems).
+    """
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, 'Reflinks are not supported.')
+    with open(src, 'rb') as src_fp, open(dst, 'wb') as dst_fp:
+        try:
+            fcntl.ioctl(dst_fp.fileno(), FICLONE, src_fp.fileno())
+        except OSError:
+            os.remove(dst)
+            raise
+
+
+def link_file(src, dst, hardlink=True, copy=True):
+    """Creates dst with src content using the cheapest available method.
+
+    A reflink is tried first, then a hard link (unless hardlink is
+    False) and, finally, a plain copy. Returns the name of the method
+    used or, if copy is False and src can not be linked, None.
+    """
+    try:
+        reflink(src, dst)
+        return 'reflink'
+    except OSError:
+        pass
+    if hardlink:
+        try:
+            os.link(src, dst)
+            return 'hardlink'
+        except OSError:
+            pass
+    if not copy:
+        return None
+    shutil.copyfile(src, dst)
+    return 'copy'
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return '{} {} {}'.format(stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+class ObjectStore:
+    """Content-addressed local store of object files.
+
+    Files are saved under its sha256sum, so a given content is only
+    stored (and read) once no matter how many objects or packages
+    refer to it.
+
+    Since hard linked files share their content with the original
+    file, the store keeps the size and modification time of them. A
+    hard linked file modified after its ingestion is considered stale
+    and it is never returned by the store. Files that can not be
+    linked are not stored at all, since copying them would cost as
+    much as reading them.
+
+    The store also indexes the sha256sum of every added file by its
+    path and fingerprint, so an unchanged file is not hashed again in
+    later runs (see lookup).
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _get_path(self, sha256sum):
+        return os.path.join(self.path, sha256sum)
+
+    def _get_fingerprint_path(self, sha256sum):
+        return os.path.join(self.path, '.{}.stat'.format(sha256sum))
+
+    def _get_index_path(self, filename):
+        key = hashlib.sha256(os.fsencode(filename)).hexdigest()
+        return os.path.join(self.path, '.index', key)
+
+    def lookup(self, filename):
+        """Returns the analysis of a file added before, if unchanged.
+
+        The analysis is a dict with the size, sha256sum and md5 (None
+        if it was not known) of the file. Returns None if the file was
+        never added or it was changed since then.
+        """
+        filename = os.path.realpath(filename)
+        try:
+            with open(self._get_index_path(filename)) as fp:
+                entry = json.load(fp)
+            if entry['filename'] != filename or \
+               entry['fingerprint'] != _fingerprint(filename):
+                return None
+            return {'size': entry['size'], 'sha256sum': entry['sha256sum'],
+                    'md5': entry.get('md5')}
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _index(self, filename, sha256sum, md5):
+        analysis = self.lookup(filename)
+        if analysis is not None and analysis['sha256sum'] == sha256sum and \
+           (md5 is None or analysis['md5'] == md5):
+            return
+        filename = os.path.realpath(filename)
+        path = self._get_index_path(filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        descriptor, tmp = tempfile.mkstemp(
+            dir=os.path.dirname(path), prefix='.tmp-')
+        with os.fdopen(descriptor, 'w') as fp:
+            json.dump({
+                'filename': filename,
+                'fingerprint': _fingerprint(filename),
+                'size': os.path.getsize(filename),
+                'sha256sum': sha256sum,
+                'md5': md5,
+            }, fp)
+        os.replace(tmp, path)
+
+    def _is_stale(self, sha256sum):
+        try:
+            with open(self._get_fingerprint_path(sha256sum)) as fp:
+                fingerprint = fp.read()
+        except FileNotFoundError:
+            return False  # not hard linked, it can't be changed
+        return fingerprint != _fingerprint(self._get_path(sha256sum))
+
+    def get(self, sha256sum):
+        """Returns the stored file path for a given sha256sum.
+
+        Returns None if there is no valid file for sha256sum.
+        """
+        path = self._get_path(sha256sum)
+        if not os.path.isfile(path) or self._is_stale(sha256sum):
+            return None
+        return path
+
+    def add(self, filename, sha256sum, md5=None):
+        """Ingests a file into the store. Returns the stored file path.
+
+        sha256sum (and md5, if given) must be the already computed hash
+        of filename. If filename can not be linked into the store,
+        nothing is stored and None is returned.
+        """
+        self._index(filename, sha256sum, md5)
+        path = self.get(sha256sum)
+        if path is not None:
+            return path
+        self.remove(sha256sum)
+        os.makedirs(self.path, exist_ok=True)
+        descriptor, tmp = tempfile.mkstemp(dir=self.path, prefix='.tmp-')
+        os.close(descriptor)
+        os.remove(tmp)
+        try:
+            method = link_file(os.path.realpath(filename), tmp, copy=False)
+            if method is None:
+                return None
+            if method == 'hardlink':
+                with open(self._get_fingerprint_path(sha256sum), 'w') as fp:
+                    fp.write(_fingerprint(tmp))
+            os.replace(tmp, self._get_path(sha256sum))
+        except OSError:
+            self.remove(sha256sum)
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return self._get_path(sha256sum)
+
+    def remove(self, sha256sum):
+        """Removes a file from the store, if present."""
+        for path in (self._get_path(sha256sum),
+                     self._get_fingerprint_path(sha256sum)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def __contains__(self, sha256sum):
+        return self.get(sha256sum) is not None
+
+
+def get_object_store():
+    """Returns the user object store or None if it is disabled."""
+    path = get_object_store_dir()
+    if not path:
+        return None
+    return ObjectStore(os.path.expanduser(path))
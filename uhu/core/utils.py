@@ -1,17 +1,20 @@
 # Copyright (C) 2017 O.S. Systems Software LTDA.
 # SPDX-License-Identifier: GPL-2.0
 
+import csv
 import json
 import os
+import posixpath
+import re
+import shutil
 import zipfile
 from collections import OrderedDict
 
-import pkgschema
-
 from ..config import config
 from ..utils import sign_dict
 
 from .package import Package
+from .store import link_file
 
 
 def dump_package(package, fn):
@@ -28,21 +31,68 @@ def load_package(fn):
     return Package(dump=dump)
 
 
+def load_objects_manifest(fn):
+    """Loads the options of the objects listed in a manifest file.
+
+    Manifests are JSON files with a list of objects options or CSV
+    files (.csv) with a header of options names and an object per
+    row. In JSON manifests, an asymmetric option may have a list of
+    values, one for each installation set.
+    """
+    with open(fn, newline='') as fp:
+        if fn.lower().endswith('.csv'):
+            objects = [{key: value for key, value in row.items()
+                        if key is not None and value}
+                       for row in csv.DictReader(fp)]
+        else:
+            objects = json.load(fp)
+    if not isinstance(objects, list) or \
+            not all(isinstance(obj, dict) for obj in objects):
+        raise ValueError('Manifest must be a list of objects.')
+    for obj in objects:
+        if 'filename' not in obj or 'mode' not in obj:
+            raise ValueError('Every object must have filename and mode.')
+    return [{key: tuple(value) if isinstance(value, list) else value
+             for key, value in obj.items()} for obj in objects]
+
+
+def list_directory_objects(directory, options, target_path_prefix=None):
+    """Returns the options of an object for each file within directory.
+
+    Files are listed recursively and all objects share options. If
+    target_path_prefix is given, the target path of each object is
+    the file path within directory under this prefix.
+    """
+    objects = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            obj = dict(options)
+            obj['filename'] = os.path.join(root, name)
+            if target_path_prefix is not None:
+                path = os.path.relpath(obj['filename'], directory)
+                obj['target-path'] = posixpath.join(
+                    target_path_prefix, *path.split(os.sep))
+            objects.append(obj)
+    return objects
+
+
 def _generate_archive_name(package, output):
     if output is not None:
         return output
     return '{0.product}-{0.version}.uhupkg'.format(package)
 
 
-def dump_package_archive(package, output=None, force=False):
-    """Saves package as an archive. Returns genereted archive filename.
+def _generate_directory_name(package, output):
+    if output is not None:
+        return output
+    return '{0.product}-{0.version}'.format(package)
 
-    Generated archive is a gz compressed tar file with current package
-    metadata and all objects files.
 
-    All objects are renamed to its hash and moved to the archive
-    root. Objects are included without duplication and links are
-    resolved.
+def _prepare_archive(package):
+    """Checks if package can be archived.
+
+    Returns the package metadata and its signature.
     """
     # Checks minimum package requirements
     if package.version is None:
@@ -52,11 +102,38 @@ def dump_package_archive(package, output=None, force=False):
     if not package.objects.all():
         raise ValueError('Cannot generate archive without objects.')
     # Checks metadata complience
+    import pkgschema
     metadata = package.to_metadata()
     try:
         pkgschema.validate_metadata(metadata)
     except pkgschema.ValidationError:
         raise ValueError('Cannot generate archive with invalid metadata.')
+    signature = sign_dict(metadata, config.get_private_key_path())
+    return metadata, signature
+
+
+def _archive_objects(package):
+    """Yields the sha256sum and source file of each unique object."""
+    cache = set()
+    for obj in package.objects.all():
+        sha256sum = obj['sha256sum']
+        if sha256sum in cache:
+            continue
+        cache.add(sha256sum)
+        yield sha256sum, os.path.realpath(obj.source)
+
+
+def dump_package_archive(package, output=None, force=False):
+    """Saves package as an archive. Returns genereted archive filename.
+
+    Generated archive is a gz compressed tar file with current package
+    metadata and all objects files.
+
+    All objects are renamed to its hash and moved to the archive
+    root. Objects are included without duplication and links are
+    resolved.
+    """
+    metadata, signature = _prepare_archive(package)
 
     # Checks archive output
     output = _generate_archive_name(package, output)
@@ -64,8 +141,6 @@ def dump_package_archive(package, output=None, force=False):
         raise FileExistsError('Archive "{}" already exists.'.format(output))
 
     # Writes archive
-    cache = set()
-    signature = sign_dict(metadata, config.get_private_key_path())
     metadata = json.dumps(metadata, sort_keys=True)
     with zipfile.ZipFile(output, mode='w') as archive:
         if signature is None:
@@ -73,10 +148,55 @@ def dump_package_archive(package, output=None, force=False):
         else:
             archive.writestr('signature', signature)
         archive.writestr('metadata', metadata)
-        for obj in package.objects.all():
-            sha256sum = obj['sha256sum']
-            if sha256sum in cache:
-                continue
-            cache.add(sha256sum)
-            archive.write(os.path.realpath(obj.filename), sha256sum)
+        for sha256sum, source in _archive_objects(package):
+            archive.write(source, sha256sum)
+    return output
+
+
+def _is_package_directory(path):
+    """Checks if directory only has files of a package directory."""
+    for name in os.listdir(path):
+        if name not in ('metadata', 'signature') and \
+                not re.match(r'^[0-9a-f]{64}$', name):
+            return False
+    return True
+
+
+def dump_package_directory(package, output=None, force=False):
+    """Saves package as a directory. Returns generated directory name.
+
+    Generated directory has the same layout of the archive generated
+    by dump_package_archive: the package metadata, its signature and
+    all objects files named by its hash.
+
+    Objects are reflinked when possible, so its content is not
+    copied. They are never hard linked, since changing the original
+    file would change the archive too. If force is True, an existing
+    output is replaced, but only if it is a file or a package
+    directory.
+    """
+    metadata, signature = _prepare_archive(package)
+
+    # Checks directory output
+    output = _generate_directory_name(package, output)
+    if os.path.exists(output):
+        if not force:
+            err = 'Directory "{}" already exists.'
+            raise FileExistsError(err.format(output))
+        if os.path.isdir(output):
+            if not _is_package_directory(output):
+                err = 'Directory "{}" is not a package archive.'
+                raise FileExistsError(err.format(output))
+            shutil.rmtree(output)
+        else:
+            os.remove(output)
+
+    # Writes directory
+    os.makedirs(output)
+    with open(os.path.join(output, 'signature'), 'w') as fp:
+        fp.write('' if signature is None else signature)
+    with open(os.path.join(output, 'metadata'), 'w') as fp:
+        fp.write(json.dumps(metadata, sort_keys=True))
+    for sha256sum, source in _archive_objects(package):
+        link_file(source, os.path.join(output, sha256sum), hardlink=False)
     return output
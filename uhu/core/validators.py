@@ -1,7 +1,8 @@
 # Copyright (C) 2017 O.S. Systems Software LTDA.
 # SPDX-License-Identifier: GPL-2.0
 
-from copy import deepcopy
+from collections import ChainMap
+from itertools import chain
 
 from ._options import OptionType, Options
 from .install_condition import normalize_install_if_different
@@ -33,6 +34,7 @@ def inject_default_values(obj, values):
     return values
 
 
+# pylint: disable=unused-argument
 def inject_default_value(obj, option, values):
     """Adds the default value for a given option.
 
@@ -58,27 +60,37 @@ def inject_default_value(obj, option, values):
     satisfied). In case of invalid data, we must return the
     original values.
     """
-    # We need a copy of the passed values since dicts are passed
-    # by reference between function calls and we need be able to
-    # return the original values in case of invalid data.
-    original_values = deepcopy(values)
+    defaults = get_default_values(option, values)
+    if defaults:
+        values.update(defaults)
+    return values
+
 
+def get_default_values(option, values):
+    """Returns the defaults that inject_default_value would add.
+
+    Defaults are collected apart from values (instead of added to a
+    copy of values), so nothing must be undone in case of invalid
+    data.
+    """
     # Option default value injection step
-    if option not in values and option.default is not None:
-        values[option] = option.default
-    else:
-        return original_values
+    if option in values or option.default is None:
+        return None
+    defaults = {option: option.default}
+    current = ChainMap(defaults, values)
 
     # Requirements default values injection step (recursive part)
     for req in option.requirements:
-        values = inject_default_value(obj, req, values)
+        req_defaults = get_default_values(req, current)
+        if req_defaults:
+            defaults.update(req_defaults)
 
     # Validation step
     try:
-        validate_option_requirements(option, values)
+        check_option_requirements(option, current)
     except ValueError:
-        return original_values
-    return values
+        return None
+    return defaults
 
 
 def validate_required_options(obj, values):
@@ -102,7 +114,11 @@ def validate_option_requirements(option, values):
         if not isinstance(key, OptionType):
             err = 'values argument must have OptionType keys type (got {}).'
             raise TypeError(err.format(type(key)))
+    check_option_requirements(option, values)
 
+
+def check_option_requirements(option, values):
+    """Same as validate_option_requirements, without type checking."""
     if not option.requirements:
         return
 
@@ -121,9 +137,117 @@ def validate_option_requirements(option, values):
 
 def validate_options(obj, values):
     """Performs full object validation"""
-    values = normalize_install_if_different(values)
-    values = normalize(obj, values)
-    values = inject_default_values(obj, values)
-    validate_required_options(obj, values)
-    validate_options_requirements(values)
-    return values
+    return obj.validator.validate(values)
+
+
+class OptionsValidator:
+    """Full object validation, compiled for a given mode.
+
+    The options tables of the mode are built once, when the mode class
+    is created. Then, validation is the same of normalize,
+    inject_default_values, validate_required_options and
+    validate_options_requirements, in this order, but without option
+    lookups by name or copies of values.
+
+    It can also validate a single option change (see change) by
+    checking again only what the changed option may affect.
+    """
+
+    def __init__(self, obj_class):
+        self.mode = obj_class.mode
+        self.options = {option.metadata: option
+                        for option in obj_class.options}
+        self.defaults = [option for option in obj_class.options
+                         if option.default is not None]
+        self.required_options = tuple(obj_class.required_options)
+        # Options that a default injection may look at, for each
+        # option with a default.
+        self.default_requirements = {
+            option: get_requirements_closure(option)
+            for option in self.defaults}
+        # Options that are free of defaults and requirements (like
+        # size and sha256sum), so changing them affects nothing else.
+        required = set(chain.from_iterable(
+            option.requirements for option in obj_class.options))
+        self.unconstrained = frozenset(
+            option for option in obj_class.options
+            if not option.requirements and option.default is None and
+            option not in required and
+            option not in self.required_options)
+
+    def normalize(self, values):
+        cleaned = {}
+        for key, value in values.items():
+            option = self.options.get(key)
+            if option is None:
+                option = Options.get(key)  # raises error if not registered
+                if value is not None:
+                    err = '{} is a invalid option for {} mode'
+                    raise ValueError(err.format(option, self.mode))
+            elif value is not None:
+                cleaned[option] = option.validate(value)
+        return cleaned
+
+    def validate(self, values):
+        values = self.normalize(normalize_install_if_different(values))
+        for option in self.defaults:
+            defaults = get_default_values(option, values)
+            if defaults:
+                values.update(defaults)
+        for option in self.required_options:
+            if option not in values:
+                err = 'Option "{}" is required for mode "{}".'
+                raise ValueError(err.format(option, self.mode))
+        for option in values:
+            check_option_requirements(option, values)
+        return values
+
+    def change(self, values, option, value):
+        """Returns valid values with option changed to value.
+
+        values must be valid and value already converted by option
+        (None removes option). The result is the same of validating
+        all changed values, but only option, the defaults that depend
+        on it and the options that require it are checked again.
+        """
+        if option.metadata not in self.options:
+            if value is not None:
+                err = '{} is a invalid option for {} mode'
+                raise ValueError(err.format(option, self.mode))
+            return values
+        values = dict(values)
+        if value is None:
+            values.pop(option, None)
+        else:
+            values[option] = value
+        if option in self.unconstrained:
+            return values
+        changed = {option}
+        for default in self.defaults:
+            if default in values:
+                continue
+            if default is option or \
+                    not changed.isdisjoint(self.default_requirements[default]):
+                defaults = get_default_values(default, values)
+                if defaults:
+                    values.update(defaults)
+                    changed.update(defaults)
+        if option in self.required_options and option not in values:
+            err = 'Option "{}" is required for mode "{}".'
+            raise ValueError(err.format(option, self.mode))
+        for opt in values:
+            if opt in changed or not changed.isdisjoint(opt.requirements):
+                check_option_requirements(opt, values)
+        return values
+
+
+def get_requirements_closure(option):
+    """Returns option requirements and their requirements (and so on)."""
+    closure = set()
+    pending = [option]
+    while pending:
+        for req in pending.pop().requirements:
+            if req not in closure:
+                closure.add(req)
+                pending.append(req)
+    return closure
@@ -3,45 +3,99 @@
 
 import math
 import sys
+import threading
+import time
 
 from progress.spinner import Spinner
 from progress.bar import Bar
 
 
 class BaseCallback:
+    """Base class of the push progress user interfaces.
 
-    def __init__(self):
-        self.uploading = False
-        self.max = None
+    Progress is reported in bytes, by the progress event, from any
+    number of threads. Reported bytes are added up and passed to the
+    *_progress_callback methods at most every refresh_interval
+    seconds, so a fast stream of small reports does not flood the
+    interface.
+    """
 
-    def object_read(self, n_steps=1):
-        """Calls self._object_read for n_steps needed."""
-        for _ in range(n_steps):
-            self._object_read()
+    refresh_interval = 0.1  # seconds
 
-    def _object_read(self):
+    def __init__(self, clock=time.monotonic):
+        self.uploading = False
+        self.max = None
+        self.current = 0
+        self._pending = 0
+        self._refreshed_at = None
+        self._clock = clock
+        self._lock = threading.RLock()
+
+    def progress(self, nbytes):
+        """Reports that nbytes were read or uploaded."""
+        with self._lock:
+            self._pending += nbytes
+            now = self._clock()
+            if self._refreshed_at is not None and \
+                    now - self._refreshed_at < self.refresh_interval:
+                return
+            self._refresh(now)
+
+    def flush(self):
+        """Passes on bytes not reported yet."""
+        with self._lock:
+            if self._pending:
+                self._refresh(self._clock())
+
+    def _refresh(self, now):
+        nbytes, self._pending = self._pending, 0
+        self._refreshed_at = now
+        self.current += nbytes
         if self.uploading:
-            self.object_read_upload_callback()
+            self.upload_progress_callback(nbytes)
         else:
-            self.object_read_load_callback()
+            self.load_progress_callback(nbytes)
+
+    def start_objects_load(self):
+        with self._lock:
+            self.current = 0
+            self._refreshed_at = None
+            self.start_objects_load_callback()
+
+    def finish_objects_load(self):
+        with self._lock:
+            self.flush()
+            self.finish_objects_load_callback()
 
     def start_package_upload(self, objects):
-        self.uploading = True
-        self.max = sum(obj['chunks'] for obj in objects)
-        self.start_package_upload_callback()
+        with self._lock:
+            self.flush()
+            self.uploading = True
+            self.current = 0
+            self._refreshed_at = None
+            self.max = sum(obj['size'] for obj in objects)
+            self.start_package_upload_callback()
 
     def finish_package_upload(self):
-        self.uploading = False
-        self.finish_package_upload_callback()
+        with self._lock:
+            self.flush()
+            self.uploading = False
+            self.finish_package_upload_callback()
 
     def push_finish(self, uid):  # pylint: disable=no-self-use
         print('Finished! Your package UID is {}'.format(uid))
 
-    def object_read_load_callback(self):
-        """Must be called when reading object during loading process."""
+    def start_objects_load_callback(self):
+        """Must be called when starting loading objects."""
+
+    def load_progress_callback(self, nbytes):
+        """Must be called when nbytes were read while loading."""
+
+    def finish_objects_load_callback(self):
+        """Must be called when finished loading objects."""
 
-    def object_read_upload_callback(self):
-        """Must be called when reading object during upload process."""
+    def upload_progress_callback(self, nbytes):
+        """Must be called when nbytes were uploaded."""
 
     def start_package_upload_callback(self):
         """Must be called when starting package upload process."""
@@ -52,27 +106,28 @@ class BaseCallback:
 
 class TTYCallback(BaseCallback):
 
-    def __init__(self):
-        super().__init__()
-        self.progress = None
-
-    def start_objects_load(self):
-        self.progress = Spinner('Loading objects: ')
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.progress_bar = None
 
-    def object_read_load_callback(self):
-        self.progress.next()
+    def start_objects_load_callback(self):
+        self.progress_bar = Spinner('Loading objects: ')
 
-    def object_read_upload_callback(self):
-        self.progress.next()
+    def load_progress_callback(self, nbytes):
+        self.progress_bar.next()
 
-    def finish_objects_load(self):
-        self.progress.finish()
+    def finish_objects_load_callback(self):
+        self.progress_bar.finish()
         print('\rLoading objects: ok')
         print('Starting uploading objects...', end='', flush=True)
 
     def start_package_upload_callback(self):
         suffix = '%(percent)d%% ETA: %(eta)ds'
-        self.progress = Bar('Uploading objects:', max=self.max, suffix=suffix)
+        self.progress_bar = Bar(
+            'Uploading objects:', max=max(self.max, 1), suffix=suffix)
+
+    def upload_progress_callback(self, nbytes):
+        self.progress_bar.next(nbytes)
 
     def finish_package_upload_callback(self):
         print('\033[1K\rUploading objects: ok')
@@ -80,17 +135,17 @@ class TTYCallback(BaseCallback):
 
 class NoTTYCallback(BaseCallback):
 
-    def __init__(self):
-        super().__init__()
-        self.current = 0
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
         self.coeficient = 5
         self.next_step = 0
 
-    def start_objects_load(self):  # pylint: disable=no-self-use
+    def start_objects_load_callback(self):  # pylint: disable=no-self-use
         print('Loading objects: ', end='', flush=True)
 
-    def object_read_upload_callback(self):
-        self.current += 1
+    def upload_progress_callback(self, nbytes):
+        if not self.max:
+            return
         progress = math.floor((self.current / self.max) * 100)
         if progress >= self.next_step:
             steps = progress // self.coeficient
@@ -99,10 +154,11 @@ class NoTTYCallback(BaseCallback):
                 print('{}% '.format(step), end='', flush=True)
             self.next_step = until
 
-    def finish_objects_load(self):  # pylint: disable=no-self-use
+    def finish_objects_load_callback(self):  # pylint: disable=no-self-use
         print('ok', flush=True)
 
     def start_package_upload_callback(self):
+        self.next_step = 0
         print('Uploading objects:', flush=True)
 
     def finish_package_upload_callback(self):
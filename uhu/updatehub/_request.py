@@ -92,10 +92,16 @@ class Request:
         """
         return {header: str(self.headers[header]) for header in self.headers}
 
-    def send(self):
+    def send(self, session=None):
+        """Signs and sends the request.
+
+        If a session is given, the request reuses its pooled
+        connections.
+        """
         self._sign()
         headers = self._prepare_headers()
-        response = requests.request(
+        sender = requests if session is None else session
+        response = sender.request(
             self.method,
             self.url,
             headers=headers,
@@ -2,52 +2,74 @@
 # SPDX-License-Identifier: GPL-2.0
 
 import json
-import os
+import threading
 from enum import Enum
 
 from pkgschema import validate_metadata, ValidationError
 
 from uhu.config import config
-from uhu.utils import call, get_server_url, get_chunk_size, sign_dict
-from . import http
+from uhu.utils import file_md5, get_server_url, sign_dict
+from . import encoding, http
+from .retry import RetryPolicy
+from .sendfile import get_upload_session
+from .storage import (
+    MultipartNotSupportedError, ObjectReader, S3MultipartUpload,
+    SwiftSegmentedUpload, get_status, verify_etag)
 
 
 # Utilities
 
-class ObjectReader:  # pylint: disable=too-few-public-methods
-    """Read-only object class. Used when uploading with requests."""
+def _upload_failure(error):
+    # Storages refuse negotiated URLs once they expire
+    if get_status(error) == 403:
+        return ObjectUploadResult.EXPIRED
+    return ObjectUploadResult.FAIL
 
-    def __init__(self, filename, callback=None):
-        self.filename = os.path.realpath(filename)
-        self.callback = callback
 
-    def __len__(self):
-        return os.path.getsize(self.filename)
-
-    def __iter__(self):
-        """Yields every single chunk."""
-        chunk_size = get_chunk_size()
-        with open(self.filename, 'br') as fp:
-            for chunk in iter(lambda: fp.read(chunk_size), b''):
-                yield chunk
-                call(self.callback, 'object_read')
-
-
-def dummy_object_upload(filename, url, callback=None):
-    data = ObjectReader(filename, callback)
+# pylint: disable=too-many-arguments
+def dummy_object_upload(filename, url, callback=None, session=None,
+                        cancelled=None, md5=None):
+    data = ObjectReader(filename, callback, cancelled=cancelled, md5=md5)
     try:
-        http.put(url, data=data, sign=False)
+        response = http.put(
+            url, data=data, sign=False, session=get_upload_session(session))
+        verify_etag(data, response)
         return ObjectUploadResult.SUCCESS
-    except http.HTTPError:
-        return ObjectUploadResult.FAIL
+    except http.HTTPError as error:
+        return _upload_failure(error)
+
+
+# pylint: disable=too-many-arguments
+def multipart_object_upload(upload_class, filename, url, callback=None,
+                            session=None, cancelled=None, md5=None):
+    """Uploads an object in parallel parts using upload_class.
+
+    Small objects, or objects that storage refuses to receive in
+    parts, are uploaded with a single request.
+    """
+    upload = upload_class(
+        filename, url, callback, session=session, cancelled=cancelled)
+    if not upload.is_multipart():
+        return dummy_object_upload(
+            filename, url, callback, session=session, cancelled=cancelled,
+            md5=md5)
+    try:
+        upload.upload()
+        return ObjectUploadResult.SUCCESS
+    except MultipartNotSupportedError:
+        return dummy_object_upload(
+            filename, url, callback, session=session, cancelled=cancelled,
+            md5=md5)
+    except http.HTTPError as error:
+        return _upload_failure(error)
 
 
 def swift_object_upload(*args, **kw):
-    return dummy_object_upload(*args, **kw)
+    return multipart_object_upload(SwiftSegmentedUpload, *args, **kw)
 
 
 def s3_object_upload(*args, **kw):
-    return dummy_object_upload(*args, **kw)
+    return multipart_object_upload(S3MultipartUpload, *args, **kw)
 
 
 STORAGES = {
@@ -61,93 +83,324 @@ class ObjectUploadResult(Enum):
     SUCCESS = 1
     EXISTS = 2
     FAIL = 3
+    # Storage refused the upload URL, which must be negotiated again
+    EXPIRED = 4
 
 
 class UpdateHubError(Exception):
     """Exception to be used when API is broken."""
 
 
+class ObjectUploadError(UpdateHubError):
+    """Exception raised when some objects could not be uploaded.
+
+    failed holds the upload entries of all objects that failed.
+    """
+
+    def __init__(self, failed):
+        super().__init__(
+            'Some objects has not been fully uploaded. Try again later.')
+        self.failed = failed
+
+
+# Server capabilities
+
+# Server capability of negotiating many objects with a single request
+BATCH_CAPABILITY = 'objects-batch'
+# Server capability of negotiating objects without their MD5
+DEFERRED_ETAG_CAPABILITY = 'deferred-etag'
+# Server capability of holding status requests until status changes
+LONG_POLL_CAPABILITY = 'status-long-poll'
+NEGOTIATION_BATCH_SIZE = 100
+
+_CAPABILITIES = {}
+_CAPABILITIES_LOCK = threading.Lock()
+
+
+def get_server_capabilities(session=None):
+    """Returns the set of optional features supported by server.
+
+    Capabilities are fetched once per server, with a single attempt.
+    Servers that do not advertise their capabilities (e.g. replying
+    404) are considered to have none.
+    """
+    server = get_server_url()
+    with _CAPABILITIES_LOCK:
+        if server in _CAPABILITIES:
+            return _CAPABILITIES[server]
+    try:
+        response = http.get(
+            get_server_url('/capabilities'), json=True, session=session,
+            retry=RetryPolicy(rules={}))
+        capabilities = frozenset(response.json()['capabilities'])
+    except (http.HTTPError, ValueError, KeyError, TypeError):
+        capabilities = frozenset()
+    with _CAPABILITIES_LOCK:
+        _CAPABILITIES[server] = capabilities
+    return capabilities
+
+
 # Push Package
 
-def push_package(metadata, objects, callback=None):
-    package_uid = upload_metadata(metadata)
-    upload_objects(package_uid, objects, callback)
-    finish_package(package_uid, callback)
-    return package_uid
+def _run_engine(engine, method, *args, **kwargs):
+    """Runs a PushEngine method to completion and closes the engine.
+
+    The blocking functions of this module are thin wrappers over the
+    engine (see uhu.updatehub.engine), so both push the same way.
+    """
+    from .engine import run  # engine is built on this module
+    try:
+        return run(getattr(engine, method)(*args, **kwargs))
+    finally:
+        engine.close()
+
+
+def _get_engine(callback=None, session=None, workers=None, adaptive=None):
+    from .engine import PushEngine
+    return PushEngine(
+        callback=callback, session=session, workers=workers,
+        negotiations=workers, adaptive=adaptive)
+
+
+def push_package(metadata, objects, callback=None, session=None,
+                 resume=False):
+    """Pushes a package to server.
 
+    Push progress is recorded in a journal. If resume is True and there
+    is a journal for this very same package, the package UID is reused
+    and already uploaded objects are skipped.
 
-def upload_metadata(metadata):
+    Objects recently confirmed to be on server are not negotiated
+    again (see KnownObjectsCache). If server refuses to finish the
+    package, these objects are negotiated and finishing is retried.
+    """
+    from .engine import BlockingPushEngine
+    engine = BlockingPushEngine(callback=callback, session=session)
+    return _run_engine(engine, 'push', metadata, objects, resume=resume)
+
+
+def metadata_request(metadata, get_capabilities=None):
+    """Returns the URL, payload and headers to upload metadata.
+
+    The payload may be compressed (see uhu.updatehub.encoding), in
+    which case it is signed as sent. get_capabilities must return the
+    server capabilities.
+    """
     try:
         validate_metadata(metadata)
     except ValidationError:
         raise UpdateHubError('You have an invalid package metadata.')
+    if get_capabilities is None:
+        get_capabilities = frozenset
+    try:
+        content_encoding = encoding.choose_encoding(get_capabilities)
+    except encoding.EncodingError as error:
+        raise UpdateHubError(error)
     url = get_server_url('/packages')
     signature = sign_dict(metadata, config.get_private_key_path())
     payload = json.dumps(metadata, sort_keys=True)
     headers = {'UH-SIGNATURE': signature}
+    if content_encoding is not None:
+        payload = encoding.encode(payload, content_encoding)
+        headers['Content-Encoding'] = content_encoding
+    return url, payload, headers
+
+
+def parse_package_uid(response):
     try:
-        response = http.post(
-            url, payload=payload, json=True, headers=headers).json()
-        return response['uid']
-    except http.HTTPError as error:
-        raise UpdateHubError('Could not upload metadata: {}'.format(error))
-    except (ValueError, KeyError):
+        return response.json()['uid']
+    except (ValueError, KeyError, TypeError):
         raise UpdateHubError('Could not upload metadata: unknown error.')
 
 
-def upload_object(obj, package_uid, callback=None):
-    """Uploads a package object to UpdateHub server."""
-    # First, check if we should upload the object
-    url = get_server_url('/packages/{}/objects/{}'.format(
-        package_uid, obj['sha256sum']))
-    body = json.dumps({'etag': obj['md5']})
-    try:
-        response = http.post(url, body, json=True)
-    except http.HTTPError:
-        return ObjectUploadResult.FAIL
+def upload_metadata(metadata, session=None):
+    return _run_engine(
+        _get_engine(session=session), 'upload_metadata', metadata)
+
+
+class UploadPlan:
+    """Tells which package objects must be uploaded and where to.
+
+    uploads holds (upload entry, storage, url) tuples for objects the
+    server does not have yet, existing holds entries of objects already
+    on server and failed holds entries that could not be negotiated.
+    cached holds the existing objects that were assumed to be on server
+    from the known objects cache, without asking it.
+    """
+
+    def __init__(self):
+        self.uploads = []
+        self.existing = []
+        self.failed = []
+        self.cached = []
+
+    def add(self, obj, target):
+        """Adds an object given its negotiation result."""
+        if target is None:
+            self.existing.append(obj)
+        else:
+            self.uploads.append((obj,) + target)
+
+    @property
+    def objects(self):
+        """Upload entries of the objects that must be uploaded."""
+        return [obj for obj, _, _ in self.uploads]
+
+    @property
+    def confirmed(self):
+        """Upload entries of the objects server told it has."""
+        cached = {id(obj) for obj in self.cached}
+        return [obj for obj in self.existing if id(obj) not in cached]
 
-    # Object already uploaded, return EXISTS.
-    if response.status_code == 200:
-        call(callback, 'object_read', obj['chunks'])
-        return ObjectUploadResult.EXISTS
 
-    # Object not uploaded, try to uploaded it.
+def negotiate_object(obj, package_uid, session=None, callback=None):
+    """Asks server if an object must be uploaded.
+
+    Returns None if server already has the object or a (storage, url)
+    tuple telling where it must be uploaded to. Raises UpdateHubError
+    if it could not be negotiated.
+    """
+    return _run_engine(
+        _get_engine(callback, session), 'negotiate_object', package_uid, obj)
+
+
+def parse_negotiation(response):
+    """Returns the upload target from a negotiation response."""
+    if response.status_code == 200:
+        return None
     try:
-        body = response.json()
-        uploader = STORAGES[body['storage']]
-        url = body['url']
-    except (ValueError, KeyError):
-        return ObjectUploadResult.FAIL
-    return uploader(obj['filename'], url, callback)
-
-
-def upload_objects(package_uid, objects, callback=None):
-    call(callback, 'start_package_upload', objects)
-    results = [upload_object(obj, package_uid, callback) for obj in objects]
-    call(callback, 'finish_package_upload')
-    if ObjectUploadResult.FAIL in results:
-        raise UpdateHubError(
-            'Some objects has not been fully uploaded. Try again later.')
+        return _get_upload_target(response.json())
+    except (ValueError, KeyError, TypeError):
+        raise UpdateHubError('Invalid object upload negotiation reply.')
+
+
+def get_object_md5(obj):
+    """Returns the MD5 of an upload entry, computing it if unknown."""
+    if obj.get('md5') is None:
+        obj['md5'] = file_md5(obj['filename'])
+    return obj['md5']
+
+
+def negotiation_entry(obj, get_capabilities):
+    """Returns what server must be told to negotiate an object.
 
+    get_capabilities is called to get the server capabilities only if
+    they are needed.
+    """
+    # Servers that allow it get the MD5 only if it is already known,
+    # so objects they already have are never read again.
+    if obj.get('md5') is None and \
+       DEFERRED_ETAG_CAPABILITY in get_capabilities():
+        return {}
+    return {'etag': get_object_md5(obj)}
 
-def finish_package(package_uid, callback=None):
-    url = get_server_url('/packages/{}/finish'.format(package_uid))
+
+def _get_upload_target(body):
+    if body['storage'] not in STORAGES:
+        raise KeyError(body['storage'])
+    return body['storage'], body['url']
+
+
+def batch_negotiation_request(package_uid, objects, get_capabilities):
+    """Returns the URL and payload to negotiate many objects at once."""
+    url = get_server_url('/packages/{}/objects'.format(package_uid))
+    entries = []
+    for obj in objects:
+        entry = negotiation_entry(obj, get_capabilities)
+        entry['sha256sum'] = obj['sha256sum']
+        entries.append(entry)
+    return url, json.dumps({'objects': entries})
+
+
+def parse_batch_negotiation(response):
+    """Returns a dict mapping sha256sums to their upload targets."""
     try:
-        http.put(url)
-    except http.HTTPError as error:
-        raise UpdateHubError(
-            'Could not finish package on server: {}'.format(error))
-    finally:
-        call(callback, 'push_finish', package_uid)
+        targets = {}
+        for entry in response.json()['objects']:
+            target = None
+            if not entry.get('exists'):
+                target = _get_upload_target(entry)
+            targets[entry['sha256sum']] = target
+        return targets
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise UpdateHubError('Invalid object upload negotiation reply.')
+
+
+def plan_upload(package_uid, objects, session=None, workers=None,
+                cache=None):
+    """Negotiates with server which objects must be uploaded.
+
+    If server supports it, objects are negotiated in batches.
+    Otherwise, each object is negotiated with its own request, with up
+    to workers requests at once. Returns an UploadPlan.
+
+    Objects present in the given known objects cache are not
+    negotiated at all and objects confirmed by server are added to it.
+    """
+    return _run_engine(
+        _get_engine(session=session, workers=workers), 'plan_upload',
+        package_uid, objects, cache=cache)
+
+
+# pylint: disable=too-many-arguments
+def transfer_object(obj, storage, url, callback=None, session=None,
+                    cancelled=None):
+    """Sends object contents to the storage negotiated with server.
+
+    Setting the cancelled event (a threading.Event) gives up the
+    transfer, which then fails. The object MD5, if already known, is
+    not computed again to verify the transfer.
+    """
+    uploader = STORAGES[storage]
+    return uploader(
+        obj['filename'], url, callback, session=session, cancelled=cancelled,
+        md5=obj.get('md5'))
+
+
+def upload_object(obj, package_uid, callback=None, session=None):
+    """Uploads a package object to UpdateHub server."""
+    return _run_engine(
+        _get_engine(callback, session), 'upload_object', package_uid, obj)
+
+
+# pylint: disable=too-many-arguments
+def upload_objects(package_uid, objects, callback=None, session=None,
+                   workers=None, journal=None, adaptive=None, cache=None):
+    """Uploads package objects concurrently.
+
+    First, server is asked which objects it already has (see
+    plan_upload) and only the remaining ones are uploaded and
+    accounted in progress. See PushEngine.upload_plan.
+
+    If adaptive is True (by default, set by environment variable),
+    workers is the maximum number of concurrent uploads and the
+    actual number is adjusted by the measured throughput and errors.
+    """
+    plan = plan_upload(
+        package_uid, objects, session=session, workers=workers, cache=cache)
+    engine = _get_engine(callback, session, workers, adaptive)
+    _run_engine(
+        engine, 'upload_plan', package_uid, plan, journal=journal,
+        cache=cache)
+
+
+def finish_package(package_uid, callback=None, session=None):
+    _run_engine(_get_engine(callback, session), 'finish_package', package_uid)
 
 
 # Package status
 
-def get_package_status(package_uid):
+def get_package_status(package_uid, session=None):
     url = get_server_url('/packages/{}'.format(package_uid))
     try:
-        return http.get(url, json=True).json()['status']
+        response = http.get(url, json=True, session=session)
     except http.HTTPError as error:
         raise UpdateHubError(error)
-    except (ValueError, KeyError):
+    return parse_package_status(response)
+
+
+def parse_package_status(response):
+    try:
+        return response.json()['status']
+    except (ValueError, KeyError, TypeError):
         raise UpdateHubError('Could not get package info. Try again later.')
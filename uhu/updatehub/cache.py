@@ -0,0 +1,95 @@
+# Copyright (C) 2017 O.S. Systems Software LTDA.
+# SPDX-License-Identifier: GPL-2.0
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+from ..utils import (
+    get_known_objects_cache_file, get_known_objects_ttl, get_server_url)
+
+
+class KnownObjectsCache:
+    """On-disk cache of objects known to be present on server.
+
+    Objects are kept by server URL and sha256sum for ttl seconds
+    since the server last confirmed having them, so later pushes can
+    skip asking about them again.
+    """
+
+    def __init__(self, path=None, ttl=None, clock=time.time):
+        self.path = get_known_objects_cache_file() if path is None else path
+        self.ttl = get_known_objects_ttl() if ttl is None else ttl
+        self.server = get_server_url()
+        self._clock = clock
+        self._objects = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._objects is not None:
+            return
+        try:
+            with open(self.path) as fp:
+                objects = json.load(fp).get(self.server, {})
+        except (OSError, ValueError, AttributeError):
+            objects = {}
+        now = self._clock()
+        self._objects = {
+            sha256sum: expires for sha256sum, expires in objects.items()
+            if isinstance(expires, (int, float)) and expires > now}
+
+    def __contains__(self, sha256sum):
+        with self._lock:
+            self._load()
+            return self._objects.get(sha256sum, 0) > self._clock()
+
+    def add(self, *sha256sums):
+        """Records that server has the given objects."""
+        with self._lock:
+            self._load()
+            expires = self._clock() + self.ttl
+            for sha256sum in sha256sums:
+                self._objects[sha256sum] = expires
+
+    def discard(self, *sha256sums):
+        """Forgets the given objects, if known."""
+        with self._lock:
+            self._load()
+            for sha256sum in sha256sums:
+                self._objects.pop(sha256sum, None)
+
+    def save(self):
+        """Atomically writes cache to disk.
+
+        Entries of other servers are preserved and expired ones are
+        dropped.
+        """
+        with self._lock:
+            self._load()
+            try:
+                with open(self.path) as fp:
+                    cache = json.load(fp)
+                if not isinstance(cache, dict):
+                    cache = {}
+            except (OSError, ValueError):
+                cache = {}
+            now = self._clock()
+            cache[self.server] = {
+                sha256sum: expires
+                for sha256sum, expires in self._objects.items()
+                if expires > now}
+            dirname = os.path.dirname(self.path) or '.'
+            os.makedirs(dirname, exist_ok=True)
+            descriptor, tmp = tempfile.mkstemp(dir=dirname, prefix='.tmp-')
+            with os.fdopen(descriptor, 'w') as fp:
+                json.dump(cache, fp)
+            os.replace(tmp, self.path)
+
+
+def get_known_objects_cache():
+    """Returns the known objects cache or None if it is disabled."""
+    if get_known_objects_ttl() <= 0:
+        return None
+    return KnownObjectsCache()
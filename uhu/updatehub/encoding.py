@@ -0,0 +1,81 @@
+# Copyright (C) 2017 O.S. Systems Software LTDA.
+# SPDX-License-Identifier: GPL-2.0
+
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+from ..utils import get_metadata_encoding
+
+
+IDENTITY = 'identity'
+AUTO = 'auto'
+
+# Server capability that tells a content encoding is accepted for
+# metadata uploads
+CAPABILITY_TEMPLATE = 'metadata-{}'
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 10
+
+
+class EncodingError(Exception):
+    """Raised when a content encoding can not be used."""
+
+
+def _gzip(payload):
+    # zlib is used instead of gzip.compress so the output has no
+    # timestamp and the same metadata is always encoded the same
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(payload) + compressor.flush()
+
+
+def _zstd(payload):
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(payload)
+
+
+ENCODERS = {
+    'gzip': _gzip,
+    'zstd': _zstd,
+}
+
+
+def get_available_encodings():
+    """Returns the encodings that can be used, best first."""
+    encodings = ['gzip']
+    if zstandard is not None:
+        encodings.insert(0, 'zstd')
+    return encodings
+
+
+def choose_encoding(get_capabilities):
+    """Returns the content encoding of metadata uploads or None.
+
+    If configured as "auto", the best available encoding advertised by
+    server capabilities (as returned by get_capabilities) is used.
+    """
+    encoding = get_metadata_encoding()
+    if encoding == IDENTITY:
+        return None
+    if encoding != AUTO:
+        if encoding not in get_available_encodings():
+            raise EncodingError(
+                'Metadata can not be encoded as {}.'.format(encoding))
+        return encoding
+    capabilities = get_capabilities()
+    for encoding in get_available_encodings():
+        if CAPABILITY_TEMPLATE.format(encoding) in capabilities:
+            return encoding
+    return None
+
+
+def encode(payload, encoding):
+    """Encodes a payload, returning the bytes to be sent."""
+    if not isinstance(payload, bytes):
+        payload = payload.encode()
+    if encoding is None:
+        return payload
+    return ENCODERS[encoding](payload)
@@ -0,0 +1,802 @@
+# Copyright (C) 2017 O.S. Systems Software LTDA.
+# SPDX-License-Identifier: GPL-2.0
+
+import asyncio
+import functools
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from ..utils import (
+    call, get_http_pool_size, get_progress_reporter, get_server_url,
+    get_upload_adaptive, get_upload_workers)
+# Server capabilities, object transfers and the blocking push stages
+# are looked up in api when needed, so the blocking API (built on this
+# engine) and the engine always share them.
+from . import api, http
+from .api import (
+    BATCH_CAPABILITY, LONG_POLL_CAPABILITY, NEGOTIATION_BATCH_SIZE,
+    ObjectUploadError, ObjectUploadResult, UpdateHubError, UploadPlan,
+    batch_negotiation_request, metadata_request, negotiation_entry,
+    parse_batch_negotiation, parse_negotiation, parse_package_status,
+    parse_package_uid)
+from .cache import get_known_objects_cache
+from .journal import PushJournal
+from .sendfile import close_upload_session
+from .throttle import AdaptiveConcurrency
+
+
+# For how long server may hold a status request (requests time out in
+# 30 seconds)
+LONG_POLL_WAIT = 20
+
+
+class Transport:
+    """Base class of the asynchronous HTTP transports of PushEngine.
+
+    request takes the same arguments of uhu.updatehub.http.request and
+    must return a response like the requests ones (with status_code,
+    headers and json) or raise HTTPError.
+    """
+
+    async def request(self, method, url, **kwargs):
+        raise NotImplementedError
+
+    def close(self):
+        """Releases transport resources."""
+
+
+class ThreadedTransport(Transport):
+    """Transport that sends blocking requests from a thread pool.
+
+    It needs no other HTTP client and keeps the signing, retries and
+    pooled session of blocking requests.
+    """
+
+    def __init__(self, session=None, workers=None):
+        self.session = http.get_session() if session is None else session
+        if workers is None:
+            workers = get_http_pool_size()
+        self._executor = ThreadPoolExecutor(max_workers=max(workers, 1))
+
+    async def request(self, method, url, **kwargs):
+        kwargs.setdefault('session', self.session)
+        # The same helpers of blocking requests (e.g. http.post)
+        send = getattr(http, method.lower())
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(send, url, **kwargs))
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+class _TransferProgress:
+    """Progress reporter of a transfer that can be rolled back.
+
+    Parts of an object may be sent by many threads, so reports are
+    appended to a list (which needs no lock) and only summed up when
+    rolled back.
+    """
+
+    def __init__(self, callback):
+        self._report = get_progress_reporter(callback)
+        self._reported = []
+
+    def progress(self, nbytes):
+        self._reported.append(nbytes)
+        self._report(nbytes)
+
+    def rollback(self):
+        reported = sum(self._reported)
+        if reported:
+            self._report(-reported)
+
+
+# pylint: disable=too-many-arguments
+def _journaled_transfer_object(journal, concurrency, obj, storage, url,
+                               callback=None, **kwargs):
+    """Transfers an object, recording it in journal if it succeeds.
+
+    concurrency is the AdaptiveConcurrency that limits transfers, if
+    any. Progress of transfers that do not succeed is rolled back, so
+    the object may be sent again without being accounted twice. See
+    uhu.updatehub.api.transfer_object.
+    """
+    if concurrency is not None:
+        concurrency.acquire()
+    started = time.monotonic()
+    progress = _TransferProgress(callback)
+    result = ObjectUploadResult.FAIL
+    try:
+        result = api.transfer_object(obj, storage, url, progress, **kwargs)
+    finally:
+        if result != ObjectUploadResult.SUCCESS:
+            progress.rollback()
+        if concurrency is not None:
+            # Only actual transfers tell something about the link
+            size = obj.get('size') or 0
+            if result != ObjectUploadResult.SUCCESS:
+                size = 0
+            concurrency.release(
+                size, time.monotonic() - started,
+                succeeded=result != ObjectUploadResult.FAIL)
+    if journal is not None and result == ObjectUploadResult.SUCCESS:
+        journal.mark_uploaded(obj['sha256sum'])
+    return result
+
+
+async def _cancel(tasks):
+    """Cancels tasks and waits for them to finish."""
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _gather_results(coroutines):
+    """Runs coroutines concurrently and returns their results.
+
+    UpdateHubErrors are returned in place of results, while any other
+    error is raised (cancelling all coroutines still pending).
+    """
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+    except BaseException:
+        await _cancel(tasks)
+        raise
+    for result in results:
+        if isinstance(result, Exception) and \
+                not isinstance(result, UpdateHubError):
+            raise result
+    return results
+
+
+def _claim_objects(objects, claims):
+    """Claims objects not claimed yet by other packages.
+
+    Returns the futures of the objects claimed now and of the ones
+    other packages are uploading, both by sha256sum.
+    """
+    owned, waiting = {}, {}
+    if claims is None:
+        return owned, waiting
+    loop = asyncio.get_event_loop()
+    for obj in objects:
+        sha256sum = obj['sha256sum']
+        if sha256sum in owned:
+            continue  # the same file installed twice
+        if sha256sum in claims:
+            waiting[sha256sum] = claims[sha256sum]
+        else:
+            owned[sha256sum] = claims[sha256sum] = loop.create_future()
+    return owned, waiting
+
+
+class PushGroup:
+    """State shared by packages pushed together.
+
+    The first package to upload an object claims it. The others wait
+    for that upload to end before negotiating the object again, so
+    they find it already on server.
+    """
+
+    def __init__(self, progress=True):
+        self.cache = get_known_objects_cache()
+        self.claims = {}
+        self.journals = {}
+        self.progress = progress
+
+    def get_journal(self, metadata, resume=False):
+        """Returns the push journal of a package of the group.
+
+        If resume is True, it is loaded from disk the first time.
+        """
+        journal = PushJournal(metadata)
+        if journal.path not in self.journals:
+            if resume:
+                journal.load()
+            self.journals[journal.path] = journal
+        return self.journals[journal.path]
+
+    def get_cached(self, objects):
+        """Returns the objects assumed to be on server by the cache."""
+        if self.cache is None:
+            return []
+        return [obj for obj in objects if obj['sha256sum'] in self.cache]
+
+
+class PushEngine:
+    """Pushes packages to server within an asyncio event loop.
+
+    Objects are negotiated with server before any upload starts, so
+    only the objects server does not have are uploaded and accounted
+    in progress, with at most negotiations requests and workers
+    uploads in flight. Server requests go through transport, while
+    blocking work runs in the engine executors: one sends objects to
+    storages, while the other prepares requests (e.g. computing object
+    MD5s to negotiate them), so the latter never waits for uploads.
+
+    Cancelling a push cancels every pending negotiation and upload.
+    Transfers already running are given up before their next chunk.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, transport=None, callback=None, session=None,
+                 workers=None, negotiations=None, adaptive=None):
+        if transport is None:
+            transport = ThreadedTransport(session)
+        self.transport = transport
+        if session is None:
+            session = getattr(transport, 'session', None)
+        self.session = http.get_session() if session is None else session
+        self.callback = callback
+        self.workers = max(workers or get_upload_workers(), 1)
+        self.negotiations = max(negotiations or get_http_pool_size(), 1)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        self._requests_executor = ThreadPoolExecutor(
+            max_workers=self.negotiations)
+        self.adaptive = (
+            get_upload_adaptive() if adaptive is None else adaptive)
+        self._limits = None
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self._requests_executor.shutdown(wait=False)
+        self.transport.close()
+        close_upload_session(self.session)
+
+    async def _run(self, func, *args, **kwargs):
+        """Runs a blocking function in the engine upload executor."""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs))
+
+    async def _prepare(self, func, *args):
+        """Runs a blocking function that prepares a server request."""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self._requests_executor, functools.partial(func, *args))
+
+    def _get_server_capabilities(self):
+        return api.get_server_capabilities(self.session)
+
+    async def get_capabilities(self):
+        """Returns the server capabilities (see get_server_capabilities).
+
+        They are fetched only when something depends on them.
+        """
+        return await self._prepare(self._get_server_capabilities)
+
+    async def upload_metadata(self, metadata):
+        # Signing and compressing may take a while, so they are not
+        # done within the loop
+        url, payload, headers = await self._prepare(
+            metadata_request, metadata, self._get_server_capabilities)
+        try:
+            response = await self.transport.request(
+                'POST', url, payload=payload, json=True, headers=headers)
+        except http.HTTPError as error:
+            raise UpdateHubError('Could not upload metadata: {}'.format(error))
+        return parse_package_uid(response)
+
+    async def negotiate_object(self, package_uid, obj):
+        """Asks server if an object must be uploaded.
+
+        Returns None if server has the object or its upload target.
+        """
+        entry = await self._prepare(
+            negotiation_entry, obj, self._get_server_capabilities)
+        url = get_server_url('/packages/{}/objects/{}'.format(
+            package_uid, obj['sha256sum']))
+        try:
+            response = await self.transport.request(
+                'POST', url, payload=json.dumps(entry), json=True,
+                idempotent=True, callback=self.callback)
+        except http.HTTPError as error:
+            raise UpdateHubError(error)
+        return parse_negotiation(response)
+
+    async def negotiate_objects_batch(self, package_uid, objects):
+        """Negotiates many objects with a single request.
+
+        Returns a dict mapping sha256sums to their upload targets.
+        """
+        url, payload = await self._prepare(
+            batch_negotiation_request, package_uid, objects,
+            self._get_server_capabilities)
+        try:
+            response = await self.transport.request(
+                'POST', url, payload=payload, json=True, idempotent=True)
+        except http.HTTPError as error:
+            raise UpdateHubError(error)
+        return parse_batch_negotiation(response)
+
+    async def _negotiate_batches(self, package_uid, objects):
+        targets = {}
+        if not objects or \
+           BATCH_CAPABILITY not in await self.get_capabilities():
+            return targets
+        for start in range(0, len(objects), NEGOTIATION_BATCH_SIZE):
+            batch = objects[start:start + NEGOTIATION_BATCH_SIZE]
+            try:
+                targets.update(
+                    await self.negotiate_objects_batch(package_uid, batch))
+            except UpdateHubError:
+                pass  # Objects are negotiated one by one
+        return targets
+
+    def _get_limits(self):
+        """Returns the negotiations and uploads semaphores of the loop.
+
+        They are shared by all packages pushed within the same loop.
+        """
+        loop = asyncio.get_event_loop()
+        if self._limits is None or self._limits[0] is not loop:
+            concurrency = None
+            if self.adaptive:
+                concurrency = AdaptiveConcurrency(self.workers)
+            self._limits = (loop, asyncio.Semaphore(self.negotiations),
+                            asyncio.Semaphore(self.workers), concurrency)
+        return self._limits[1:]
+
+    async def _transfer(self, obj, target, journal):
+        _, uploads, concurrency = self._get_limits()
+        cancelled = threading.Event()
+        try:
+            async with uploads:
+                return await self._run(
+                    _journaled_transfer_object, journal, concurrency,
+                    obj, *target, self.callback, session=self.session,
+                    cancelled=cancelled)
+        except asyncio.CancelledError:
+            # The transfer thread keeps running unless told to stop
+            cancelled.set()
+            raise
+
+    # pylint: disable=too-many-arguments
+    async def _upload_object(self, package_uid, obj, target, journal,
+                             claim=None, waiting=None):
+        """Negotiates (if target is False) and uploads an object.
+
+        Upload URLs refused by storage, which happens when they expire
+        while waiting for their turn, are negotiated again once.
+        """
+        negotiations = self._get_limits()[0]
+        try:
+            if waiting is not None:
+                # Another package is uploading it, so it is negotiated
+                # again after that (and it is probably on server by then)
+                await asyncio.shield(waiting)
+                target = False
+            for _ in range(2):
+                if target is False:
+                    try:
+                        async with negotiations:
+                            target = await self.negotiate_object(
+                                package_uid, obj)
+                    except UpdateHubError:
+                        return ObjectUploadResult.FAIL
+                if target is None:
+                    if journal is not None:
+                        journal.mark_uploaded(obj['sha256sum'])
+                    return ObjectUploadResult.EXISTS
+                result = await self._transfer(obj, target, journal)
+                if result != ObjectUploadResult.EXPIRED:
+                    return result
+                target = False
+            return ObjectUploadResult.FAIL
+        finally:
+            if claim is not None and not claim.done():
+                claim.set_result(None)
+
+    async def upload_object(self, package_uid, obj):
+        """Negotiates and uploads a single object.
+
+        Returns its ObjectUploadResult.
+        """
+        return await self._upload_object(package_uid, obj, False, None)
+
+    async def plan_upload(self, package_uid, objects, cache=None):
+        """Negotiates with server which objects must be uploaded.
+
+        Objects sharing a sha256sum (e.g. a file installed twice) are
+        negotiated and uploaded once. If server supports it, objects
+        are negotiated in batches and the ones left out of a batch
+        reply are negotiated one by one. Returns an UploadPlan.
+
+        Objects present in the given known objects cache are not
+        negotiated at all and objects confirmed by server are added to
+        it.
+        """
+        plan = UploadPlan()
+        distinct = OrderedDict()
+        for obj in objects:
+            distinct.setdefault(obj['sha256sum'], obj)
+        objects = list(distinct.values())
+        if cache is not None:
+            plan.cached = [obj for obj in objects if obj['sha256sum'] in cache]
+            plan.existing.extend(plan.cached)
+            objects = [obj for obj in objects
+                       if obj['sha256sum'] not in cache]
+        targets = await self._negotiate_batches(package_uid, objects)
+        negotiations = self._get_limits()[0]
+
+        async def negotiate(obj):
+            if obj['sha256sum'] in targets:
+                return targets[obj['sha256sum']]
+            try:
+                async with negotiations:
+                    return await self.negotiate_object(package_uid, obj)
+            except UpdateHubError as error:
+                return error
+        tasks = [asyncio.ensure_future(negotiate(obj)) for obj in objects]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            await _cancel(tasks)
+            raise
+        for obj, target in zip(objects, results):
+            if isinstance(target, UpdateHubError):
+                plan.failed.append(obj)
+            else:
+                plan.add(obj, target)
+        if cache is not None:
+            cache.add(*(obj['sha256sum'] for obj in plan.confirmed))
+        return plan
+
+    # pylint: disable=too-many-arguments
+    async def upload_plan(self, package_uid, plan, journal=None, cache=None,
+                          claims=None, progress=True):
+        """Uploads the objects of an UploadPlan concurrently.
+
+        Largest objects are scheduled first, so a slow upload does not
+        hold all the small ones at the end. If any object fails, all
+        other objects are still uploaded before raising an error.
+
+        Every object present on server is recorded in the push
+        journal, if given, and added to the known objects cache, if
+        given. claims maps the sha256sums of objects being uploaded by
+        other packages to futures done when their uploads end. Unless
+        progress is False, the upload start (with the objects to send)
+        and end are notified to callback.
+        """
+        if journal is not None:
+            # Cached objects are not confirmed, so they are not journaled
+            for obj in plan.confirmed:
+                journal.mark_uploaded(obj['sha256sum'])
+        uploads = sorted(
+            plan.uploads, key=lambda upload: upload[0].get('size') or 0,
+            reverse=True)
+        owned, waiting = _claim_objects(
+            [obj for obj, _, _ in uploads], claims)
+        if progress:
+            call(self.callback, 'start_package_upload', plan.objects)
+        tasks = [asyncio.ensure_future(self._upload_object(
+            package_uid, obj, (storage, url), journal,
+            claim=owned.get(obj.get('sha256sum')),
+            waiting=waiting.get(obj.get('sha256sum'))))
+                 for obj, storage, url in uploads]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            await _cancel(tasks)
+            raise
+        finally:
+            for claim in owned.values():
+                if not claim.done():
+                    claim.set_result(None)
+        if cache is not None:
+            cache.add(*(obj['sha256sum']
+                        for (obj, _, _), result in zip(uploads, results)
+                        if result != ObjectUploadResult.FAIL))
+            await self._run(cache.save)
+        if progress:
+            call(self.callback, 'finish_package_upload')
+        failed = plan.failed + [
+            obj for (obj, _, _), result in zip(uploads, results)
+            if result == ObjectUploadResult.FAIL]
+        if failed:
+            raise ObjectUploadError(failed)
+
+    async def upload_objects(self, package_uid, objects, journal=None,
+                             cache=None, progress=True):
+        """Negotiates and uploads package objects.
+
+        See plan_upload and upload_plan.
+        """
+        plan = await self.plan_upload(package_uid, objects, cache=cache)
+        await self.upload_plan(
+            package_uid, plan, journal=journal, cache=cache,
+            progress=progress)
+
+    async def finish_package(self, package_uid):
+        url = get_server_url('/packages/{}/finish'.format(package_uid))
+        try:
+            await self.transport.request('PUT', url)
+        except http.HTTPError as error:
+            raise UpdateHubError(
+                'Could not finish package on server: {}'.format(error))
+        finally:
+            call(self.callback, 'push_finish', package_uid)
+
+    async def _start_push(self, metadata, objects, resume, group):
+        """Creates a package on server, unless it is resumed.
+
+        Returns its journal and the objects not uploaded yet.
+        """
+        journal = group.get_journal(metadata, resume)
+        if journal.package_uid is None:
+            journal.set_package_uid(await self.upload_metadata(metadata))
+        objects = [obj for obj in objects
+                   if not journal.is_uploaded(obj.get('sha256sum'))]
+        return journal, objects
+
+    async def _finish_push(self, journal, cached, group):
+        package_uid = journal.package_uid
+        try:
+            await self.finish_package(package_uid)
+        except UpdateHubError:
+            if not cached:
+                raise
+            # Server may no longer have some objects we assumed it
+            # had, so they are forgotten and negotiated again.
+            group.cache.discard(*(obj['sha256sum'] for obj in cached))
+            await self._run(group.cache.save)
+            await self.upload_objects(
+                package_uid, cached, journal=journal, cache=group.cache,
+                progress=group.progress)
+            await self.finish_package(package_uid)
+        journal.remove()
+        return package_uid
+
+    async def push(self, metadata, objects, resume=False):
+        """Pushes a package to server.
+
+        Push progress is recorded in a journal. If resume is True and
+        there is a journal for this very same package, the package UID
+        is reused and already uploaded objects are skipped.
+
+        Objects recently confirmed to be on server are not negotiated
+        again (see KnownObjectsCache). If server refuses to finish the
+        package, these objects are negotiated and finishing is retried.
+        """
+        group = PushGroup()
+        journal, objects = await self._start_push(
+            metadata, objects, resume, group)
+        cached = group.get_cached(objects)
+        await self.upload_objects(
+            journal.package_uid, objects, journal=journal,
+            cache=group.cache)
+        return await self._finish_push(journal, cached, group)
+
+    async def _plan_push(self, metadata, objects, resume, group):
+        journal, objects = await self._start_push(
+            metadata, objects, resume, group)
+        plan = await self.plan_upload(
+            journal.package_uid, objects, cache=group.cache)
+        return journal, plan
+
+    async def _upload_push(self, journal, plan, group):
+        await self.upload_plan(
+            journal.package_uid, plan, journal=journal, cache=group.cache,
+            claims=group.claims, progress=False)
+        return await self._finish_push(journal, plan.cached, group)
+
+    async def push_many(self, pushes, resume=False):
+        """Pushes many packages at once.
+
+        pushes is a list of (metadata, objects) of each package. Every
+        package is created and its upload planned before any object is
+        uploaded, so progress accounts the objects to be sent by all
+        of them. Requests of the packages are sent concurrently and
+        objects shared by them are uploaded once.
+
+        Returns a list with the UID of each pushed package or, if it
+        could not be pushed, its error.
+        """
+        group = PushGroup(progress=False)
+        results = await _gather_results([
+            self._plan_push(metadata, objects, resume, group)
+            for metadata, objects in pushes])
+        planned = [result for result in results
+                   if not isinstance(result, Exception)]
+        distinct = OrderedDict()
+        for _, plan in planned:
+            for obj in plan.objects:
+                distinct.setdefault(obj['sha256sum'], obj)
+        call(self.callback, 'start_package_upload', list(distinct.values()))
+        uids = iter(await _gather_results([
+            self._upload_push(journal, plan, group)
+            for journal, plan in planned]))
+        call(self.callback, 'finish_package_upload')
+        return [result if isinstance(result, Exception) else next(uids)
+                for result in results]
+
+    async def get_package_status(self, package_uid):
+        status, _ = await self._poll_package_status(package_uid)
+        return status
+
+    async def _poll_package_status(self, package_uid, previous=None,
+                                   wait=None):
+        """Returns the package status and its ETag.
+
+        previous is the (status, etag) of the last poll. If its ETag is
+        still valid, server may reply with no content. If wait is given,
+        server holds the request for up to wait seconds while status
+        does not change.
+        """
+        url = get_server_url('/packages/{}'.format(package_uid))
+        if wait is not None:
+            url = '{}?wait={}'.format(url, int(wait))
+        headers = {}
+        if previous is not None and previous[1] is not None:
+            headers['If-None-Match'] = previous[1]
+        try:
+            response = await self.transport.request(
+                'GET', url, json=True, headers=headers)
+        except http.HTTPError as error:
+            raise UpdateHubError(error)
+        if response.status_code == 304:
+            return previous
+        return (parse_package_status(response),
+                response.headers.get('ETag'))
+
+    # pylint: disable=too-many-arguments
+    async def wait_for_package_status(self, package_uid, states,
+                                      timeout=None, interval=1,
+                                      max_interval=30):
+        """Polls package status until it is one of states.
+
+        If server supports long polling, it notifies status changes.
+        Otherwise, polls are spaced by an exponential backoff from
+        interval to max_interval seconds. Raises UpdateHubError if
+        timeout seconds pass before that.
+        """
+        loop = asyncio.get_event_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        long_poll = LONG_POLL_CAPABILITY in await self.get_capabilities()
+        delay = interval
+        polled = None
+        while True:
+            wait = None
+            if long_poll:
+                wait = LONG_POLL_WAIT
+                if deadline is not None:
+                    wait = max(min(wait, deadline - loop.time()), 0)
+            started = loop.time()
+            polled = await self._poll_package_status(
+                package_uid, polled, wait)
+            status = polled[0]
+            if status in states:
+                return status
+            if long_poll:
+                # Server already waited, unless it replied right away
+                delay = max(interval - (loop.time() - started), 0)
+            if deadline is not None:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise UpdateHubError(
+                        'Timed out waiting for package {} (status: {}).'
+                        .format(package_uid, status))
+                delay = min(delay, remaining)
+            await asyncio.sleep(delay)
+            if not long_poll:
+                delay = min(delay * 2, max_interval)
+
+    async def wait_for_packages_status(self, package_uids, states,
+                                       **kwargs):
+        """Waits for many packages at once.
+
+        Returns a dict mapping each package UID to its status. Keyword
+        arguments are passed to wait_for_package_status.
+        """
+        tasks = [asyncio.ensure_future(self.wait_for_package_status(
+            package_uid, states, **kwargs)) for package_uid in package_uids]
+        try:
+            statuses = await asyncio.gather(*tasks)
+        except BaseException:
+            await _cancel(tasks)
+            raise
+        return dict(zip(package_uids, statuses))
+
+
+class BlockingPushEngine(PushEngine):
+    """PushEngine that pushes with the blocking functions of api.
+
+    Metadata, objects and finish requests are sent by the blocking
+    functions (each one running in the engine executor), so a push is
+    made of the same stages available in uhu.updatehub.api.
+    """
+
+    def close(self):
+        # Stages close the upload connections they open
+        self._executor.shutdown(wait=False)
+        self._requests_executor.shutdown(wait=False)
+        self.transport.close()
+
+    async def upload_metadata(self, metadata):
+        return await self._run(
+            api.upload_metadata, metadata, session=self.session)
+
+    # pylint: disable=unused-argument
+    async def upload_objects(self, package_uid, objects, journal=None,
+                             cache=None, progress=True):
+        await self._run(
+            api.upload_objects, package_uid, objects, self.callback,
+            session=self.session, workers=self.workers, journal=journal,
+            adaptive=self.adaptive, cache=cache)
+
+    async def finish_package(self, package_uid):
+        await self._run(
+            api.finish_package, package_uid, self.callback,
+            session=self.session)
+
+
+def run(coroutine):
+    """Runs a coroutine to completion in a new event loop.
+
+    If interrupted (e.g. by Ctrl+C), the coroutine is cancelled and
+    given the chance to clean up before the interruption is raised.
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    task = asyncio.ensure_future(coroutine, loop=loop)
+    try:
+        return loop.run_until_complete(task)
+    except KeyboardInterrupt:
+        task.cancel()
+        try:
+            loop.run_until_complete(task)
+        except (asyncio.CancelledError, Exception):  # pylint: disable=W0703
+            pass
+        raise
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+def run_push(metadata, objects, callback=None, resume=False, **kwargs):
+    """Blocking wrapper that pushes a package with PushEngine.
+
+    Extra arguments are passed to PushEngine.
+    """
+    engine = PushEngine(callback=callback, **kwargs)
+    try:
+        return run(engine.push(metadata, objects, resume=resume))
+    finally:
+        engine.close()
+
+
+def run_push_many(pushes, callback=None, resume=False, **kwargs):
+    """Blocking wrapper of PushEngine.push_many."""
+    engine = PushEngine(callback=callback, **kwargs)
+    try:
+        return run(engine.push_many(pushes, resume=resume))
+    finally:
+        engine.close()
+
+
+def wait_for_package_status(package_uid, states, timeout=None):
+    """Blocks until package status is one of states and returns it.
+
+    Raises UpdateHubError if timeout seconds pass before that.
+    """
+    return wait_for_packages_status(
+        [package_uid], states, timeout)[package_uid]
+
+
+def wait_for_packages_status(package_uids, states, timeout=None):
+    """Blocks until the status of every package is one of states.
+
+    Packages are polled concurrently over the same pooled session.
+    Returns a dict mapping package UIDs to their statuses.
+    """
+    engine = PushEngine()
+    try:
+        return run(engine.wait_for_packages_status(
+            package_uids, states, timeout=timeout))
+    finally:
+        engine.close()
@@ -1,45 +1,136 @@
 # Copyright (C) 2017 O.S. Systems Software LTDA.
 # SPDX-License-Identifier: GPL-2.0
 
+import functools
+import time
+
 import requests
+from requests.adapters import HTTPAdapter
 
-from ..utils import get_custom_ca_certs_file
+from ..utils import call, get_custom_ca_certs_file, get_http_pool_size
 from ._request import Request, HTTPError
+from .retry import IDEMPOTENT_METHODS, RetryPolicy
 
 
 UNKNOWN_ERROR = 'A unexpected request error ocurred. Try again later.'
 
+_SESSION = None
+
+
+def create_session(pool_size=None):
+    """Creates a keep-alive HTTP session.
+
+    Connections are pooled by host, so requests to the same API server
+    or storage reuse already open connections. pool_size is the
+    maximum number of connections kept open for each host.
+    """
+    if pool_size is None:
+        pool_size = get_http_pool_size()
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session():
+    """Returns the session shared by all requests by default."""
+    global _SESSION  # pylint: disable=global-statement
+    if _SESSION is None:
+        _SESSION = create_session()
+    return _SESSION
+
+
+def _send(method, url, *args, sign=True, session=None, **kwargs):
+    # A new Request is created on every call, so retries are signed
+    # again with a fresh timestamp.
+    if sign:
+        return Request(url, method, *args, **kwargs).send(session)
+    return session.request(method, url, *args, timeout=30, **kwargs)
+
+
+def _to_http_error(error):
+    if isinstance(error, (requests.exceptions.MissingSchema,
+                          requests.exceptions.InvalidSchema,
+                          requests.exceptions.URLRequired,
+                          requests.exceptions.InvalidURL)):
+        return HTTPError('You have provided an invalid server URL.')
+    if isinstance(error, requests.ConnectTimeout):
+        return HTTPError('Connection timed out. Try again later.')
+    if isinstance(error, requests.ConnectionError):
+        return HTTPError('Server is not available. Try again later.')
+    return HTTPError(UNKNOWN_ERROR)
+
+
+def _send_with_retries(send, retry, idempotent, notify):
+    """Calls send until it succeeds or retry gives up.
+
+    notify is called with the attempt and the reason of every retry.
+    Returns the last response.
+    """
+    started = time.monotonic()
+    attempt = 1
+    while True:
+        try:
+            response = send()
+        except HTTPError as error:
+            raise error
+        except requests.RequestException as error:
+            delay = retry.next_delay(
+                attempt, started, error=error, idempotent=idempotent)
+            if delay is None:
+                raise _to_http_error(error)
+            reason = type(error).__name__
+        else:
+            if response.ok:
+                return response
+            delay = retry.next_delay(
+                attempt, started, response=response, idempotent=idempotent)
+            if delay is None:
+                return response
+            reason = 'HTTP {}'.format(response.status_code)
+        notify(attempt, reason)
+        time.sleep(delay)
+        attempt += 1
+
+
+def _check_response(response):
+    if response.status_code == 401:
+        raise HTTPError(
+            'Unautorized. Did you set your credentials?', response=response)
+    if not response.ok:
+        raise HTTPError(format_server_error(response), response=response)
+    return response
+
+
+# pylint: disable=too-many-arguments
+def request(method, url, *args, sign=True, session=None, retry=None,
+            idempotent=None, callback=None, **kwargs):
+    """Sends a request, retrying it on transient failures.
 
-def request(method, url, *args, sign=True, **kwargs):
+    retry is the RetryPolicy to be used (by default, one configured
+    by environment variables). By default, only requests with
+    idempotent methods are fully retried, but this can be overridden
+    by idempotent. Every retry is notified to callback.
+    """
     custom_ca_certs_file = get_custom_ca_certs_file()
 
     if custom_ca_certs_file is not None and 'verify' not in kwargs:
         kwargs['verify'] = custom_ca_certs_file
 
-    try:
-        if sign:
-            response = Request(url, method, *args, **kwargs).send()
-        else:
-            response = requests.request(
-                method, url, *args, timeout=30, **kwargs)
-    except HTTPError as error:
-        raise error
-    except (requests.exceptions.MissingSchema,
-            requests.exceptions.InvalidSchema,
-            requests.exceptions.URLRequired,
-            requests.exceptions.InvalidURL):
-        raise HTTPError('You have provided an invalid server URL.')
-    except requests.ConnectTimeout:
-        raise HTTPError('Connection timed out. Try again later.')
-    except requests.ConnectionError:
-        raise HTTPError('Server is not available. Try again later.')
-    except requests.RequestException:
-        raise HTTPError(UNKNOWN_ERROR)
-    if response.status_code == 401:
-        raise HTTPError('Unautorized. Did you set your credentials?')
-    if not response.ok:
-        raise HTTPError(format_server_error(response))
-    return response
+    if session is None:
+        session = get_session()
+    if retry is None:
+        retry = RetryPolicy()
+    if idempotent is None:
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+
+    send = functools.partial(
+        _send, method, url, *args, sign=sign, session=session, **kwargs)
+    response = _send_with_retries(
+        send, retry, idempotent, lambda attempt, reason: call(
+            callback, 'request_retry', method, url, attempt, reason))
+    return _check_response(response)
 
 
 def get(url, *args, **kwargs):
@@ -54,6 +145,10 @@ def put(url, *args, **kwargs):
     return request('PUT', url, *args, **kwargs)
 
 
+def delete(url, *args, **kwargs):
+    return request('DELETE', url, *args, **kwargs)
+
+
 def format_server_error(response):
     try:
         body = response.json()
@@ -0,0 +1,114 @@
+# Copyright (C) 2017 O.S. Systems Software LTDA.
+# SPDX-License-Identifier: GPL-2.0
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from ..utils import get_push_journal_dir, get_server_url
+
+
+def metadata_digest(metadata):
+    """Returns the sha256sum of the serialized package metadata."""
+    payload = json.dumps(metadata, sort_keys=True).encode()
+    return hashlib.sha256(payload).hexdigest()
+
+
+class PushJournal:
+    """On-disk record of a package push.
+
+    The journal keeps the package UID created by the server and which
+    objects were already uploaded, so an interrupted push can be
+    resumed without creating a new package or uploading again
+    completed objects.
+
+    A journal is identified by the server URL and the package metadata
+    digest, so a push is only resumed with the very same metadata.
+
+    Uploaded objects are appended, one per line, to a log next to the
+    journal, so recording one does not rewrite the whole journal. The
+    log is merged into the journal when it is loaded.
+    """
+
+    def __init__(self, metadata, path=None):
+        self.server = get_server_url()
+        self.digest = metadata_digest(metadata)
+        if path is None:
+            name = '{}-{}'.format(self.server, self.digest).encode()
+            path = os.path.join(
+                get_push_journal_dir(), hashlib.sha256(name).hexdigest())
+        self.path = path
+        self.log_path = path + '.log'
+        self.package_uid = None
+        self.uploaded = set()
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Loads journal from disk. Returns False if there is none."""
+        try:
+            with open(self.path) as fp:
+                journal = json.load(fp)
+        except (FileNotFoundError, ValueError):
+            return False
+        if journal.get('server') != self.server or \
+           journal.get('digest') != self.digest:
+            return False
+        self.package_uid = journal.get('package_uid')
+        self.uploaded = set(journal.get('uploaded', []))
+        try:
+            with open(self.log_path) as fp:
+                # A line left incomplete by an interruption is ignored
+                logged = fp.read().split('\n')[:-1]
+        except FileNotFoundError:
+            logged = []
+        if logged:
+            self.uploaded.update(logged)
+            self.save()
+        return True
+
+    def save(self):
+        """Atomically writes journal to disk, compacting its log."""
+        journal = {
+            'server': self.server,
+            'digest': self.digest,
+            'package_uid': self.package_uid,
+            'uploaded': sorted(self.uploaded),
+        }
+        dirname = os.path.dirname(self.path)
+        os.makedirs(dirname, exist_ok=True)
+        descriptor, tmp = tempfile.mkstemp(dir=dirname, prefix='.tmp-')
+        with os.fdopen(descriptor, 'w') as fp:
+            json.dump(journal, fp)
+        os.replace(tmp, self.path)
+        self._remove(self.log_path)
+
+    def set_package_uid(self, package_uid):
+        with self._lock:
+            self.package_uid = package_uid
+            self.save()
+
+    def mark_uploaded(self, sha256sum):
+        """Records that an object is already present on server."""
+        with self._lock:
+            if sha256sum in self.uploaded:
+                return
+            self.uploaded.add(sha256sum)
+            with open(self.log_path, 'a') as fp:
+                fp.write(sha256sum + '\n')
+
+    def is_uploaded(self, sha256sum):
+        return sha256sum in self.uploaded
+
+    def remove(self):
+        """Removes journal from disk, if present."""
+        self._remove(self.path)
+        self._remove(self.log_path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,141 @@
+# Copyright (C) 2017 O.S. Systems Software LTDA.
+# SPDX-License-Identifier: GPL-2.0
+
+import random
+import threading
+import time
+from collections import Counter
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+from ..utils import (
+    get_retry_base_delay, get_retry_deadline, get_retry_max_attempts,
+    get_retry_max_delay)
+
+
+# Methods that can be safely sent again
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+# Status codes of transient server (or proxy) failures
+RETRIABLE_STATUS = (408, 429, 500, 502, 503, 504)
+
+# Number of retries done so far, by reason
+RETRIES = Counter()
+_RETRIES_LOCK = threading.Lock()
+
+
+def get_retry_counters():
+    """Returns how many requests were retried, by reason."""
+    with _RETRIES_LOCK:
+        return dict(RETRIES)
+
+
+def default_rules(max_attempts):
+    """Returns the default max attempts for each kind of error."""
+    rules = {status: max_attempts for status in RETRIABLE_STATUS}
+    rules.update({
+        requests.ConnectionError: max_attempts,
+        requests.Timeout: max_attempts,
+        requests.exceptions.ChunkedEncodingError: max_attempts,
+    })
+    return rules
+
+
+def was_not_sent(error):
+    """Tells if a request failed before its connection was established.
+
+    It is so when connecting timed out or failed (as when refused),
+    which requests reports as a ConnectionError caused by urllib3
+    NewConnectionError.
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    pending, seen = [error], set()
+    while pending:
+        exc = pending.pop()
+        if not isinstance(exc, BaseException) or id(exc) in seen:
+            continue
+        seen.add(id(exc))
+        if isinstance(exc, NewConnectionError):
+            return True
+        pending.extend(exc.args)
+        pending.extend([getattr(exc, 'reason', None), exc.__cause__,
+                        exc.__context__])
+    return False
+
+
+def _get_retry_after(response):
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """Decides if and when a failed request must be sent again.
+
+    rules maps exception classes and HTTP status codes to the maximum
+    number of attempts for them. Errors without a rule are never
+    retried.
+
+    Retries wait an exponential backoff with full jitter (a random
+    delay between 0 and base_delay * 2 ** retry, limited to
+    max_delay) and are given up if they would exceed deadline seconds
+    since the first attempt.
+
+    Requests that are not idempotent are only retried if the
+    connection could not be established (see was_not_sent), since the
+    server certainly did not receive them.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, max_attempts=None, base_delay=None, max_delay=None,
+                 deadline=None, rules=None):
+        if max_attempts is None:
+            max_attempts = get_retry_max_attempts()
+        self.max_attempts = max_attempts
+        self.base_delay = (
+            get_retry_base_delay() if base_delay is None else base_delay)
+        self.max_delay = (
+            get_retry_max_delay() if max_delay is None else max_delay)
+        self.deadline = get_retry_deadline() if deadline is None else deadline
+        self.rules = default_rules(max_attempts) if rules is None else rules
+
+    def get_max_attempts(self, error=None, status=None):
+        if error is None:
+            return self.rules.get(status, 1)
+        for cls in type(error).__mro__:
+            if cls in self.rules:
+                return self.rules[cls]
+        return 1
+
+    def backoff(self, attempt, retry_after=None):
+        """Returns how long to wait after a given failed attempt."""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        delay = random.uniform(0, delay)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    # pylint: disable=too-many-arguments
+    def next_delay(self, attempt, started, error=None, response=None,
+                   idempotent=True):
+        """Returns the delay before the next attempt or None to give up.
+
+        attempt is the number of the failed attempt and started is the
+        time.monotonic() value of the first one. Either the raised
+        error or the failed response must be given.
+        """
+        if not idempotent and not was_not_sent(error):
+            return None
+        status = getattr(response, 'status_code', None)
+        if attempt >= self.get_max_attempts(error, status):
+            return None
+        delay = self.backoff(attempt, _get_retry_after(response))
+        if time.monotonic() - started + delay > self.deadline:
+            return None
+        reason = type(error).__name__ if error else 'HTTP {}'.format(status)
+        with _RETRIES_LOCK:
+            RETRIES[reason] += 1
+        return delay
@@ -0,0 +1,181 @@
+# Copyright (C) 2017 O.S. Systems Software LTDA.
+# SPDX-License-Identifier: GPL-2.0
+
+import os
+import socket
+import threading
+import weakref
+from http.client import HTTPConnection, HTTPException
+from urllib.parse import urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_environ_proxies
+
+from ..utils import (
+    get_chunk_size, get_upload_sendfile)
+from . import http
+
+
+TIMEOUT = 30  # seconds, as any other request
+
+_SESSIONS = weakref.WeakKeyDictionary()
+_SESSIONS_LOCK = threading.Lock()
+
+
+def can_sendfile(url, data):
+    """Checks if data can be sent to url with sendfile.
+
+    data must be a file region (like storage.ObjectReader, with
+    filename, offset and length) and url a plain HTTP one. TLS
+    connections and proxies are left to requests.
+    """
+    return (hasattr(os, 'sendfile') and
+            urlsplit(url).scheme == 'http' and
+            hasattr(data, 'filename') and hasattr(data, 'offset') and
+            not get_environ_proxies(url))
+
+
+class SendfileSession:
+    """Session that sends file bodies without copying them to Python.
+
+    Bodies that can be sent with sendfile (see can_sendfile) are
+    written straight from the file to the socket, while any other
+    request (or any request with options other than headers and
+    timeout) is sent by session. Connections are kept open and reused
+    by each thread until the session is closed.
+
+    It raises and returns the same exceptions and responses of
+    requests, so it can be used as a session of http.request.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def _get_connection(self, netloc, timeout):
+        key = (threading.get_ident(), netloc)
+        with self._lock:
+            connection = self._connections.get(key)
+            if connection is None:
+                connection = HTTPConnection(netloc, timeout=timeout)
+                self._connections[key] = connection
+        return connection
+
+    def _drop_connection(self, netloc):
+        with self._lock:
+            connection = self._connections.pop(
+                (threading.get_ident(), netloc), None)
+        if connection is not None:
+            connection.close()
+
+    # pylint: disable=too-many-arguments
+    def request(self, method, url, data=None, headers=None,
+                timeout=TIMEOUT, **kwargs):
+        # Certificates are never verified on plain HTTP connections
+        options = [key for key in kwargs if key != 'verify']
+        if options or not can_sendfile(url, data):
+            return self.session.request(
+                method, url, data=data, headers=headers, timeout=timeout,
+                **kwargs)
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path = '{}?{}'.format(path, parts.query)
+        try:
+            connection = self._get_connection(parts.netloc, timeout)
+            if connection.sock is None:
+                connection.connect()
+            connection.putrequest(method, path, skip_accept_encoding=True)
+            for header, value in (headers or {}).items():
+                connection.putheader(header, value)
+            connection.putheader('Content-Length', str(len(data)))
+            connection.endheaders()
+            send_file(connection.sock, data)
+            return self._build_response(url, connection.getresponse())
+        except http.HTTPError:
+            # e.g. upload was cancelled, leaving the request unfinished
+            self._drop_connection(parts.netloc)
+            raise
+        except socket.timeout as error:
+            self._drop_connection(parts.netloc)
+            raise requests.Timeout(error)
+        except (OSError, HTTPException) as error:
+            self._drop_connection(parts.netloc)
+            raise requests.ConnectionError(error)
+
+    def _build_response(self, url, raw):
+        response = requests.Response()
+        response.status_code = raw.status
+        response.reason = raw.reason
+        response.headers = CaseInsensitiveDict(raw.getheaders())
+        response.url = url
+        # Reading the body to its end allows reusing the connection
+        response._content = raw.read()  # pylint: disable=protected-access
+        if raw.will_close:
+            self._drop_connection(urlsplit(url).netloc)
+        return response
+
+    def close(self):
+        """Closes the connections of every thread."""
+        with self._lock:
+            connections = list(self._connections.values())
+            self._connections.clear()
+        for connection in connections:
+            connection.close()
+
+
+def send_file(sock, data):
+    """Sends a file region (see can_sendfile) through sock.
+
+    It is sent in chunks, so upload rate limiter and progress are
+    updated as usual, but with no copies into Python.
+    """
+    data.sent_with_sendfile = True
+    chunk_size = get_chunk_size()
+    progress = data.start_progress()
+    offset = data.offset
+    remaining = len(data)
+    with open(data.filename, 'rb') as fp:
+        while remaining > 0:
+            data.check_cancelled()
+            count = min(chunk_size, remaining)
+            if data.limiter is not None:
+                data.limiter.consume(count)
+            sent = sock.sendfile(fp, offset, count)
+            if not sent:
+                raise OSError('Object file is shorter than expected.')
+            offset += sent
+            remaining -= sent
+            progress(sent)
+
+
+def get_upload_session(session=None):
+    """Returns the session that object uploads must use.
+
+    It is session (or the shared one) wrapped in a SendfileSession,
+    unless sendfile was disabled by configuration.
+    """
+    if session is None:
+        session = http.get_session()
+    if not get_upload_sendfile() or isinstance(session, SendfileSession):
+        return session
+    with _SESSIONS_LOCK:
+        upload_session = _SESSIONS.get(session)
+        if upload_session is None:
+            upload_session = _SESSIONS[session] = SendfileSession(session)
+        return upload_session
+
+
+def close_upload_session(session=None):
+    """Closes the connections of the upload session of session, if any.
+
+    Sessions not wrapped by get_upload_session are left open.
+    """
+    if session is None:
+        session = http.get_session()
+    with _SESSIONS_LOCK:
+        upload_session = _SESSIONS.get(session)
+    if upload_session is not None:
+        upload_session.close()
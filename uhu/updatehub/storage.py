@@ -0,0 +1,351 @@
+# Copyright (C) 2017 O.S. Systems Software LTDA.
+# SPDX-License-Identifier: GPL-2.0
+
+import hashlib
+import json
+import math
+import os
+import re
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlsplit
+
+from ..utils import (
+    call, file_md5, get_chunk_size, get_progress_reporter,
+    get_upload_part_retries, get_upload_part_size, get_upload_part_workers)
+from . import http
+from .retry import RetryPolicy
+from .sendfile import get_upload_session
+from .throttle import get_rate_limiter
+
+
+# Status codes that tell us the storage (or the URL given by the
+# server) does not allow multipart uploads.
+NOT_SUPPORTED_STATUS = (400, 401, 403, 404, 405, 501)
+
+
+class MultipartNotSupportedError(http.HTTPError):
+    """Raised when storage does not accept multipart uploads."""
+
+
+def add_query(url, *flags, **params):
+    """Appends flags and params to url query string."""
+    query = list(flags)
+    query.extend('{}={}'.format(key, quote(str(value), safe=''))
+                 for key, value in sorted(params.items()))
+    separator = '&' if urlsplit(url).query else '?'
+    return '{}{}{}'.format(url, separator, '&'.join(query))
+
+
+class UploadCancelledError(http.HTTPError):
+    """Raised when an upload is cancelled while being sent."""
+
+
+class ObjectReader:  # pylint: disable=too-few-public-methods
+    """Read-only object class. Used when uploading with requests.
+
+    It may read only size bytes from offset, so it can be used to
+    upload a part of an object. Every chunk read is accounted in the
+    upload rate limiter, if any.
+
+    The MD5 of what was read is computed along, so it is available
+    in md5 after the reader is fully read. Readers sent with sendfile
+    are never read, so their MD5 is computed by compute_md5. If the
+    MD5 is already known, it is given as md5 and nothing is hashed.
+
+    If the cancelled event is set, reading raises UploadCancelledError,
+    so the upload is given up between chunks.
+
+    Progress reported by a read is rolled back when the reader is read
+    again, so a retried request is not accounted twice.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, filename, callback=None, offset=0, size=None,
+                 limiter=None, cancelled=None, md5=None):
+        self.filename = os.path.realpath(filename)
+        self.callback = callback
+        self.offset = offset
+        self.size = size
+        self.limiter = get_rate_limiter() if limiter is None else limiter
+        self.cancelled = cancelled
+        self.known_md5 = md5
+        self.md5 = md5
+        self.sent_with_sendfile = False
+        self.reported = 0
+
+    def __len__(self):
+        if self.size is not None:
+            return self.size
+        return os.path.getsize(self.filename) - self.offset
+
+    def __iter__(self):
+        """Yields every single chunk."""
+        chunk_size = get_chunk_size()
+        remaining = len(self)
+        md5 = hashlib.md5() if self.known_md5 is None else None
+        self.md5 = self.known_md5
+        progress = self.start_progress()
+        with open(self.filename, 'br') as fp:
+            fp.seek(self.offset)
+            while remaining > 0:
+                self.check_cancelled()
+                chunk = fp.read(min(chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                if md5 is not None:
+                    md5.update(chunk)
+                if self.limiter is not None:
+                    self.limiter.consume(len(chunk))
+                yield chunk
+                progress(len(chunk))
+        if md5 is not None:
+            self.md5 = md5.hexdigest()
+
+    def start_progress(self):
+        """Rolls back the progress reported by an earlier read.
+
+        Returns the function that reports the progress of a new read.
+        """
+        report = get_progress_reporter(self.callback)
+        if self.reported:
+            report(-self.reported)
+            self.reported = 0
+
+        def progress(nbytes):
+            self.reported += nbytes
+            report(nbytes)
+        return progress
+
+    def check_cancelled(self):
+        """Raises UploadCancelledError if the upload was cancelled."""
+        if self.cancelled is not None and self.cancelled.is_set():
+            raise UploadCancelledError('Upload was cancelled.')
+
+    def compute_md5(self):
+        """Computes the MD5 of the object (part) without iterating it.
+
+        Used when the reader was sent with sendfile, so it was never
+        read by Python.
+        """
+        self.md5 = file_md5(self.filename, self.offset, len(self))
+        return self.md5
+
+
+def verify_etag(reader, response):
+    """Checks if storage received exactly what reader sent.
+
+    Storages reply the MD5 of what they stored as the ETag header.
+    ETags that are not a MD5 (e.g. of multipart objects) are ignored.
+    Readers sent with sendfile are only read again to compute their
+    MD5 if it is not known yet (e.g. of object parts).
+    """
+    etag = str(response.headers.get('ETag', '')).strip('"').lower()
+    if reader.md5 is None and not reader.sent_with_sendfile:
+        return
+    if not re.match(r'^[0-9a-f]{32}$', etag):
+        return
+    if reader.md5 is None:
+        reader.compute_md5()
+    if etag != reader.md5:
+        raise http.HTTPError('Object was corrupted during upload.')
+
+
+def get_status(error):
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None)
+
+
+class MultipartUpload:
+    """Base class for uploads split in parts sent in parallel.
+
+    Subclasses must implement upload_part and complete. The first part
+    is sent alone, so a storage that does not allow multipart uploads
+    is detected before sending everything else.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, filename, url, callback=None, session=None,
+                 part_size=None, workers=None, retries=None,
+                 cancelled=None):
+        self.filename = os.path.realpath(filename)
+        self.url = url
+        self.callback = callback
+        self.cancelled = cancelled
+        self.session = get_upload_session(session)
+        self.chunk_size = get_chunk_size()
+        if part_size is None:
+            part_size = get_upload_part_size()
+        # Parts are aligned to chunks, so they are read in whole
+        # chunks as non multipart uploads.
+        self.part_size = math.ceil(
+            part_size / self.chunk_size) * self.chunk_size
+        self.workers = workers if workers else get_upload_part_workers()
+        # Each part is retried on its own, so a failure does not
+        # require sending the whole object again.
+        self.retry = RetryPolicy(
+            max_attempts=retries if retries else get_upload_part_retries())
+        self.size = os.path.getsize(self.filename)
+
+    def is_multipart(self):
+        """Checks if object is big enough to be split in parts."""
+        return self.size > self.part_size
+
+    def parts(self):
+        """Returns a list of (part number, offset, size) tuples."""
+        return [(number, offset, min(self.part_size, self.size - offset))
+                for number, offset in enumerate(
+                    range(0, self.size, self.part_size), start=1)]
+
+    def start(self):
+        """Must prepare storage to receive the parts."""
+
+    def upload_part(self, number, data):
+        """Must upload a part and return what complete requires.
+
+        data is an ObjectReader for the part.
+        """
+        raise NotImplementedError
+
+    def complete(self, parts):
+        """Must assemble all uploaded parts in the final object."""
+        raise NotImplementedError
+
+    def abort(self):
+        """Must discard uploaded parts after a failure."""
+
+    def _upload_part(self, number, offset, size):
+        # A reader (instead of the part contents) is sent, so it is
+        # rate limited as any other upload and read again on retries.
+        data = ObjectReader(self.filename, offset=offset, size=size,
+                            cancelled=self.cancelled)
+        result = self.upload_part(number, data)
+        call(self.callback, 'progress', size)
+        return result
+
+    def upload(self):
+        """Uploads the object.
+
+        Raises MultipartNotSupportedError if the storage refuses the
+        multipart upload before any object data is accepted and
+        HTTPError if the upload fails after that.
+        """
+        parts = self.parts()
+        try:
+            self.start()
+            results = [self._upload_part(*parts[0])]
+        except http.HTTPError as error:
+            self.abort()
+            if get_status(error) in NOT_SUPPORTED_STATUS:
+                raise MultipartNotSupportedError(str(error))
+            raise
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = [executor.submit(self._upload_part, *part)
+                           for part in parts[1:]]
+                try:
+                    results.extend(future.result() for future in futures)
+                except http.HTTPError:
+                    for future in futures:
+                        future.cancel()
+                    raise
+            self.complete(results)
+        except http.HTTPError:
+            self.abort()
+            raise
+
+
+class S3MultipartUpload(MultipartUpload):
+    """Amazon S3 multipart upload.
+
+    See https://docs.aws.amazon.com/AmazonS3/latest/dev/mpuoverview.html
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.upload_id = None
+
+    def start(self):
+        response = http.post(
+            add_query(self.url, 'uploads'), sign=False, session=self.session)
+        try:
+            root = ET.fromstring(response.content)
+        except ET.ParseError:
+            raise http.HTTPError('Invalid multipart upload response.')
+        for element in root.iter():
+            if element.tag.endswith('UploadId'):
+                self.upload_id = element.text
+        if not self.upload_id:
+            raise http.HTTPError('Storage did not start multipart upload.')
+
+    def upload_part(self, number, data):
+        url = add_query(self.url, partNumber=number, uploadId=self.upload_id)
+        response = http.put(url, data=data, sign=False, session=self.session,
+                            retry=self.retry)
+        verify_etag(data, response)
+        return number, response.headers.get('ETag')
+
+    def complete(self, parts):
+        body = ['<CompleteMultipartUpload>']
+        for number, etag in sorted(parts):
+            body.append(
+                '<Part><PartNumber>{}</PartNumber><ETag>{}</ETag></Part>'
+                .format(number, etag))
+        body.append('</CompleteMultipartUpload>')
+        url = add_query(self.url, uploadId=self.upload_id)
+        response = http.post(
+            url, data=''.join(body), sign=False, session=self.session)
+        # S3 may report a failure within a 200 OK response
+        if b'<Error>' in response.content:
+            raise http.HTTPError('Could not complete multipart upload.')
+
+    def abort(self):
+        if self.upload_id is None:
+            return
+        url = add_query(self.url, uploadId=self.upload_id)
+        try:
+            http.delete(url, sign=False, session=self.session)
+        except http.HTTPError:
+            pass  # Storage will expire the incomplete upload
+
+
+class SwiftSegmentedUpload(MultipartUpload):
+    """OpenStack Swift Static Large Object (SLO) upload.
+
+    Segments are uploaded under the object path and the final object
+    is a manifest pointing to them.
+
+    See https://docs.openstack.org/swift/latest/overview_large_objects.html
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        url = urlsplit(self.url)
+        self._base = '{}://{}{}'.format(url.scheme, url.netloc, url.path)
+        self._query = url.query
+        # Path without version and account, as expected by manifests
+        self._path = '/' + '/'.join(url.path.strip('/').split('/')[2:])
+
+    def _segment_url(self, number):
+        url = '{}/segments/{:08d}'.format(self._base, number)
+        if self._query:
+            url = '{}?{}'.format(url, self._query)
+        return url
+
+    def upload_part(self, number, data):
+        response = http.put(
+            self._segment_url(number), data=data, sign=False,
+            session=self.session, retry=self.retry)
+        verify_etag(data, response)
+        return number, {
+            'path': '{}/segments/{:08d}'.format(self._path, number),
+            'etag': response.headers.get('ETag', '').strip('"'),
+            'size_bytes': len(data),
+        }
+
+    def complete(self, parts):
+        manifest = [segment for _, segment in sorted(parts)]
+        url = add_query(self.url, **{'multipart-manifest': 'put'})
+        http.put(url, data=json.dumps(manifest), sign=False,
+                 session=self.session)
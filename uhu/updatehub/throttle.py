@@ -0,0 +1,114 @@
+# Copyright (C) 2017 O.S. Systems Software LTDA.
+# SPDX-License-Identifier: GPL-2.0
+
+import threading
+import time
+
+from ..utils import get_upload_rate_limit
+
+
+# Transfers smaller than this are dominated by latency, so they are
+# not used to measure throughput.
+MIN_SAMPLE_SIZE = 1024 * 1024  # 1 MiB
+
+# Per stream throughput, relative to the best one seen, above which
+# concurrency is increased and below which it is decreased.
+GROW_THRESHOLD = 0.8
+SHRINK_THRESHOLD = 0.5
+
+
+class TokenBucket:  # pylint: disable=too-few-public-methods
+    """Thread safe token bucket used to limit transfer rates.
+
+    Tokens (bytes) are refilled at rate per second up to capacity
+    (by default, one second worth of tokens). Consuming more tokens
+    than available blocks until the debt is paid, so the limit is
+    shared by all threads using the same bucket.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic,
+                 sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity if capacity else rate
+        self.tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def consume(self, amount):
+        """Takes amount tokens, waiting for them if needed."""
+        with self._lock:
+            now = self._clock()
+            self.tokens = min(
+                self.capacity,
+                self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            self._sleep(wait)
+
+
+_LIMITER = None
+_LIMITER_LOCK = threading.Lock()
+
+
+def get_rate_limiter():
+    """Returns the global upload rate limiter.
+
+    Returns None if uploads are not rate limited.
+    """
+    global _LIMITER  # pylint: disable=global-statement
+    rate = get_upload_rate_limit()
+    if rate is None:
+        return None
+    with _LIMITER_LOCK:
+        if _LIMITER is None or _LIMITER.rate != rate:
+            _LIMITER = TokenBucket(rate)
+        return _LIMITER
+
+
+class AdaptiveConcurrency:
+    """Limits concurrent transfers adapting to the link conditions.
+
+    The limit grows by one while every new stream still gets about
+    the best throughput seen so far (the link is not saturated yet)
+    and shrinks by one when streams get much slower. Failures halve
+    the limit, so a struggling server or link is quickly relieved.
+    """
+
+    def __init__(self, maximum, minimum=1, initial=None):
+        self.maximum = max(maximum, 1)
+        self.minimum = min(max(minimum, 1), self.maximum)
+        self.limit = self.minimum if initial is None else initial
+        self.active = 0
+        self.best = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Blocks until a new transfer is allowed to start."""
+        with self._cond:
+            while self.active >= self.limit:
+                self._cond.wait()
+            self.active += 1
+
+    def release(self, size=0, elapsed=0, succeeded=True):
+        """Finishes a transfer of size bytes that took elapsed seconds."""
+        with self._cond:
+            self.active -= 1
+            self._adjust(size, elapsed, succeeded)
+            self._cond.notify_all()
+
+    def _adjust(self, size, elapsed, succeeded):
+        if not succeeded:
+            self.limit = max(self.minimum, self.limit // 2)
+            return
+        if size < MIN_SAMPLE_SIZE or elapsed <= 0:
+            return
+        throughput = size / elapsed
+        self.best = max(self.best, throughput)
+        if throughput >= self.best * GROW_THRESHOLD:
+            self.limit = min(self.maximum, self.limit + 1)
+        elif throughput < self.best * SHRINK_THRESHOLD:
+            self.limit = max(self.minimum, self.limit - 1)
@@ -2,13 +2,10 @@
 # SPDX-License-Identifier: GPL-2.0
 
 import base64
+import hashlib
 import json
 import os
 
-from Cryptodome.Hash import SHA256
-from Cryptodome.PublicKey import RSA
-from Cryptodome.Signature import PKCS1_v1_5
-
 
 # Environment variables
 CHUNK_SIZE_VAR = 'UHU_CHUNK_SIZE'
@@ -19,6 +16,23 @@ ACCESS_ID_VAR = 'UHU_ACCESS_ID'
 ACCESS_SECRET_VAR = 'UHU_ACCESS_SECRET'
 PRIVATE_KEY_FN = 'UHU_PRIVATE_KEY'
 CUSTOM_CA_CERTS_VAR = 'UHU_CUSTOM_CA_CERTS'
+OBJECT_STORE_VAR = 'UHU_OBJECT_STORE'
+HTTP_POOL_SIZE_VAR = 'UHU_HTTP_POOL_SIZE'
+UPLOAD_WORKERS_VAR = 'UHU_UPLOAD_WORKERS'
+PUSH_JOURNAL_DIR_VAR = 'UHU_PUSH_JOURNAL_DIR'
+UPLOAD_PART_SIZE_VAR = 'UHU_UPLOAD_PART_SIZE'
+UPLOAD_PART_WORKERS_VAR = 'UHU_UPLOAD_PART_WORKERS'
+UPLOAD_PART_RETRIES_VAR = 'UHU_UPLOAD_PART_RETRIES'
+RETRY_MAX_ATTEMPTS_VAR = 'UHU_RETRY_MAX_ATTEMPTS'
+RETRY_BASE_DELAY_VAR = 'UHU_RETRY_BASE_DELAY'
+RETRY_MAX_DELAY_VAR = 'UHU_RETRY_MAX_DELAY'
+RETRY_DEADLINE_VAR = 'UHU_RETRY_DEADLINE'
+UPLOAD_RATE_LIMIT_VAR = 'UHU_UPLOAD_RATE_LIMIT'
+UPLOAD_ADAPTIVE_VAR = 'UHU_UPLOAD_ADAPTIVE'
+KNOWN_OBJECTS_CACHE_VAR = 'UHU_KNOWN_OBJECTS_CACHE'
+KNOWN_OBJECTS_TTL_VAR = 'UHU_KNOWN_OBJECTS_TTL'
+METADATA_ENCODING_VAR = 'UHU_METADATA_ENCODING'
+UPLOAD_SENDFILE_VAR = 'UHU_UPLOAD_SENDFILE'
 
 
 # Default values
@@ -26,6 +40,20 @@ DEFAULT_CHUNK_SIZE = 1024 * 128  # 128 KiB
 DEFAULT_GLOBAL_CONFIG_FILE = os.path.expanduser('~/.config/.uhu')
 DEFAULT_LOCAL_CONFIG_FILE = '.uhu'
 DEFAULT_SERVER_URL = 'http://0.0.0.0'  # TODO: replace by the right URL
+DEFAULT_HTTP_POOL_SIZE = 10
+DEFAULT_UPLOAD_WORKERS = 4
+DEFAULT_PUSH_JOURNAL_DIR = os.path.expanduser('~/.cache/uhu/push')
+DEFAULT_UPLOAD_PART_SIZE = 1024 * 1024 * 16  # 16 MiB
+DEFAULT_UPLOAD_PART_WORKERS = 4
+DEFAULT_UPLOAD_PART_RETRIES = 3
+DEFAULT_RETRY_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_BASE_DELAY = 0.5  # seconds
+DEFAULT_RETRY_MAX_DELAY = 30  # seconds
+DEFAULT_RETRY_DEADLINE = 300  # seconds
+DEFAULT_KNOWN_OBJECTS_CACHE = os.path.expanduser(
+    '~/.cache/uhu/known-objects.json')
+DEFAULT_KNOWN_OBJECTS_TTL = 0  # seconds, disabled
+DEFAULT_METADATA_ENCODING = 'auto'
 
 
 def get_chunk_size():
@@ -61,6 +89,94 @@ def get_custom_ca_certs_file():
     return os.environ.get(CUSTOM_CA_CERTS_VAR, None)
 
 
+def get_http_pool_size():
+    return int(os.environ.get(HTTP_POOL_SIZE_VAR, DEFAULT_HTTP_POOL_SIZE))
+
+
+def get_upload_workers():
+    return int(os.environ.get(UPLOAD_WORKERS_VAR, DEFAULT_UPLOAD_WORKERS))
+
+
+def get_upload_part_size():
+    return int(os.environ.get(UPLOAD_PART_SIZE_VAR, DEFAULT_UPLOAD_PART_SIZE))
+
+
+def get_upload_part_workers():
+    return int(os.environ.get(
+        UPLOAD_PART_WORKERS_VAR, DEFAULT_UPLOAD_PART_WORKERS))
+
+
+def get_upload_part_retries():
+    return int(os.environ.get(
+        UPLOAD_PART_RETRIES_VAR, DEFAULT_UPLOAD_PART_RETRIES))
+
+
+def get_retry_max_attempts():
+    return int(os.environ.get(
+        RETRY_MAX_ATTEMPTS_VAR, DEFAULT_RETRY_MAX_ATTEMPTS))
+
+
+def get_retry_base_delay():
+    return float(os.environ.get(
+        RETRY_BASE_DELAY_VAR, DEFAULT_RETRY_BASE_DELAY))
+
+
+def get_retry_max_delay():
+    return float(os.environ.get(RETRY_MAX_DELAY_VAR, DEFAULT_RETRY_MAX_DELAY))
+
+
+def get_retry_deadline():
+    return float(os.environ.get(RETRY_DEADLINE_VAR, DEFAULT_RETRY_DEADLINE))
+
+
+def get_upload_rate_limit():
+    """Returns the upload rate limit in bytes per second or None."""
+    limit = int(os.environ.get(UPLOAD_RATE_LIMIT_VAR, 0))
+    return limit if limit > 0 else None
+
+
+def get_upload_adaptive():
+    value = os.environ.get(UPLOAD_ADAPTIVE_VAR, '')
+    return value.lower() in ('1', 'yes', 'true', 'on')
+
+
+def get_known_objects_cache_file():
+    return os.environ.get(KNOWN_OBJECTS_CACHE_VAR, DEFAULT_KNOWN_OBJECTS_CACHE)
+
+
+def get_known_objects_ttl():
+    """Returns for how long objects are known.
+
+    The cache is disabled (0) unless enabled by configuration.
+    """
+    return float(os.environ.get(
+        KNOWN_OBJECTS_TTL_VAR, DEFAULT_KNOWN_OBJECTS_TTL))
+
+
+def get_metadata_encoding():
+    """Returns how metadata uploads are encoded.
+
+    It is "auto" (the best encoding supported by server), "identity"
+    (not compressed) or a content encoding, like "gzip".
+    """
+    return os.environ.get(
+        METADATA_ENCODING_VAR, DEFAULT_METADATA_ENCODING).lower()
+
+
+def get_upload_sendfile():
+    """Checks if objects may be uploaded with sendfile (on by default)."""
+    value = os.environ.get(UPLOAD_SENDFILE_VAR, '')
+    return value.lower() not in ('0', 'no', 'false', 'off')
+
+
+def get_push_journal_dir():
+    return os.environ.get(PUSH_JOURNAL_DIR_VAR, DEFAULT_PUSH_JOURNAL_DIR)
+
+
+def get_object_store_dir():
+    return os.environ.get(OBJECT_STORE_VAR, None)
+
+
 def remove_local_config():
     os.remove(get_local_config_file())
 
@@ -70,6 +186,38 @@ def call(obj, name, *args, **kw):
     func(*args, **kw)
 
 
+def _ignore_progress(nbytes):  # pylint: disable=unused-argument
+    pass
+
+
+def get_progress_reporter(callback):
+    """Returns the function that reports progress (in bytes) to callback.
+
+    It is looked up once, so it can be cheaply called for every chunk.
+    """
+    return getattr(callback, 'progress', _ignore_progress)
+
+
+def file_md5(filename, offset=0, size=None):
+    """Returns the MD5 of size bytes of a file, starting at offset.
+
+    If size is None, the file is read until its end.
+    """
+    md5 = hashlib.md5()
+    if size is None:
+        size = os.path.getsize(filename) - offset
+    buffer = memoryview(bytearray(get_chunk_size()))
+    with open(filename, 'br') as fp:
+        fp.seek(offset)
+        while size > 0:
+            read = fp.readinto(buffer[:min(len(buffer), size)])
+            if not read:
+                break
+            md5.update(buffer[:read])
+            size -= read
+    return md5.hexdigest()
+
+
 def indent(value, n_indents, all_lines=False):
     """Indent a multline string to right by n_indents.
 
@@ -105,6 +253,9 @@ def list_to_str(title, lst):
 
 def sign_dict(dict_, private_key):
     """Serializes a dict to JSON and sign it using RSA."""
+    from Cryptodome.Hash import SHA256
+    from Cryptodome.PublicKey import RSA
+    from Cryptodome.Signature import PKCS1_v1_5
     try:
         with open(private_key) as fp:
             key = RSA.importKey(fp.read())